@@ -0,0 +1,86 @@
+"""Benchmark order placement one request per order versus batch requests
+
+Places the same orders against a fresh catalog through /api/orders/complete,
+once per order, and through /api/orders/complete/batch in batches, using
+the Flask test client so only the application's own work is measured.
+
+Usage:
+    python benchmarks/bench_batch_orders.py [--books 1000] [--orders 500] [--batch 500] [--backend json]
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.api.app import create_app
+from src.api.auth import VALID_API_KEYS
+from src.models.book import Book
+
+
+def make_orders(books: int, orders: int, seed: int = 7) -> list:
+    """Orders of one to three random books each"""
+    rng = random.Random(seed)
+    return [{
+        'customer_name': f'Customer {i}',
+        'customer_email': f'customer{i}@example.com',
+        'items': [{'book_id': f'book-{rng.randrange(books)}', 'quantity': rng.randint(1, 3)}
+                  for _ in range(rng.randint(1, 3))],
+        'shipping_address': f'{i} Main St'
+    } for i in range(orders)]
+
+
+def run(backend: str, books: int, orders: list, batch: int) -> float:
+    """Place the orders and return orders per second; batch 0 sends them one by one"""
+    with tempfile.TemporaryDirectory() as data_dir:
+        app = create_app(config={'DATA_DIR': data_dir, 'STORAGE_BACKEND': backend})
+        inventory = app.extensions['services']['inventory']
+        for i in range(books):
+            inventory.books[f'book-{i}'] = Book(
+                id=f'book-{i}', title=f'Title {i}', author='Author', isbn=str(i),
+                price=10.0, stock_quantity=1_000_000
+            )
+        inventory._save_data()
+        inventory._load_data()
+        client = app.test_client()
+        headers = {'X-API-Key': next(iter(VALID_API_KEYS))}
+
+        start = time.perf_counter()
+        if batch:
+            for i in range(0, len(orders), batch):
+                response = client.post('/api/orders/complete/batch', headers=headers,
+                                       json={'orders': orders[i:i + batch]})
+                assert response.status_code == 201, response.get_json()
+        else:
+            for order in orders:
+                response = client.post('/api/orders/complete', headers=headers, json=order)
+                assert response.status_code == 201, response.get_json()
+        elapsed = time.perf_counter() - start
+        for service in app.extensions['services'].values():
+            service.flush()
+            service.repository.close()
+    return len(orders) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=500)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--backend', default='json')
+    args = parser.parse_args()
+
+    orders = make_orders(args.books, args.orders)
+    print(f'{args.orders} orders over {args.books} books, {args.backend} backend')
+    single = run(args.backend, args.books, orders, 0)
+    batched = run(args.backend, args.books, orders, args.batch)
+    print(f'one per request: {single:10.0f} orders/s   '
+          f'batches of {args.batch}: {batched:10.0f} orders/s   ({batched / single:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
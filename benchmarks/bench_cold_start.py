@@ -0,0 +1,69 @@
+"""Benchmark cold start from a JSON snapshot versus a binary snapshot
+
+Both runs boot a journaled SalesService from a snapshot of the same orders
+with an empty journal, so the time is spent loading the snapshot.
+
+Usage:
+    python benchmarks/bench_cold_start.py [--orders 100000] [--repeat 3]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.models.order import Order, OrderItem
+from src.services.sales_service import SalesService
+
+
+def seed_orders(data_file: str, count: int, snapshot_format: str):
+    """Write ``count`` orders and fold them into a snapshot of the given format"""
+    service = SalesService(data_file, 'journal', durability='none',
+                           compact_every=None, snapshot_format=snapshot_format)
+    for i in range(count):
+        service.orders[f'order-{i}'] = Order(
+            id=f'order-{i}', customer_name=f'Customer {i % 500}',
+            customer_email=f'c{i % 500}@example.com',
+            items=[OrderItem(f'book-{j:03d}', f'Title {j}', 1, 10.0, 10.0) for j in range(i % 3 + 1)],
+            total_amount=10.0 * (i % 3 + 1), status='pending', payment_status='pending',
+            created_at=datetime.now().isoformat()
+        )
+    service.repository.compactor.compact(service.orders, Order.from_dict, wait=True)
+
+
+def boot(data_file: str, snapshot_format: str, repeat: int) -> float:
+    """Return the best time in seconds to boot the service"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        service = SalesService(data_file, 'journal', snapshot_format=snapshot_format)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        del service
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f'{args.orders} orders, best of {args.repeat}')
+    print(f'{"format":8} {"size MB":>9} {"boot s":>9}')
+    for snapshot_format in ('json', 'binary'):
+        with tempfile.TemporaryDirectory() as data_dir:
+            data_file = str(Path(data_dir) / 'orders.json')
+            seed_orders(data_file, args.orders, snapshot_format)
+            snapshot = data_file if snapshot_format == 'json' else str(Path(data_file).with_suffix('.snap'))
+            size = os.path.getsize(snapshot) / 1e6
+            print(f'{snapshot_format:8} {size:9.1f} {boot(data_file, snapshot_format, args.repeat):9.2f}')
+
+
+if __name__ == '__main__':
+    main()
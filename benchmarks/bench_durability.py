@@ -0,0 +1,87 @@
+"""Benchmark throughput and latency of each durability level
+
+Each run starts from a data set of existing orders and has several threads
+update order statuses, each waiting until its change is persisted. The
+fsync-per-group level is measured with group commit enabled, since that is
+where one fsync covers many changes.
+
+Usage:
+    python benchmarks/bench_durability.py [--orders 1000] [--threads 4] [--ops 50]
+"""
+
+import argparse
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.models.order import Order, OrderItem
+from src.services.sales_service import SalesService
+from src.storage.durability import FSYNC_PER_GROUP, LEVELS
+
+
+def seed_orders(data_file: str, count: int):
+    """Write ``count`` orders to the data file in one save"""
+    service = SalesService(data_file, 'json', durability='none')
+    for i in range(count):
+        service.orders[f'order-{i}'] = Order(
+            id=f'order-{i}', customer_name=f'Customer {i}', customer_email=f'c{i}@example.com',
+            items=[OrderItem('book-001', 'Title', 1, 10.0, 10.0)], total_amount=10.0,
+            status='pending', payment_status='pending', created_at=datetime.now().isoformat()
+        )
+    service._save_data()
+
+
+def run(backend: str, durability: str, orders: int, threads: int, ops: int) -> tuple:
+    """Run the workload and return (writes per second, p50 ms, p99 ms)"""
+    with tempfile.TemporaryDirectory() as data_dir:
+        data_file = str(Path(data_dir) / 'orders.json')
+        seed_orders(data_file, orders)
+        service = SalesService(data_file, backend, durability=durability,
+                               group_commit=durability == FSYNC_PER_GROUP)
+        latencies = []
+
+        def worker(worker_id: int):
+            for i in range(ops):
+                start = time.perf_counter()
+                service.update_order_status(f'order-{(worker_id * ops + i) % orders}', 'processing')
+                service.commit_future().result()
+                latencies.append(time.perf_counter() - start)
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        service.repository.close()
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return len(latencies) / elapsed, statistics.median(latencies) * 1000, p99 * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--ops', type=int, default=50)
+    parser.add_argument('--backends', default='json,journal,sqlite')
+    args = parser.parse_args()
+
+    print(f'{args.orders} orders, {args.threads} threads x {args.ops} status updates')
+    print(f'{"backend":8} {"durability":18} {"writes/s":>10} {"p50 ms":>9} {"p99 ms":>9}')
+    for backend in args.backends.split(','):
+        for durability in LEVELS:
+            throughput, p50, p99 = run(backend, durability, args.orders, args.threads, args.ops)
+            print(f'{backend:8} {durability:18} {throughput:10.0f} {p50:9.2f} {p99:9.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark write throughput with and without group commit
+
+Simulates request threads reserving stock concurrently against a catalog
+of a few thousand books. With --wait every write blocks on its commit
+future, as /api/orders/complete does; without it the writers only wait for
+a final flush.
+
+Usage:
+    python benchmarks/bench_group_commit.py [--books 5000] [--threads 16] [--ops 100] [--wait]
+"""
+
+import argparse
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.models.book import Book
+from src.services.inventory_service import InventoryService
+
+
+def run(backend: str, group_commit: bool, books: int, threads: int, ops: int,
+        wait: bool) -> float:
+    """Run the workload and return writes per second"""
+    with tempfile.TemporaryDirectory() as data_dir:
+        service = InventoryService(str(Path(data_dir) / 'books.json'), backend,
+                                   group_commit=group_commit)
+        for i in range(books):
+            service.books[f'book-{i}'] = Book(
+                id=f'book-{i}', title=f'Title {i}', author='Author', isbn=str(i),
+                price=10.0, stock_quantity=1_000_000
+            )
+        service._save_data()
+        service.flush()
+
+        def worker(worker_id: int):
+            for i in range(ops):
+                service.reserve_stock(f'book-{(worker_id * ops + i) % books}', 1)
+                if wait:
+                    service.commit_future().result()
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        service.flush()
+        elapsed = time.perf_counter() - start
+        service.repository.close()
+    return threads * ops / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--ops', type=int, default=100)
+    parser.add_argument('--wait', action='store_true', help='wait for every commit future')
+    args = parser.parse_args()
+
+    print(f'{args.books} books, {args.threads} threads x {args.ops} reservations'
+          f'{", waiting on every commit" if args.wait else ""}')
+    for backend in ('json', 'journal'):
+        baseline = run(backend, False, args.books, args.threads, args.ops, args.wait)
+        grouped = run(backend, True, args.books, args.threads, args.ops, args.wait)
+        print(f'{backend:8} per-write: {baseline:10.0f} writes/s   '
+              f'group commit: {grouped:10.0f} writes/s   ({grouped / baseline:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
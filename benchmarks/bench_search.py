@@ -0,0 +1,96 @@
+"""Benchmark catalog search latency against a large synthetic catalog
+
+Titles, authors and descriptions are drawn from a fixed vocabulary with a
+skewed word frequency, so queries range from rare words to words shared by
+a large part of the catalog. Category words, each shared by an eighth of
+the catalog, and prefixes of one or two letters are timed as well.
+
+Usage:
+    python benchmarks/bench_search.py [--books 1000000] [--queries 1000]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.services.search import SearchIndex
+
+CATEGORIES = ['Fiction', 'History', 'Science', 'Travel', 'Cooking', 'Poetry', 'Business', 'Art']
+
+
+def make_words(count: int, rng: random.Random) -> list:
+    """Distinct pseudo-words of 4 to 10 letters"""
+    words = set()
+    while len(words) < count:
+        words.add(''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(4, 10))))
+    return sorted(words)
+
+
+def make_books(count: int, words: list, rng: random.Random):
+    """Yield books whose words follow a Zipf-like distribution"""
+    for i in range(count):
+        # A log-uniform rank gives the word of rank r a frequency of about 1/r
+        picked = [words[int(len(words) ** rng.random()) - 1] for _ in range(12)]
+        yield SimpleNamespace(
+            id=f'book-{i}', title=' '.join(picked[:4]), author=' '.join(picked[4:6]).title(),
+            description=' '.join(picked[6:]), category=CATEGORIES[i % len(CATEGORIES)]
+        )
+
+
+def time_queries(index: SearchIndex, queries: list) -> list:
+    """Latency of each query in milliseconds, sorted"""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--vocabulary', type=int, default=200000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    words = make_words(args.vocabulary, rng)
+    index = SearchIndex()
+    start = time.perf_counter()
+    index.rebuild(make_books(args.books, words, rng))
+    print(f'{args.books} books indexed in {time.perf_counter() - start:.1f}s')
+
+    # Words are ranked by their position in the vocabulary: the first ones
+    # are shared by a large part of the catalog, the rest grow rarer
+    common = words[:100]
+    rare = words[len(words) // 10:]
+    categories = [category.lower() for category in CATEGORIES]
+    shapes = {
+        'one word': lambda: rng.choice(rare),
+        'two words': lambda: f'{rng.choice(rare)} {rng.choice(rare)}',
+        'prefix': lambda: rng.choice(rare)[:4],
+        'word + prefix': lambda: f'{rng.choice(rare)} {rng.choice(rare)[:3]}',
+        'common word': lambda: rng.choice(common),
+        'two common': lambda: f'{rng.choice(common)} {rng.choice(common)}',
+        'common + rare': lambda: f'{rng.choice(common)} {rng.choice(rare)}',
+        'category': lambda: rng.choice(categories),
+        'two categories': lambda: ' '.join(rng.sample(categories, 2)),
+        'category + word': lambda: f'{rng.choice(categories)} {rng.choice(words)}',
+        '1-2 char prefix': lambda: rng.choice(words)[:rng.randint(1, 2)],
+    }
+    print(f'{"query":16} {"p50 ms":>8} {"p99 ms":>8} {"max ms":>8}')
+    for name, make_query in shapes.items():
+        latencies = time_queries(index, [make_query() for _ in range(args.queries)])
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[int(len(latencies) * 0.99)]
+        print(f'{name:16} {p50:8.3f} {p99:8.3f} {latencies[-1]:8.3f}')
+
+
+if __name__ == '__main__':
+    main()
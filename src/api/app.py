@@ -1,5 +1,6 @@
 """Main Flask Application"""
 
+import os
 import sys
 from pathlib import Path
 
@@ -10,23 +11,106 @@ sys.path.insert(0, str(project_root))
 from flask import Flask, jsonify
 from flask_cors import CORS
 from flasgger import Swagger
+from src.api.compression import init_compression
+from src.api.routes import inventory, sales, delivery, integration
 from src.api.routes.inventory import inventory_bp
 from src.api.routes.sales import sales_bp
 from src.api.routes.delivery import delivery_bp
 from src.api.routes.integration import integration_bp
+from src.services.inventory_service import InventoryService
+from src.services.sales_service import SalesService
+from src.services.delivery_service import DeliveryService
 
 
-def create_app(debug=False):
+def init_services(app):
+    """Create the services for the configured storage backend
+    
+    A single instance of each service is shared by every blueprint, so the
+    inventory, sales and delivery routes all see the same in-memory state.
+    """
+    backend = app.config['STORAGE_BACKEND']
+    data_dir = Path(app.config['DATA_DIR'])
+    options = {}
+    if backend == 'sqlite' and app.config.get('SQLITE_DATABASE'):
+        options['database'] = app.config['SQLITE_DATABASE']
+    if backend == 'journal':
+        options['snapshot_format'] = app.config['SNAPSHOT_FORMAT']
+    if app.config['GROUP_COMMIT']:
+        options['group_commit'] = True
+        options['commit_interval'] = app.config['GROUP_COMMIT_INTERVAL']
+        options['commit_batch'] = app.config['GROUP_COMMIT_BATCH']
+    
+    def durability(service):
+        """Durability level of a service, falling back to the global setting"""
+        return app.config.get(f'DURABILITY_{service.upper()}') or app.config['DURABILITY']
+    
+    def archive_options(table):
+        """Archive settings of a service, empty if archiving is disabled"""
+        if not app.config['ARCHIVE_DIR']:
+            return {}
+        return {'archive_dir': str(Path(app.config['ARCHIVE_DIR']) / table),
+                'archive_batch': app.config['ARCHIVE_BATCH']}
+    
+    inventory_service = InventoryService(str(data_dir / 'books.json'), backend,
+                                         durability=durability('inventory'), **options)
+    sales_service = SalesService(str(data_dir / 'orders.json'), backend,
+                                 durability=durability('sales'), shards=app.config['SHARDS'],
+                                 **archive_options('orders'), **options)
+    delivery_service = DeliveryService(str(data_dir / 'deliveries.json'), backend,
+                                       durability=durability('delivery'), shards=app.config['SHARDS'],
+                                       **archive_options('deliveries'), **options)
+    
+    inventory.inventory_service = inventory_service
+    sales.sales_service = sales_service
+    delivery.delivery_service = delivery_service
+    integration.inventory_service = inventory_service
+    integration.sales_service = sales_service
+    integration.delivery_service = delivery_service
+    
+    app.extensions['services'] = {
+        'inventory': inventory_service,
+        'sales': sales_service,
+        'delivery': delivery_service
+    }
+
+
+def create_app(debug=False, config=None):
     """Create and configure Flask application
     
     Args:
         debug: Enable debug mode (default: False for production)
+        config: Optional settings overriding the defaults, e.g.
+            ``{'STORAGE_BACKEND': 'sqlite'}``
     """
     app = Flask(__name__)
     app.config['DEBUG'] = debug
     
+    # Storage settings (json, journal, sqlite or jsonl, optionally with group commit)
+    app.config['STORAGE_BACKEND'] = os.getenv('STORAGE_BACKEND', 'json')
+    app.config['DATA_DIR'] = os.getenv('DATA_DIR', 'data')
+    app.config['SQLITE_DATABASE'] = os.getenv('SQLITE_DATABASE')
+    app.config['SNAPSHOT_FORMAT'] = os.getenv('SNAPSHOT_FORMAT', 'json')
+    app.config['DURABILITY'] = os.getenv('DURABILITY', 'os-buffered')
+    for service in ('INVENTORY', 'SALES', 'DELIVERY'):
+        app.config[f'DURABILITY_{service}'] = os.getenv(f'DURABILITY_{service}')
+    app.config['GROUP_COMMIT'] = os.getenv('GROUP_COMMIT', '').lower() in ('1', 'true', 'yes')
+    app.config['GROUP_COMMIT_INTERVAL'] = float(os.getenv('GROUP_COMMIT_INTERVAL', '0.05'))
+    app.config['GROUP_COMMIT_BATCH'] = int(os.getenv('GROUP_COMMIT_BATCH', '100'))
+    app.config['SHARDS'] = int(os.getenv('SHARDS', '1'))
+    app.config['ARCHIVE_DIR'] = os.getenv('ARCHIVE_DIR')
+    app.config['ARCHIVE_BATCH'] = int(os.getenv('ARCHIVE_BATCH', '100'))
+    
+    # Response compression (gzip for clients accepting it)
+    app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+    app.config['COMPRESS_LEVEL'] = int(os.getenv('COMPRESS_LEVEL', '6'))
+    app.config['COMPRESS_CACHE_SIZE'] = int(os.getenv('COMPRESS_CACHE_SIZE', '32'))
+    if config:
+        app.config.update(config)
+    init_services(app)
+    
     # Enable CORS
     CORS(app)
+    init_compression(app)
     
     # Register blueprints
     app.register_blueprint(inventory_bp, url_prefix='/api/inventory')
@@ -96,10 +180,18 @@ def create_app(debug=False):
     @app.route('/health', methods=['GET'])
     def health_check():
         """Health check endpoint"""
+        services = app.extensions['services']
         return jsonify({
             'status': 'healthy',
             'service': 'Bookstore Management System API',
-            'version': '1.0.0'
+            'version': '1.0.0',
+            'storage': {
+                'backend': app.config['STORAGE_BACKEND'],
+                'cache': {
+                    'sales': services['sales'].get_cache_stats(),
+                    'delivery': services['delivery'].get_cache_stats()
+                }
+            }
         }), 200
     
     # Root endpoint
@@ -0,0 +1,99 @@
+"""Gzip compression of large responses
+
+A response is compressed when the client accepts gzip and its body is at
+least ``COMPRESS_MIN_SIZE`` bytes. The compressed bodies of hot listings
+are also cached by ETag: since the ETag is made of the collection version,
+a write to the collection moves the listing to a new ETag and the cached
+body is never served again. A hit answers the request before the view
+runs its query or builds any JSON.
+"""
+
+import gzip
+import threading
+from collections import OrderedDict
+from typing import Optional
+from flask import Response, current_app, g, request
+
+# Media types worth compressing; images and archives already are
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'text/html', 'text/css',
+                      'text/plain', 'application/x-ndjson')
+
+
+class CompressedCache:
+    """Compressed response bodies by ETag, least recently used dropped first"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._bodies = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, etag: str) -> Optional[bytes]:
+        """Compressed body cached under ``etag``, None if there is none; marks it recently used"""
+        with self._lock:
+            body = self._bodies.get(etag)
+            if body is not None:
+                self._bodies.move_to_end(etag)
+            return body
+
+    def put(self, etag: str, body: bytes):
+        """Cache a compressed body under ``etag``, dropping the least recently used beyond ``size``"""
+        with self._lock:
+            self._bodies[etag] = body
+            self._bodies.move_to_end(etag)
+            while len(self._bodies) > self.size:
+                self._bodies.popitem(last=False)
+
+
+def accepts_gzip() -> bool:
+    """Whether the client's Accept-Encoding allows a gzip response"""
+    return request.accept_encodings['gzip'] > 0
+
+
+def cached_response(etag: str) -> Optional[Response]:
+    """Serve the cached compressed body of ``etag``, if the client takes gzip
+
+    Also marks the response about to be built as cacheable under ``etag``.
+    """
+    cache = current_app.extensions.get('compressed_cache')
+    if cache is None or not accepts_gzip():
+        return None
+    body = cache.get(etag)
+    if body is None:
+        g.compressed_cache_etag = etag
+        return None
+    response = Response(body, mimetype='application/json')
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_compression(app):
+    """Compress the responses of ``app`` as configured by its COMPRESS_* settings"""
+    min_size = app.config['COMPRESS_MIN_SIZE']
+    level = app.config['COMPRESS_LEVEL']
+    app.extensions['compressed_cache'] = CompressedCache(app.config['COMPRESS_CACHE_SIZE'])
+
+    @app.after_request
+    def compress(response):
+        if (response.status_code < 200 or response.status_code in (204, 304)
+                or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+        body = response.get_data()
+        if len(body) < min_size:
+            return response
+        response.vary.add('Accept-Encoding')
+        if not accepts_gzip():
+            return response
+        # Without a timestamp the same body always compresses to the same bytes
+        response.set_data(gzip.compress(body, compresslevel=level, mtime=0))
+        response.headers['Content-Encoding'] = 'gzip'
+        etag, weak = response.get_etag()
+        if etag:
+            # The compressed bytes differ from the identity encoding
+            response.set_etag(etag, weak=True)
+        cache_etag = g.pop('compressed_cache_etag', None)
+        if cache_etag is not None and cache_etag == etag and response.status_code == 200:
+            app.extensions['compressed_cache'].put(etag, response.get_data())
+        return response
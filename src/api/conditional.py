@@ -0,0 +1,61 @@
+"""Conditional GETs with ETags built from record contents and collection versions
+
+The ETag of a response is derived from what it shows, so it can be checked
+against ``If-None-Match`` before the response is built: a hash of the
+content of each record shown, or for listings the version of the whole
+collection. The query string is folded in, since ``?fields=`` and
+``?expand=`` change the representation of the same records.
+"""
+
+import hashlib
+import json
+import uuid
+import zlib
+from typing import Any, Callable, Optional
+from flask import Response, make_response, request
+from src.api.compression import cached_response
+
+# Collection versions are counted by each process on its own, so list ETags
+# also carry this token to never match a listing of another process
+PROCESS_TAG = uuid.uuid4().hex[:8]
+
+
+def make_etag(*parts: Any) -> str:
+    """ETag (unquoted) of a response showing the given versioned parts"""
+    tag = '-'.join(str(part) for part in parts)
+    if request.query_string:
+        tag += f'.{zlib.crc32(request.query_string):08x}'
+    return tag
+
+
+def content_tag(record: Optional[Any]) -> str:
+    """Hash of a record's content, the same in every process holding the same record"""
+    if record is None:
+        return 'none'
+    data = json.dumps(record.to_dict(), sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(data.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def conditional(etag: str, build: Callable[[], Any], cache: bool = False) -> Response:
+    """Answer 304 Not Modified if the client already holds ``etag``, else build the response
+
+    Args:
+        etag: ETag of the current representation, from ``make_etag``
+        build: Returns the full response, as a view function would; only
+            called when the client's copy is stale and, with ``cache``, no
+            compressed body is cached, so it is where the query belongs.
+            An error it returns gets no ETag
+        cache: Keep the compressed body under ``etag``, for hot listings
+    """
+    weak = False
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    elif cache and (cached := cached_response(etag)) is not None:
+        response = cached
+        weak = True  # Like every gzip encoded response
+    else:
+        response = make_response(build())
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag, weak=weak)
+    return response
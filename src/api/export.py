@@ -0,0 +1,46 @@
+"""Streaming exports as newline-delimited JSON
+
+Export endpoints send one record per line, written while the records are
+read from storage. A response never holds more than a chunk of lines, so
+it takes the same memory however large the table is.
+"""
+
+import json
+from datetime import datetime
+from typing import Iterable, Optional
+from flask import Response, request
+
+# Lines written to the response at a time
+LINES_PER_CHUNK = 500
+
+
+def since_arg() -> Optional[datetime]:
+    """Read the ``since`` query parameter, an ISO 8601 date or time
+
+    Raises:
+        ValueError: If since is not a date or time
+    """
+    value = request.args.get('since')
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError('since must be an ISO 8601 date or time, e.g. 2024-03-01T12:00:00') from None
+
+
+def ndjson_response(records: Iterable[dict], filename: str) -> Response:
+    """Stream ``records`` as an NDJSON attachment, consuming them as it is sent"""
+    def lines():
+        chunk = []
+        for record in records:
+            chunk.append(json.dumps(record, separators=(',', ':')))
+            if len(chunk) == LINES_PER_CHUNK:
+                yield '\n'.join(chunk) + '\n'
+                chunk = []
+        if chunk:
+            yield '\n'.join(chunk) + '\n'
+
+    response = Response(lines(), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
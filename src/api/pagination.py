@@ -0,0 +1,42 @@
+"""Query parameters of paginated list endpoints"""
+
+from typing import Optional, Tuple
+from flask import request
+from src.services.pagination import decode_cursor
+
+# Largest page a client can ask for
+MAX_PAGE_SIZE = 100
+
+
+def page_args(default: Optional[int] = None) -> Tuple[Optional[int], Optional[str]]:
+    """Read the ``limit`` and ``cursor`` query parameters
+
+    Args:
+        default: Page size when no limit is given; without one the endpoint
+            returns the full list
+
+    Returns:
+        (page size, cursor); the page size is None when no limit is given
+        and there is no default
+
+    Raises:
+        ValueError: If limit is not between 1 and MAX_PAGE_SIZE, or a cursor
+            is malformed or given without a limit or default
+    """
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor') or None
+    if cursor:
+        decode_cursor(cursor)
+    if limit is None:
+        if default is not None:
+            return default, cursor
+        if cursor:
+            raise ValueError('cursor can only be used together with limit')
+        return None, None
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValueError('limit must be an integer') from None
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    return limit, cursor
@@ -0,0 +1,53 @@
+"""Query parameters selecting what read endpoints return
+
+``?fields=id,title,price`` limits each returned record to the listed
+fields, which are the only ones serialized. ``?expand=delivery`` names the
+nested objects to embed; the others are neither looked up nor serialized.
+"""
+
+from dataclasses import fields as dataclass_fields
+from typing import FrozenSet, Iterable, Optional, Tuple, Union
+from flask import request
+
+
+def _names(param: str) -> Optional[Tuple[str, ...]]:
+    """Comma separated names of a query parameter, None if it is absent"""
+    value = request.args.get(param)
+    if value is None:
+        return None
+    return tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+
+
+def fields_arg(model: Union[type, Iterable[str]]) -> Optional[Tuple[str, ...]]:
+    """Read ``?fields=`` for records of a dataclass model, or for the given field names
+
+    Returns:
+        The requested fields, or None to return every field
+
+    Raises:
+        ValueError: If a requested field is not a field of the model
+    """
+    names = _names('fields')
+    if names is None:
+        return None
+    known = [field.name for field in dataclass_fields(model)] if isinstance(model, type) else list(model)
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}; available: {", ".join(known)}')
+    return names
+
+
+def expand_arg(allowed: Iterable[str]) -> FrozenSet[str]:
+    """Read ``?expand=``; without it every nested object is expanded
+
+    Raises:
+        ValueError: If a requested object is not one of ``allowed``
+    """
+    allowed = tuple(allowed)
+    names = _names('expand')
+    if names is None:
+        return frozenset(allowed)
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise ValueError(f'Cannot expand: {", ".join(unknown)}; available: {", ".join(allowed)}')
+    return frozenset(names)
@@ -2,12 +2,156 @@
 
 from flask import Blueprint, jsonify, request
 from src.api.auth import require_api_key
+from src.api.conditional import PROCESS_TAG, conditional, content_tag, make_etag
+from src.api.export import ndjson_response, since_arg
+from src.api.pagination import page_args
+from src.api.projection import fields_arg
+from src.models.delivery import Delivery
 from src.services.delivery_service import DeliveryService
 
 delivery_bp = Blueprint('delivery', __name__)
 delivery_service = DeliveryService()
 
 
+@delivery_bp.route('/deliveries', methods=['GET'])
+@require_api_key
+def get_deliveries():
+    """
+    Get all deliveries, optionally only those in one status
+    ---
+    tags:
+      - Delivery
+    parameters:
+      - in: query
+        name: status
+        schema:
+          type: string
+          enum: [pending, preparing, shipped, in_transit, delivered, failed]
+        description: Only deliveries in this status
+      - in: query
+        name: limit
+        schema:
+          type: integer
+        description: Page size (1-100); without it the full list is returned
+      - in: query
+        name: cursor
+        schema:
+          type: string
+        description: next_cursor of the previous page
+      - in: query
+        name: fields
+        schema:
+          type: string
+        description: Comma separated fields to return, e.g. id,status,tracking_number
+      - in: header
+        name: X-API-Key
+        required: true
+        schema:
+          type: string
+    responses:
+      200:
+        description: List of deliveries; pages are oldest first, with next_cursor null on the last page
+      304:
+        description: Not modified since the ETag given in If-None-Match
+      400:
+        description: Invalid limit or cursor
+    """
+    # Refreshed and read before the query: a change landing in between makes the
+    # data newer than the ETag (harmless), never the ETag newer than the data
+    version = delivery_service.current_version()
+    status = request.args.get('status')
+    try:
+        fields = fields_arg(Delivery)
+        limit, cursor = page_args()
+    except ValueError as e:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': str(e)
+        }), 400
+    
+    def build():
+        # Only queried when the client's copy is stale
+        if limit is None:
+            deliveries = (delivery_service.get_deliveries_by_status(status) if status
+                          else delivery_service.get_all_deliveries())
+        else:
+            try:
+                deliveries, next_cursor = delivery_service.get_deliveries_page(limit, cursor, status)
+            except ValueError as e:  # Cursor of another listing
+                return jsonify({
+                    'error': 'Invalid request',
+                    'message': str(e)
+                }), 400
+        response = {
+            'deliveries': [delivery.to_dict(fields) for delivery in deliveries],
+            'count': len(deliveries)
+        }
+        if limit is not None:
+            response['next_cursor'] = next_cursor
+        return jsonify(response), 200
+    
+    return conditional(make_etag('deliveries', PROCESS_TAG, version), build)
+
+
+@delivery_bp.route('/deliveries/export', methods=['GET'])
+@require_api_key
+def export_deliveries():
+    """
+    Export every delivery, archived ones included, as newline-delimited JSON
+    ---
+    tags:
+      - Delivery
+    produces:
+      - application/x-ndjson
+    parameters:
+      - in: query
+        name: since
+        schema:
+          type: string
+        description: Only deliveries created or updated at or after this ISO 8601 date or time, for incremental exports
+      - in: header
+        name: X-API-Key
+        required: true
+        schema:
+          type: string
+    responses:
+      200:
+        description: One delivery per line, streamed as it is read from storage
+      400:
+        description: Invalid since
+    """
+    try:
+        since = since_arg()
+    except ValueError as e:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': str(e)
+        }), 400
+    
+    return ndjson_response(delivery_service.export_deliveries(since), 'deliveries.ndjson')
+
+
+@delivery_bp.route('/deliveries/counts', methods=['GET'])
+@require_api_key
+def get_delivery_counts():
+    """
+    Get the number of deliveries in each status
+    ---
+    tags:
+      - Delivery
+    parameters:
+      - in: header
+        name: X-API-Key
+        required: true
+        schema:
+          type: string
+    responses:
+      200:
+        description: Number of deliveries by status
+    """
+    return jsonify({'status': delivery_service.get_status_counts()}), 200
+
+
 @delivery_bp.route('/orders/<order_id>', methods=['POST'])
 @require_api_key
 def create_delivery(order_id):
@@ -62,11 +206,18 @@ def create_delivery(order_id):
             'delivery': existing.to_dict()
         }), 400
     
-    delivery = delivery_service.create_delivery(
-        order_id=order_id,
-        shipping_address=data['shipping_address'],
-        carrier=data.get('carrier')
-    )
+    try:
+        delivery = delivery_service.create_delivery(
+            order_id=order_id,
+            shipping_address=data['shipping_address'],
+            carrier=data.get('carrier')
+        )
+    except ValueError as e:
+        # Another request created the delivery after the check above
+        return jsonify({
+            'error': 'Delivery already exists',
+            'message': str(e)
+        }), 400
     
     return jsonify({
         'message': 'Delivery record created successfully',
@@ -88,6 +239,11 @@ def get_delivery_by_order_id(order_id):
         required: true
         schema:
           type: string
+      - in: query
+        name: fields
+        schema:
+          type: string
+        description: Comma separated fields to return, e.g. id,status,tracking_number
       - in: header
         name: X-API-Key
         required: true
@@ -96,9 +252,19 @@ def get_delivery_by_order_id(order_id):
     responses:
       200:
         description: Delivery details
+      304:
+        description: Not modified since the ETag given in If-None-Match
       404:
         description: Delivery not found
     """
+    try:
+        fields = fields_arg(Delivery)
+    except ValueError as e:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': str(e)
+        }), 400
+    
     delivery = delivery_service.get_delivery_by_order_id(order_id)
     if not delivery:
         return jsonify({
@@ -106,7 +272,8 @@ def get_delivery_by_order_id(order_id):
             'message': f'No delivery found for order ID: {order_id}'
         }), 404
     
-    return jsonify(delivery.to_dict()), 200
+    return conditional(make_etag('delivery', content_tag(delivery)),
+                       lambda: (jsonify(delivery.to_dict(fields)), 200))
 
 
 @delivery_bp.route('/orders/<order_id>/status', methods=['PUT'])
@@ -181,3 +348,28 @@ def update_delivery_status(order_id):
         'delivery': delivery.to_dict()
     }), 200
 
+
+
+@delivery_bp.route('/archive', methods=['POST'])
+@require_api_key
+def archive_deliveries():
+    """
+    Move delivered and failed deliveries to the archive
+    ---
+    tags:
+      - Delivery
+    parameters:
+      - in: header
+        name: X-API-Key
+        required: true
+        schema:
+          type: string
+    responses:
+      200:
+        description: Deliveries archived; archived deliveries stay readable
+    """
+    archived = delivery_service.archive_completed_deliveries()
+    return jsonify({
+        'message': 'Deliveries archived successfully',
+        'archived': archived
+    }), 200
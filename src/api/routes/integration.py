@@ -2,6 +2,8 @@
 
 from flask import Blueprint, jsonify, request
 from src.api.auth import require_api_key
+from src.api.conditional import conditional, content_tag, make_etag
+from src.api.projection import expand_arg, fields_arg
 from src.services.inventory_service import InventoryService
 from src.services.sales_service import SalesService
 from src.services.delivery_service import DeliveryService
@@ -11,6 +13,16 @@ inventory_service = InventoryService()
 sales_service = SalesService()
 delivery_service = DeliveryService()
 
+# Most orders accepted by one batch request
+MAX_BATCH_SIZE = 5000
+
+# Most orders accepted by one status lookup
+MAX_LOOKUP_SIZE = 1000
+
+# Top-level fields of the complete order status
+ORDER_STATUS_FIELDS = ('order_id', 'order_status', 'payment_status', 'payment_id', 'customer',
+                       'items', 'total_amount', 'created_at', 'updated_at', 'delivery')
+
 
 @integration_bp.route('/orders/complete', methods=['POST'])
 @require_api_key
@@ -141,6 +153,11 @@ def complete_order_flow():
             carrier=data.get('carrier')
         )
         
+        # Respond once the order is persisted; with group commit enabled,
+        # concurrent requests share a single flush.
+        for service in (inventory_service, sales_service, delivery_service):
+            service.commit_future().result()
+        
         return jsonify({
             'message': 'Order completed successfully',
             'order': order.to_dict(),
@@ -162,6 +179,157 @@ def complete_order_flow():
         }), 400
 
 
+@integration_bp.route('/orders/complete/batch', methods=['POST'])
+@require_api_key
+def complete_order_batch():
+    """
+    Complete many orders at once: the order flow for each, one save per system
+    ---
+    tags:
+      - Integration
+    parameters:
+      - in: header
+        name: X-API-Key
+        required: true
+        schema:
+          type: string
+      - in: body
+        name: batch_request
+        required: true
+        schema:
+          type: object
+          required:
+            - orders
+          properties:
+            orders:
+              type: array
+              description: Up to 5000 orders, each shaped like the body of /orders/complete
+              items:
+                type: object
+    responses:
+      201:
+        description: Every order completed
+      207:
+        description: Some orders failed; see the result of each order
+      400:
+        description: Invalid request
+    """
+    data = request.get_json(silent=True)
+    orders = data.get('orders') if isinstance(data, dict) else None
+    if not isinstance(orders, list) or not orders:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': 'Request body must be JSON with a non-empty orders list'
+        }), 400
+    if len(orders) > MAX_BATCH_SIZE:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': f'At most {MAX_BATCH_SIZE} orders per batch'
+        }), 400
+    
+    results = [None] * len(orders)
+    
+    def fail(index, status, error, message):
+        results[index] = {'index': index, 'status': status, 'error': error, 'message': message}
+    
+    # Step 1: Validate every order and look up its books, in one pass
+    accepted = []  # (index, order request, order items)
+    for index, order_data in enumerate(orders):
+        if not isinstance(order_data, dict):
+            fail(index, 400, 'Invalid request', 'Each order must be a JSON object')
+            continue
+        missing = [field for field in ('customer_name', 'customer_email', 'items', 'shipping_address')
+                   if field not in order_data]
+        if missing:
+            fail(index, 400, 'Missing required field', f'{missing[0]} is required')
+            continue
+        items = order_data['items']
+        if (not isinstance(items, list) or not items
+                or not all(isinstance(item, dict) and type(item.get('quantity')) is int  # Not bool
+                           and item['quantity'] > 0 and 'book_id' in item for item in items)):
+            fail(index, 400, 'Invalid request',
+                 'items must be a non-empty list of book_id and positive integer quantity')
+            continue
+        
+        order_items = []
+        for item in items:
+            book = inventory_service.get_book_by_id(item['book_id'])
+            if not book:
+                fail(index, 404, 'Book not found', f'Book with ID {item["book_id"]} not found in inventory')
+                break
+            order_items.append({
+                'book_id': book.id,
+                'title': book.title,
+                'quantity': item['quantity'],
+                'unit_price': book.price
+            })
+        else:
+            accepted.append((index, order_data, order_items))
+    
+    # Step 2: Reserve stock for the whole batch, earlier orders first
+    reserved = inventory_service.reserve_stock_batch(
+        [[(item['book_id'], item['quantity']) for item in order_items] for _, _, order_items in accepted]
+    )
+    placed = []
+    for (index, order_data, order_items), success in zip(accepted, reserved):
+        if success:
+            placed.append((index, order_data, order_items))
+            continue
+        item = next((item for item in order_items
+                     if not inventory_service.check_stock(item['book_id'], item['quantity'])), None)
+        if item is None:
+            fail(index, 400, 'Insufficient stock', 'Insufficient stock for the combined quantities of the order')
+            continue
+        book = inventory_service.get_book_by_id(item['book_id'])
+        fail(index, 400, 'Insufficient stock',
+             f'Insufficient stock for book "{book.title}". Available: {book.stock_quantity}, '
+             f'Requested: {item["quantity"]}')
+    
+    # Step 3: Create and pay the orders, then their deliveries, one save each
+    created = []
+    deliveries = []
+    try:
+        created = sales_service.create_orders([{
+            'customer_name': order_data['customer_name'],
+            'customer_email': order_data['customer_email'],
+            'items': order_items,
+            'shipping_address': order_data['shipping_address']
+        } for _, order_data, order_items in placed], pay=True)
+        deliveries = delivery_service.create_deliveries([{
+            'order_id': order.id,
+            'shipping_address': order_data['shipping_address'],
+            'carrier': order_data.get('carrier')
+        } for order, (_, order_data, _) in zip(created, placed)])
+        
+        for service in (inventory_service, sales_service, delivery_service):
+            service.commit_future().result()
+    except Exception as e:
+        # Undo the failed step: drop its deliveries and orders, then restore their stock
+        delivery_service.remove_deliveries([delivery.id for delivery in deliveries])
+        sales_service.remove_orders([order.id for order in created])
+        inventory_service.restore_stock_batch(
+            [(item['book_id'], item['quantity']) for _, _, order_items in placed for item in order_items]
+        )
+        for index, _, _ in placed:
+            fail(index, 400, 'Order processing failed', str(e))
+    else:
+        for (index, _, _), order, delivery in zip(placed, created, deliveries):
+            results[index] = {
+                'index': index,
+                'status': 201,
+                'order': order.to_dict(),
+                'delivery': delivery.to_dict(),
+                'payment_id': order.payment_id
+            }
+    
+    completed = sum(1 for result in results if result['status'] == 201)
+    return jsonify({
+        'completed': completed,
+        'failed': len(results) - completed,
+        'results': results
+    }), 201 if completed == len(results) else 207
+
+
 @integration_bp.route('/orders/<order_id>/status', methods=['GET'])
 @require_api_key
 def get_complete_order_status(order_id):
@@ -176,6 +344,16 @@ def get_complete_order_status(order_id):
         required: true
         schema:
           type: string
+      - in: query
+        name: fields
+        schema:
+          type: string
+        description: Comma separated top-level fields to return, e.g. order_id,order_status,delivery
+      - in: query
+        name: expand
+        schema:
+          type: string
+        description: Comma separated nested objects to embed (book_details, delivery); all of them by default, none if empty
       - in: header
         name: X-API-Key
         required: true
@@ -184,9 +362,22 @@ def get_complete_order_status(order_id):
     responses:
       200:
         description: Complete order status
+      304:
+        description: Not modified since the ETag given in If-None-Match
+      400:
+        description: Unknown field or nested object
       404:
         description: Order not found
     """
+    try:
+        fields = fields_arg(ORDER_STATUS_FIELDS)
+        expand = expand_arg(('book_details', 'delivery'))
+    except ValueError as e:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': str(e)
+        }), 400
+    
     order = sales_service.get_order_by_id(order_id)
     if not order:
         return jsonify({
@@ -194,36 +385,156 @@ def get_complete_order_status(order_id):
             'message': f'No order found with ID: {order_id}'
         }), 404
     
-    delivery = delivery_service.get_delivery_by_order_id(order_id)
-    
-    # Get book details for order items
-    order_items_details = []
-    for item in order.items:
-        book = inventory_service.get_book_by_id(item.book_id)
-        order_items_details.append({
-            'book_id': item.book_id,
-            'title': item.title,
-            'quantity': item.quantity,
-            'unit_price': item.unit_price,
-            'subtotal': item.subtotal,
-            'book_details': book.to_dict() if book else None
-        })
+    if fields is None:
+        fields = ORDER_STATUS_FIELDS
+    # Look up what the response shows once; the ETag is made of their contents
+    record = delivery_service.get_delivery_by_order_id(order_id) if 'delivery' in fields else None
+    books = {}
+    if 'items' in fields and 'book_details' in expand:
+        books = inventory_service.get_books_by_ids([item.book_id for item in order.items])
+    etag = make_etag('order-status', content_tag(order), content_tag(record),
+                     *(content_tag(book) for book in books.values()))
+    
+    return conditional(etag, lambda: (jsonify(_order_status(order, fields, expand, record, books)), 200))
+
+
+@integration_bp.route('/orders/status:batchGet', methods=['POST'])
+@require_api_key
+def get_complete_order_statuses():
+    """
+    Get the complete status of many orders at once
+    ---
+    tags:
+      - Integration
+    parameters:
+      - in: query
+        name: fields
+        schema:
+          type: string
+        description: Comma separated top-level fields to return, e.g. order_id,order_status,delivery
+      - in: query
+        name: expand
+        schema:
+          type: string
+        description: Comma separated nested objects to embed (book_details, delivery); all of them by default, none if empty
+      - in: header
+        name: X-API-Key
+        required: true
+        schema:
+          type: string
+      - in: body
+        name: lookup
+        required: true
+        schema:
+          type: object
+          required:
+            - order_ids
+          properties:
+            order_ids:
+              type: array
+              items:
+                type: string
+    responses:
+      200:
+        description: Complete status of each order (null if not found) and the order IDs not found
+      400:
+        description: Invalid request data, unknown field or nested object
+    """
+    try:
+        fields = fields_arg(ORDER_STATUS_FIELDS)
+        expand = expand_arg(('book_details', 'delivery'))
+    except ValueError as e:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': str(e)
+        }), 400
+    
+    data = request.get_json(silent=True)
+    order_ids = data.get('order_ids') if isinstance(data, dict) else None
+    
+    if not isinstance(order_ids, list) or not all(isinstance(order_id, str) for order_id in order_ids):
+        return jsonify({
+            'error': 'Invalid request',
+            'message': 'order_ids must be an array of strings'
+        }), 400
     
-    response = {
-        'order_id': order_id,
-        'order_status': order.status,
-        'payment_status': order.payment_status,
-        'payment_id': order.payment_id,
-        'customer': {
+    if len(order_ids) > MAX_LOOKUP_SIZE:
+        return jsonify({
+            'error': 'Batch too large',
+            'message': f'At most {MAX_LOOKUP_SIZE} orders can be looked up at once'
+        }), 400
+    
+    if fields is None:
+        fields = ORDER_STATUS_FIELDS
+    # One pass per system; books ordered several times are looked up once
+    orders = sales_service.get_orders_by_ids(order_ids)
+    found = [order for order in orders.values() if order]
+    deliveries = {}
+    if 'delivery' in fields:
+        deliveries = delivery_service.get_deliveries_by_order_ids([order.id for order in found])
+    books = {}
+    if 'items' in fields and 'book_details' in expand:
+        books = inventory_service.get_books_by_ids(
+            list(dict.fromkeys(item.book_id for order in found for item in order.items))
+        )
+    
+    return jsonify({
+        'orders': {
+            order_id: _order_status(order, fields, expand, deliveries.get(order.id), books) if order else None
+            for order_id, order in orders.items()
+        },
+        'not_found': [order_id for order_id, order in orders.items() if not order],
+        'count': len(found)
+    }), 200
+
+
+def _order_status(order, fields, expand, delivery_record, books) -> dict:
+    """Build the requested fields of an order's complete status
+    
+    Args:
+        order: The order
+        fields: Top-level fields to build
+        expand: Nested objects to embed
+        delivery_record: Delivery of the order, if any
+        books: Books of the order's items by ID, when book_details is expanded
+    """
+    def items():
+        # Get book details for order items
+        order_items_details = []
+        for item in order.items:
+            details = {
+                'book_id': item.book_id,
+                'title': item.title,
+                'quantity': item.quantity,
+                'unit_price': item.unit_price,
+                'subtotal': item.subtotal
+            }
+            if 'book_details' in expand:
+                book = books.get(item.book_id)
+                details['book_details'] = book.to_dict() if book else None
+            order_items_details.append(details)
+        return order_items_details
+    
+    def delivery():
+        if not delivery_record:
+            return None
+        # Without expansion only a reference to the delivery is returned
+        return delivery_record.to_dict() if 'delivery' in expand else {'id': delivery_record.id}
+    
+    # Only the requested fields are built
+    builders = {
+        'order_id': lambda: order.id,
+        'order_status': lambda: order.status,
+        'payment_status': lambda: order.payment_status,
+        'payment_id': lambda: order.payment_id,
+        'customer': lambda: {
             'name': order.customer_name,
             'email': order.customer_email
         },
-        'items': order_items_details,
-        'total_amount': order.total_amount,
-        'created_at': order.created_at,
-        'updated_at': order.updated_at,
-        'delivery': delivery.to_dict() if delivery else None
+        'items': items,
+        'total_amount': lambda: order.total_amount,
+        'created_at': lambda: order.created_at,
+        'updated_at': lambda: order.updated_at,
+        'delivery': delivery
     }
-    
-    return jsonify(response), 200
-
+    return {field: builders[field]() for field in fields}
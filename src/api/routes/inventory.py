@@ -1,12 +1,24 @@
 """Inventory System API Routes"""
 
+import csv
+import io
 from flask import Blueprint, jsonify, request
 from src.api.auth import require_api_key
-from src.services.inventory_service import InventoryService
+from src.api.conditional import PROCESS_TAG, conditional, content_tag, make_etag
+from src.api.pagination import page_args
+from src.api.projection import fields_arg
+from src.models.book import Book
+from src.services.inventory_service import InventoryService, check_sort
 
 inventory_bp = Blueprint('inventory', __name__)
 inventory_service = InventoryService()
 
+# Largest number of keys accepted by batch lookups
+MAX_BATCH_SIZE = 1000
+
+# Largest number of adjustments accepted by a bulk stock update
+MAX_STOCK_ADJUSTMENTS = 10000
+
 
 @inventory_bp.route('/books', methods=['GET'])
 @require_api_key
@@ -17,15 +29,56 @@ def get_all_books():
     tags:
       - Inventory
     parameters:
+      - in: query
+        name: fields
+        schema:
+          type: string
+        description: Comma separated fields to return, e.g. id,title,price,stock_quantity
       - in: header
         name: X-API-Key
         required: true
         schema:
           type: string
         description: API key for authentication
+      - in: query
+        name: category
+        schema:
+          type: string
+        description: Only books of this category (case-insensitive)
+      - in: query
+        name: min_price
+        schema:
+          type: number
+        description: Lowest price, inclusive
+      - in: query
+        name: max_price
+        schema:
+          type: number
+        description: Highest price, inclusive
+      - in: query
+        name: in_stock
+        schema:
+          type: boolean
+        description: Only books with stock left
+      - in: query
+        name: sort
+        schema:
+          type: string
+          enum: [price, -price, title, -title, author, -author, created_at, -created_at]
+        description: Sort field, prefixed with - for descending order
+      - in: query
+        name: limit
+        schema:
+          type: integer
+        description: Page size (1-100); without it the full list is returned
+      - in: query
+        name: cursor
+        schema:
+          type: string
+        description: next_cursor of the previous page
     responses:
       200:
-        description: List of all books
+        description: List of the matching books; pages are ordered by price, with next_cursor null on the last page
         schema:
           type: object
           properties:
@@ -33,12 +86,121 @@ def get_all_books():
               type: array
               items:
                 type: object
+      304:
+        description: Not modified since the ETag given in If-None-Match
+      400:
+        description: Invalid filter, sort order, limit or cursor
       401:
         description: Unauthorized - Invalid or missing API key
     """
-    books = inventory_service.get_all_books()
+    version = inventory_service.version  # Read first, so a concurrent change is never hidden
+    args = request.args
+    sort = args.get('sort')
+    try:
+        fields = fields_arg(Book)
+        limit, cursor = page_args()
+        filters = {
+            'category': args.get('category'),
+            'min_price': float(args['min_price']) if 'min_price' in args else None,
+            'max_price': float(args['max_price']) if 'max_price' in args else None,
+            'in_stock': args.get('in_stock', '').lower() in ('1', 'true', 'yes')
+        }
+        check_sort(sort)
+        if limit is not None and (sort or 'price') != 'price':
+            raise ValueError('Pages are ordered by price; sort cannot be combined with limit')
+    except ValueError as e:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': str(e)
+        }), 400
+    
+    def build():
+        # Only queried when the client's copy is stale and nothing is cached
+        if limit is None:
+            books = inventory_service.find_books(sort=sort, **filters)
+        else:
+            try:
+                books, next_cursor = inventory_service.get_books_page(limit, cursor, **filters)
+            except ValueError as e:  # Cursor of another listing
+                return jsonify({
+                    'error': 'Invalid request',
+                    'message': str(e)
+                }), 400
+        response = {
+            'books': [book.to_dict(fields) for book in books],
+            'count': len(books)
+        }
+        if limit is not None:
+            response['next_cursor'] = next_cursor
+        return jsonify(response), 200
+    
+    return conditional(make_etag('books', PROCESS_TAG, version), build, cache=True)
+
+
+@inventory_bp.route('/books/search', methods=['GET'])
+@require_api_key
+def search_books():
+    """
+    Search books by title, author, description and category
+    ---
+    tags:
+      - Inventory
+    parameters:
+      - in: query
+        name: q
+        required: true
+        schema:
+          type: string
+        description: Search words; every word must match, and also matches words it is a prefix of
+      - in: query
+        name: limit
+        schema:
+          type: integer
+          default: 20
+        description: Largest number of results (1-100)
+      - in: query
+        name: fields
+        schema:
+          type: string
+        description: Comma separated fields to return, e.g. id,title,price,stock_quantity
+      - in: header
+        name: X-API-Key
+        required: true
+        schema:
+          type: string
+    responses:
+      200:
+        description: Matching books, best matches first
+      400:
+        description: Missing query or invalid limit
+    """
+    try:
+        fields = fields_arg(Book)
+    except ValueError as e:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': str(e)
+        }), 400
+    
+    query = request.args.get('q', '').strip()
+    limit = request.args.get('limit', 20, type=int)
+    
+    if not query:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': 'Query parameter q is required'
+        }), 400
+    
+    if not 1 <= limit <= 100:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': 'limit must be between 1 and 100'
+        }), 400
+    
+    books = inventory_service.search_books(query, limit)
     return jsonify({
-        'books': [book.to_dict() for book in books],
+        'query': query,
+        'books': [book.to_dict(fields) for book in books],
         'count': len(books)
     }), 200
 
@@ -58,6 +220,11 @@ def get_book_by_id(book_id):
         schema:
           type: string
         description: Book ID
+      - in: query
+        name: fields
+        schema:
+          type: string
+        description: Comma separated fields to return, e.g. id,title,price,stock_quantity
       - in: header
         name: X-API-Key
         required: true
@@ -66,11 +233,21 @@ def get_book_by_id(book_id):
     responses:
       200:
         description: Book details
+      304:
+        description: Not modified since the ETag given in If-None-Match
       404:
         description: Book not found
       401:
         description: Unauthorized
     """
+    try:
+        fields = fields_arg(Book)
+    except ValueError as e:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': str(e)
+        }), 400
+    
     book = inventory_service.get_book_by_id(book_id)
     if not book:
         return jsonify({
@@ -78,7 +255,196 @@ def get_book_by_id(book_id):
             'message': f'No book found with ID: {book_id}'
         }), 404
     
-    return jsonify(book.to_dict()), 200
+    return conditional(make_etag('book', content_tag(book)),
+                       lambda: (jsonify(book.to_dict(fields)), 200))
+
+
+@inventory_bp.route('/books/isbn/<isbn>', methods=['GET'])
+@require_api_key
+def get_book_by_isbn(isbn):
+    """
+    Get a book by ISBN
+    ---
+    tags:
+      - Inventory
+    parameters:
+      - in: path
+        name: isbn
+        required: true
+        schema:
+          type: string
+        description: ISBN-10 or ISBN-13, with or without hyphens
+      - in: query
+        name: fields
+        schema:
+          type: string
+        description: Comma separated fields to return, e.g. id,title,price,stock_quantity
+      - in: header
+        name: X-API-Key
+        required: true
+        schema:
+          type: string
+    responses:
+      200:
+        description: Book details
+      304:
+        description: Not modified since the ETag given in If-None-Match
+      404:
+        description: Book not found
+    """
+    try:
+        fields = fields_arg(Book)
+    except ValueError as e:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': str(e)
+        }), 400
+    
+    book = inventory_service.get_book_by_isbn(isbn)
+    if not book:
+        return jsonify({
+            'error': 'Book not found',
+            'message': f'No book found with ISBN: {isbn}'
+        }), 404
+    
+    return conditional(make_etag('book', content_tag(book)),
+                       lambda: (jsonify(book.to_dict(fields)), 200))
+
+
+@inventory_bp.route('/books/isbn/batch', methods=['POST'])
+@require_api_key
+def get_books_by_isbns():
+    """
+    Get books for a batch of ISBNs
+    ---
+    tags:
+      - Inventory
+    parameters:
+      - in: query
+        name: fields
+        schema:
+          type: string
+        description: Comma separated fields to return, e.g. id,title,price,stock_quantity
+      - in: header
+        name: X-API-Key
+        required: true
+        schema:
+          type: string
+      - in: body
+        name: lookup
+        required: true
+        schema:
+          type: object
+          required:
+            - isbns
+          properties:
+            isbns:
+              type: array
+              items:
+                type: string
+    responses:
+      200:
+        description: Book of each ISBN (null if not found) and the ISBNs not found
+      400:
+        description: Invalid request data
+    """
+    try:
+        fields = fields_arg(Book)
+    except ValueError as e:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': str(e)
+        }), 400
+    
+    data = request.get_json(silent=True)
+    isbns = data.get('isbns') if isinstance(data, dict) else None
+    
+    if not isinstance(isbns, list) or not all(isinstance(isbn, str) for isbn in isbns):
+        return jsonify({
+            'error': 'Invalid request',
+            'message': 'isbns must be an array of strings'
+        }), 400
+    
+    if len(isbns) > MAX_BATCH_SIZE:
+        return jsonify({
+            'error': 'Batch too large',
+            'message': f'At most {MAX_BATCH_SIZE} ISBNs can be looked up at once'
+        }), 400
+    
+    books = inventory_service.get_books_by_isbns(isbns)
+    return jsonify({
+        'books': {isbn: book.to_dict(fields) if book else None for isbn, book in books.items()},
+        'not_found': [isbn for isbn, book in books.items() if not book],
+        'count': sum(1 for book in books.values() if book)
+    }), 200
+
+
+@inventory_bp.route('/books:batchGet', methods=['POST'])
+@require_api_key
+def get_books_by_ids():
+    """
+    Get books for a batch of IDs, e.g. the items of a cart
+    ---
+    tags:
+      - Inventory
+    parameters:
+      - in: query
+        name: fields
+        schema:
+          type: string
+        description: Comma separated fields to return, e.g. id,title,price,stock_quantity
+      - in: header
+        name: X-API-Key
+        required: true
+        schema:
+          type: string
+      - in: body
+        name: lookup
+        required: true
+        schema:
+          type: object
+          required:
+            - ids
+          properties:
+            ids:
+              type: array
+              items:
+                type: string
+    responses:
+      200:
+        description: Book of each ID (null if not found) and the IDs not found
+      400:
+        description: Invalid request data
+    """
+    try:
+        fields = fields_arg(Book)
+    except ValueError as e:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': str(e)
+        }), 400
+    
+    data = request.get_json(silent=True)
+    book_ids = data.get('ids') if isinstance(data, dict) else None
+    
+    if not isinstance(book_ids, list) or not all(isinstance(book_id, str) for book_id in book_ids):
+        return jsonify({
+            'error': 'Invalid request',
+            'message': 'ids must be an array of strings'
+        }), 400
+    
+    if len(book_ids) > MAX_BATCH_SIZE:
+        return jsonify({
+            'error': 'Batch too large',
+            'message': f'At most {MAX_BATCH_SIZE} IDs can be looked up at once'
+        }), 400
+    
+    books = inventory_service.get_books_by_ids(book_ids)
+    return jsonify({
+        'books': {book_id: book.to_dict(fields) if book else None for book_id, book in books.items()},
+        'not_found': [book_id for book_id, book in books.items() if not book],
+        'count': sum(1 for book in books.values() if book)
+    }), 200
 
 
 @inventory_bp.route('/books/<book_id>/stock', methods=['GET'])
@@ -131,3 +497,158 @@ def check_stock(book_id):
         'is_available': available
     }), 200
 
+
+
+@inventory_bp.route('/stock/bulk', methods=['POST'])
+@require_api_key
+def adjust_stock_bulk():
+    """
+    Apply many stock adjustments, e.g. from warehouse receiving or a cycle count
+    ---
+    tags:
+      - Inventory
+    consumes:
+      - application/json
+      - text/csv
+    parameters:
+      - in: query
+        name: mode
+        schema:
+          type: string
+          enum: [atomic, best_effort]
+          default: atomic
+        description: atomic applies nothing if any adjustment conflicts; best_effort applies the others
+      - in: header
+        name: X-API-Key
+        required: true
+        schema:
+          type: string
+      - in: body
+        name: adjustments
+        required: true
+        description: JSON object with an adjustments array, or CSV with a header row of the same columns
+        schema:
+          type: object
+          required:
+            - adjustments
+          properties:
+            adjustments:
+              type: array
+              items:
+                type: object
+                properties:
+                  book_id:
+                    type: string
+                  isbn:
+                    type: string
+                    description: Identifies the book instead of book_id
+                  delta:
+                    type: integer
+                    description: Amount to add to the stock (negative to remove)
+                  quantity:
+                    type: integer
+                    description: Absolute stock counted, instead of delta
+                  expected_quantity:
+                    type: integer
+                    description: Only apply if the stock is still this value
+    responses:
+      200:
+        description: Adjustments applied; in best_effort mode the conflicting ones are listed, by row and the book_id or isbn given
+      400:
+        description: Invalid request data
+      409:
+        description: Atomic mode and some adjustments conflict; nothing was applied
+    """
+    mode = request.args.get('mode', 'atomic')
+    if mode not in ('atomic', 'best_effort'):
+        return jsonify({
+            'error': 'Invalid request',
+            'message': 'mode must be atomic or best_effort'
+        }), 400
+    
+    try:
+        adjustments = _read_adjustments()
+    except ValueError as e:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': str(e)
+        }), 400
+    
+    conflicts = inventory_service.adjust_stock_bulk(adjustments, atomic=mode == 'atomic')
+    rejected = mode == 'atomic' and any(conflicts)
+    if not rejected:
+        inventory_service.commit_future().result()
+    
+    return jsonify({
+        'mode': mode,
+        'applied': 0 if rejected else sum(1 for conflict in conflicts if conflict is None),
+        'conflicts': [
+            {'row': row, **{key: adjustment[key] for key in ('book_id', 'isbn') if key in adjustment},
+             'message': conflict}
+            for row, (adjustment, conflict) in enumerate(zip(adjustments, conflicts), 1) if conflict
+        ]
+    }), 409 if rejected else 200
+
+
+def _read_adjustments():
+    """Read the stock adjustments of a bulk request, from JSON or CSV
+    
+    CSV is parsed while it streams in, one row at a time.
+    
+    Raises:
+        ValueError: If the body or one of its rows is invalid
+    """
+    if request.mimetype == 'text/csv':
+        rows = csv.DictReader(io.TextIOWrapper(request.stream, encoding='utf-8', newline=''))
+    else:
+        data = request.get_json(silent=True)
+        rows = data.get('adjustments') if isinstance(data, dict) else None
+        if not isinstance(rows, list):
+            raise ValueError('Request body must be JSON with an adjustments array, or CSV')
+    
+    adjustments = []
+    try:
+        for row_number, row in enumerate(rows, 1):
+            if len(adjustments) == MAX_STOCK_ADJUSTMENTS:
+                raise ValueError(f'At most {MAX_STOCK_ADJUSTMENTS} adjustments can be applied at once')
+            adjustments.append(_adjustment(row, row_number))
+    except UnicodeDecodeError:
+        raise ValueError('CSV must be UTF-8 encoded') from None
+    return adjustments
+
+
+def _adjustment(row, row_number: int) -> dict:
+    """Validate one adjustment
+    
+    Raises:
+        ValueError: If the row is not a valid adjustment
+    """
+    if not isinstance(row, dict):
+        raise ValueError(f'Row {row_number}: must be an object')
+    # Empty CSV cells count as missing
+    row = {key: value for key, value in row.items() if value not in (None, '')}
+    
+    adjustment = {}
+    for field in ('delta', 'quantity', 'expected_quantity'):
+        if field not in row:
+            continue
+        value = row[field]
+        try:
+            # CSV cells are strings; JSON numbers must already be integers
+            adjustment[field] = int(value) if isinstance(value, str) else value
+        except ValueError:
+            raise ValueError(f'Row {row_number}: {field} must be an integer') from None
+        if type(adjustment[field]) is not int:
+            raise ValueError(f'Row {row_number}: {field} must be an integer')
+    if ('delta' in adjustment) == ('quantity' in adjustment):
+        raise ValueError(f'Row {row_number}: give either delta or quantity')
+    if adjustment.get('quantity', 0) < 0 or adjustment.get('expected_quantity', 0) < 0:
+        raise ValueError(f'Row {row_number}: quantities cannot be negative')
+    
+    if 'book_id' in row:
+        adjustment['book_id'] = str(row['book_id'])
+    elif 'isbn' in row:
+        adjustment['isbn'] = str(row['isbn'])
+    else:
+        raise ValueError(f'Row {row_number}: book_id or isbn is required')
+    return adjustment
@@ -1,22 +1,77 @@
 """Sales System API Routes"""
 
+from datetime import date, datetime, time, timedelta
 from flask import Blueprint, jsonify, request
 from src.api.auth import require_api_key
+from src.api.conditional import PROCESS_TAG, conditional, content_tag, make_etag
+from src.api.export import ndjson_response, since_arg
+from src.api.pagination import page_args
+from src.api.projection import fields_arg
+from src.models.order import Order
 from src.services.sales_service import SalesService
 
 sales_bp = Blueprint('sales', __name__)
 sales_service = SalesService()
 
 
+def _parse_time(value, end_of_day=False):
+    """Parse an ISO 8601 query parameter; a date alone means its start (or end) of day"""
+    if not value:
+        return None
+    try:
+        day = date.fromisoformat(value)
+    except ValueError:
+        return datetime.fromisoformat(value)
+    start = datetime.combine(day, time.min)
+    return start + timedelta(days=1, microseconds=-1) if end_of_day else start
+
+
 @sales_bp.route('/orders', methods=['GET'])
 @require_api_key
 def get_all_orders():
     """
-    Get all orders
+    Get all orders, optionally filtered by status, payment status and creation time
     ---
     tags:
       - Sales
     parameters:
+      - in: query
+        name: status
+        schema:
+          type: string
+          enum: [pending, paid, processing, shipped, delivered, cancelled]
+        description: Only orders in this status
+      - in: query
+        name: payment_status
+        schema:
+          type: string
+          enum: [pending, paid, failed, refunded]
+        description: Only orders with this payment status
+      - in: query
+        name: from
+        schema:
+          type: string
+        description: Earliest creation time, inclusive (ISO 8601 date or date and time)
+      - in: query
+        name: to
+        schema:
+          type: string
+        description: Latest creation time, inclusive; a date alone covers the whole day
+      - in: query
+        name: limit
+        schema:
+          type: integer
+        description: Page size (1-100); without it the full list is returned
+      - in: query
+        name: cursor
+        schema:
+          type: string
+        description: next_cursor of the previous page
+      - in: query
+        name: fields
+        schema:
+          type: string
+        description: Comma separated fields to return, e.g. id,status,total_amount
       - in: header
         name: X-API-Key
         required: true
@@ -24,13 +79,119 @@ def get_all_orders():
           type: string
     responses:
       200:
-        description: List of all orders
+        description: List of orders; oldest first when filtered by creation time or paged, with next_cursor null on the last page
+      304:
+        description: Not modified since the ETag given in If-None-Match
+      400:
+        description: Invalid from, to, limit or cursor
     """
-    orders = sales_service.get_all_orders()
-    return jsonify({
-        'orders': [order.to_dict() for order in orders],
-        'count': len(orders)
-    }), 200
+    # Refreshed and read before the query: a change landing in between makes the
+    # data newer than the ETag (harmless), never the ETag newer than the data
+    version = sales_service.current_version()
+    try:
+        created_from = _parse_time(request.args.get('from'))
+        created_to = _parse_time(request.args.get('to'), end_of_day=True)
+    except ValueError:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': 'from and to must be ISO 8601 dates or date and times'
+        }), 400
+    
+    filters = {
+        'status': request.args.get('status') or None,
+        'payment_status': request.args.get('payment_status') or None,
+        'created_from': created_from,
+        'created_to': created_to
+    }
+    try:
+        fields = fields_arg(Order)
+        limit, cursor = page_args()
+    except ValueError as e:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': str(e)
+        }), 400
+    
+    def build():
+        # Only queried when the client's copy is stale and nothing is cached
+        if limit is None:
+            orders = sales_service.find_orders(**filters)
+        else:
+            try:
+                orders, next_cursor = sales_service.get_orders_page(limit, cursor, **filters)
+            except ValueError as e:  # Cursor of another listing
+                return jsonify({
+                    'error': 'Invalid request',
+                    'message': str(e)
+                }), 400
+        response = {
+            'orders': [order.to_dict(fields) for order in orders],
+            'count': len(orders)
+        }
+        if limit is not None:
+            response['next_cursor'] = next_cursor
+        return jsonify(response), 200
+    
+    return conditional(make_etag('orders', PROCESS_TAG, version), build, cache=True)
+
+
+@sales_bp.route('/orders/export', methods=['GET'])
+@require_api_key
+def export_orders():
+    """
+    Export every order, archived ones included, as newline-delimited JSON
+    ---
+    tags:
+      - Sales
+    produces:
+      - application/x-ndjson
+    parameters:
+      - in: query
+        name: since
+        schema:
+          type: string
+        description: Only orders created or updated at or after this ISO 8601 date or time, for incremental exports
+      - in: header
+        name: X-API-Key
+        required: true
+        schema:
+          type: string
+    responses:
+      200:
+        description: One order per line, streamed as it is read from storage
+      400:
+        description: Invalid since
+    """
+    try:
+        since = since_arg()
+    except ValueError as e:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': str(e)
+        }), 400
+    
+    return ndjson_response(sales_service.export_orders(since), 'orders.ndjson')
+
+
+@sales_bp.route('/orders/counts', methods=['GET'])
+@require_api_key
+def get_order_counts():
+    """
+    Get the number of orders in each status and payment status
+    ---
+    tags:
+      - Sales
+    parameters:
+      - in: header
+        name: X-API-Key
+        required: true
+        schema:
+          type: string
+    responses:
+      200:
+        description: Number of orders by status and by payment status
+    """
+    return jsonify(sales_service.get_status_counts()), 200
 
 
 @sales_bp.route('/orders', methods=['POST'])
@@ -135,6 +296,11 @@ def get_order_by_id(order_id):
         required: true
         schema:
           type: string
+      - in: query
+        name: fields
+        schema:
+          type: string
+        description: Comma separated fields to return, e.g. id,status,total_amount
       - in: header
         name: X-API-Key
         required: true
@@ -143,9 +309,19 @@ def get_order_by_id(order_id):
     responses:
       200:
         description: Order details
+      304:
+        description: Not modified since the ETag given in If-None-Match
       404:
         description: Order not found
     """
+    try:
+        fields = fields_arg(Order)
+    except ValueError as e:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': str(e)
+        }), 400
+    
     order = sales_service.get_order_by_id(order_id)
     if not order:
         return jsonify({
@@ -153,7 +329,8 @@ def get_order_by_id(order_id):
             'message': f'No order found with ID: {order_id}'
         }), 404
     
-    return jsonify(order.to_dict()), 200
+    return conditional(make_etag('order', content_tag(order)),
+                       lambda: (jsonify(order.to_dict(fields)), 200))
 
 
 @sales_bp.route('/orders/<order_id>/payment', methods=['POST'])
@@ -212,3 +389,101 @@ def process_payment(order_id):
         'order': order.to_dict()
     }), 200
 
+
+
+@sales_bp.route('/orders/archive', methods=['POST'])
+@require_api_key
+def archive_orders():
+    """
+    Move delivered and cancelled orders to the archive
+    ---
+    tags:
+      - Sales
+    parameters:
+      - in: header
+        name: X-API-Key
+        required: true
+        schema:
+          type: string
+    responses:
+      200:
+        description: Orders archived; archived orders stay readable by ID
+    """
+    archived = sales_service.archive_completed_orders()
+    return jsonify({
+        'message': 'Orders archived successfully',
+        'archived': archived
+    }), 200
+
+
+@sales_bp.route('/customers/<email>/orders', methods=['GET'])
+@require_api_key
+def get_customer_orders(email):
+    """
+    Get a customer's order history, one page at a time
+    ---
+    tags:
+      - Sales
+    parameters:
+      - in: path
+        name: email
+        required: true
+        schema:
+          type: string
+        description: Customer email, matched case-insensitively
+      - in: query
+        name: limit
+        schema:
+          type: integer
+          default: 20
+          maximum: 100
+      - in: query
+        name: cursor
+        schema:
+          type: string
+        description: next_cursor of the previous page
+      - in: query
+        name: order
+        schema:
+          type: string
+          enum: [desc, asc]
+          default: desc
+        description: Sort by creation time, newest first by default
+      - in: query
+        name: fields
+        schema:
+          type: string
+        description: Comma separated fields to return, e.g. id,status,total_amount
+      - in: header
+        name: X-API-Key
+        required: true
+        schema:
+          type: string
+    responses:
+      200:
+        description: Page of the customer's orders, with next_cursor null on the last page
+      400:
+        description: Invalid limit, cursor or order
+    """
+    order = request.args.get('order', 'desc')
+    try:
+        fields = fields_arg(Order)
+        limit, cursor = page_args(default=20)
+        if order not in ('asc', 'desc'):
+            raise ValueError('order must be asc or desc')
+        orders, next_cursor = sales_service.get_customer_orders_page(
+            email, limit, cursor, newest_first=order == 'desc'
+        )
+    except ValueError as e:
+        return jsonify({
+            'error': 'Invalid request',
+            'message': str(e)
+        }), 400
+    
+    return jsonify({
+        'customer_email': email,
+        'orders': [o.to_dict(fields) for o in orders],
+        'count': len(orders),
+        'limit': limit,
+        'next_cursor': next_cursor
+    }), 200
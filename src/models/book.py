@@ -1,7 +1,7 @@
 """Book model for the Inventory System"""
 
 from dataclasses import dataclass, asdict
-from typing import Optional
+from typing import Iterable, Optional
 from datetime import datetime
 
 
@@ -19,9 +19,11 @@ class Book:
     created_at: Optional[str] = None
     updated_at: Optional[str] = None
 
-    def to_dict(self) -> dict:
-        """Convert book to dictionary"""
-        return asdict(self)
+    def to_dict(self, fields: Optional[Iterable[str]] = None) -> dict:
+        """Convert book to dictionary, with only the given fields if any"""
+        if fields is None:
+            return asdict(self)
+        return {field: getattr(self, field) for field in fields}
 
     @classmethod
     def from_dict(cls, data: dict) -> 'Book':
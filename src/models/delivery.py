@@ -1,13 +1,17 @@
 """Delivery model for the Delivery System"""
 
 from dataclasses import dataclass, asdict
-from typing import Optional
+from typing import Iterable, Optional
 from datetime import datetime
+from src.models.observable import Observable
 
 
 @dataclass
-class Delivery:
-    """Represents a delivery record"""
+class Delivery(Observable):
+    """Represents a delivery record
+
+    Changes to ``status`` are notified to the observer set with ``watch``.
+    """
     id: str
     order_id: str
     status: str  # 'pending', 'preparing', 'shipped', 'in_transit', 'delivered', 'failed'
@@ -20,9 +24,11 @@ class Delivery:
     updated_at: Optional[str] = None
     notes: Optional[str] = None
 
-    def to_dict(self) -> dict:
-        """Convert delivery to dictionary"""
-        return asdict(self)
+    def to_dict(self, fields: Optional[Iterable[str]] = None) -> dict:
+        """Convert delivery to dictionary, with only the given fields if any"""
+        if fields is None:
+            return asdict(self)
+        return {field: getattr(self, field) for field in fields}
 
     @classmethod
     def from_dict(cls, data: dict) -> 'Delivery':
@@ -31,6 +37,7 @@ class Delivery:
 
     def update_status(self, new_status: str, notes: Optional[str] = None):
         """Update delivery status"""
+        old_status = self.status
         self.status = new_status
         self.updated_at = datetime.now().isoformat()
         if notes:
@@ -39,6 +46,8 @@ class Delivery:
         # Auto-set delivery date when status is 'delivered'
         if new_status == 'delivered' and not self.actual_delivery_date:
             self.actual_delivery_date = datetime.now().isoformat()
+        
+        self._changed('status', old_status, new_status)
 
     def set_tracking(self, tracking_number: str, carrier: str):
         """Set tracking information"""
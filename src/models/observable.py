@@ -0,0 +1,21 @@
+"""Change notifications for model fields that services index"""
+
+from typing import Any, Callable
+
+# observer(record, field, old value, new value)
+Observer = Callable[[Any, str, Any, Any], None]
+
+
+class Observable:
+    """Mixin letting a model tell an observer when one of its fields changes"""
+
+    def watch(self, observer: Observer):
+        """Call ``observer`` after every change notified by the model, replacing any previous observer"""
+        # Kept out of the dataclass fields so it is not serialized or compared
+        self.__dict__['_observer'] = observer
+
+    def _changed(self, field: str, old: Any, new: Any):
+        """Notify the observer that ``field`` changed from ``old`` to ``new``"""
+        observer = self.__dict__.get('_observer')
+        if observer is not None and old != new:
+            observer(self, field, old, new)
@@ -1,8 +1,9 @@
 """Order model for the Sales System"""
 
 from dataclasses import dataclass, asdict
-from typing import List, Optional
+from typing import Iterable, List, Optional
 from datetime import datetime
+from src.models.observable import Observable
 
 
 @dataclass
@@ -23,8 +24,12 @@ class OrderItem:
 
 
 @dataclass
-class Order:
-    """Represents a customer order"""
+class Order(Observable):
+    """Represents a customer order
+
+    Changes to ``status`` and ``payment_status`` are notified to the observer
+    set with ``watch``.
+    """
     id: str
     customer_name: str
     customer_email: str
@@ -37,11 +42,14 @@ class Order:
     payment_id: Optional[str] = None
     shipping_address: Optional[str] = None
 
-    def to_dict(self) -> dict:
-        """Convert order to dictionary"""
-        data = asdict(self)
-        data['items'] = [item.to_dict() for item in self.items]
-        return data
+    def to_dict(self, fields: Optional[Iterable[str]] = None) -> dict:
+        """Convert order to dictionary, with only the given fields if any"""
+        if fields is None:
+            data = asdict(self)
+            data['items'] = [item.to_dict() for item in self.items]
+            return data
+        return {field: [item.to_dict() for item in self.items] if field == 'items'
+                else getattr(self, field) for field in fields}
 
     @classmethod
     def from_dict(cls, data: dict) -> 'Order':
@@ -67,13 +75,17 @@ class Order:
 
     def update_status(self, new_status: str):
         """Update order status"""
+        old_status = self.status
         self.status = new_status
         self.updated_at = datetime.now().isoformat()
+        self._changed('status', old_status, new_status)
 
     def update_payment_status(self, new_status: str, payment_id: Optional[str] = None):
         """Update payment status"""
+        old_status = self.payment_status
         self.payment_status = new_status
         if payment_id:
             self.payment_id = payment_id
         self.updated_at = datetime.now().isoformat()
+        self._changed('payment_status', old_status, new_status)
 
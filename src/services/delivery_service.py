@@ -1,75 +1,348 @@
 """Delivery Service - Manages order deliveries"""
 
-import json
+import itertools
 import os
-from typing import List, Optional
-from pathlib import Path
+import threading
+from concurrent.futures import Future
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from datetime import datetime, timedelta
+import time
 import uuid
 from src.models.delivery import Delivery
+from src.services.indexes import RangeIndex, StatusIndex, UniqueIndex, iso_timestamp
+from src.services.pagination import collect_page
+from src.storage.archive import Archive
+from src.storage.durability import DEFAULT_DURABILITY
+from src.storage.repository import create_repository
+
+# Deliveries in these states no longer change and are moved to the archive
+ARCHIVED_STATUSES = ('delivered', 'failed')
 
 
 class DeliveryService:
     """Service for managing delivery operations"""
     
-    def __init__(self, data_file: str = "data/deliveries.json"):
-        """Initialize delivery service with data file path"""
+    def __init__(self, data_file: str = "data/deliveries.json", backend: str = 'json',
+                 archive_dir: Optional[str] = None, archive_batch: int = 100,
+                 **storage_options):
+        """Initialize delivery service with data file path
+        
+        Args:
+            data_file: Path to the deliveries JSON file
+            backend: Storage backend, one of ``json``, ``journal``, ``sqlite`` or ``jsonl``
+            archive_dir: Directory of the archive for delivered and failed
+                deliveries (None keeps every delivery in the working set)
+            archive_batch: Archive as soon as this many deliveries are
+                delivered or failed
+            **storage_options: Backend specific options, see ``create_repository``
+        """
         self.data_file = data_file
-        self._ensure_data_file()
+        # Serializes the one-delivery-per-order check with the insert
+        self._lock = threading.RLock()
+        self._order_index = UniqueIndex(lambda delivery: delivery.order_id)
+        # Delivery ids by status, covering archived deliveries too, each
+        # status also ordered by creation time for paging
+        self._status_index = StatusIndex(('status',), lambda delivery: iso_timestamp(delivery.created_at))
+        # Delivery ids by creation time as epoch seconds, for paging
+        self._time_index = RangeIndex(lambda delivery: iso_timestamp(delivery.created_at))
+        self.repository = create_repository(
+            backend, data_file, Delivery.from_dict,
+            table='deliveries', indexed_fields=('order_id', 'status'), unique_fields=('order_id',),
+            **storage_options
+        )
+        self.archive = None
+        if archive_dir:
+            self.archive = Archive(archive_dir, Delivery.from_dict, key_fields=('order_id', 'status', 'created_at'),
+                                   durability=storage_options.get('durability', DEFAULT_DURABILITY))
+        self.archive_batch = archive_batch
+        self._archivable = set()  # Delivered or failed deliveries not archived yet
+        # Version of the delivery list as a whole, bumped on every change seen;
+        # starting from the clock keeps it increasing across restarts
+        self._versions = itertools.count(time.time_ns())
+        self.version = next(self._versions)
         self._load_data()
     
-    def _ensure_data_file(self):
-        """Ensure data directory and file exist"""
-        data_path = Path(self.data_file)
-        data_path.parent.mkdir(parents=True, exist_ok=True)
-        if not data_path.exists():
-            with open(self.data_file, 'w') as f:
-                json.dump([], f)
-    
     def _load_data(self):
-        """Load deliveries from JSON file"""
-        try:
-            with open(self.data_file, 'r') as f:
-                data = json.load(f)
-                self.deliveries = {delivery['id']: Delivery.from_dict(delivery) for delivery in data}
-        except (FileNotFoundError, json.JSONDecodeError):
-            self.deliveries = {}
-    
-    def _save_data(self):
-        """Save deliveries to JSON file"""
-        with open(self.data_file, 'w') as f:
-            deliveries_list = [delivery.to_dict() for delivery in self.deliveries.values()]
-            json.dump(deliveries_list, f, indent=2)
-    
-    def get_all_deliveries(self) -> List[Delivery]:
-        """Get all deliveries"""
+        """Load deliveries from the repository"""
+        self.deliveries = self.repository.load()
+        self._rebuild_indexes()
+    
+    def _refresh_data(self):
+        """Pick up changes written by other service instances"""
+        refresh = self.repository.refresh(self.deliveries)
+        if refresh.outcome == 'hits':
+            return
+        if refresh.changed is None:
+            self._rebuild_indexes()
+        else:
+            self._reindex(refresh.changed)
+        self.version = next(self._versions)
+    
+    def _reindex(self, delivery_ids: Iterable[str]):
+        """Update the index entries of the given deliveries only, wherever they now live"""
+        for delivery_id in delivery_ids:
+            delivery = self.deliveries.get(delivery_id)
+            self._order_index.discard(delivery_id)
+            if delivery is not None:
+                self._order_index.add(delivery)
+            elif self.archive is not None:
+                delivery = self.archive.key_record(delivery_id)
+            for index in (self._status_index, self._time_index):
+                index.discard(delivery_id)
+                if delivery is not None:
+                    index.add(delivery)
+    
+    def _rebuild_indexes(self):
+        """Index the working set, and the key fields of archived deliveries"""
+        records = list(self.deliveries.values())
+        self._order_index.rebuild(records)
+        if self.archive is not None:
+            records.extend(record for record in self.archive.key_records()
+                           if record.id not in self.deliveries)
+        self._status_index.rebuild(records)
+        self._time_index.rebuild(records)
+    
+    def current_version(self) -> int:
+        """Pick up outside changes, then get the version of the deliveries"""
+        self._refresh_data()
+        return self.version
+    
+    def get_cache_stats(self) -> dict:
+        """Get hit/miss counters of the read cache"""
+        return self.repository.stats.to_dict()
+    
+    def commit_future(self) -> Future:
+        """Get a future resolved once every change made so far is persisted"""
+        return self.repository.commit_future()
+    
+    def flush(self):
+        """Wait until every change made so far is persisted"""
+        self.repository.flush()
+    
+    def _save_data(self, delivery: Optional[Delivery] = None):
+        """Persist the changed delivery, or every delivery if none is given"""
+        self._save_deliveries([delivery] if delivery is not None else None)
+    
+    def _save_deliveries(self, deliveries: Optional[List[Delivery]]):
+        """Persist the changed deliveries with a single save, or every delivery if None"""
+        for delivery in deliveries or ():
+            if delivery.id not in self.deliveries:
+                self.deliveries[delivery.id] = delivery  # Changed after it was archived
+                self._order_index.add(delivery)
+        self.version = next(self._versions)
+        self.repository.save(self.deliveries,
+                             [delivery.id for delivery in deliveries] if deliveries is not None else None)
+        if self.archive is not None and deliveries:
+            self._archivable.update(delivery.id for delivery in deliveries
+                                    if delivery.status in ARCHIVED_STATUSES)
+            if len(self._archivable) >= self.archive_batch:
+                self._archive_deliveries(list(self._archivable))
+    
+    def _find_delivery(self, delivery_id: str) -> Optional[Delivery]:
+        """Get a delivery from the working set, falling back to the archive"""
+        delivery = self.deliveries.get(delivery_id)
+        if delivery is None and self.archive is not None:
+            delivery = self.archive.get(delivery_id)
+        if delivery is not None:
+            self._status_index.watch(delivery)
+        return delivery
+    
+    def archive_completed_deliveries(self) -> int:
+        """Move every delivered or failed delivery to the archive
+        
+        Returns:
+            Number of deliveries archived
+        """
+        if self.archive is None:
+            return 0
+        self._refresh_data()
+        return self._archive_deliveries(
+            [delivery.id for delivery in list(self.deliveries.values())
+             if delivery.status in ARCHIVED_STATUSES]
+        )
+    
+    def _archive_deliveries(self, delivery_ids: List[str]) -> int:
+        """Write deliveries to the archive, then drop them from the working set"""
+        deliveries = [self.deliveries[delivery_id] for delivery_id in delivery_ids
+                      if delivery_id in self.deliveries
+                      and self.deliveries[delivery_id].status in ARCHIVED_STATUSES]
+        self.archive.add([delivery.to_dict() for delivery in deliveries])
+        for delivery in deliveries:
+            del self.deliveries[delivery.id]
+            self._order_index.remove(delivery)
+        self.repository.save(self.deliveries, [delivery.id for delivery in deliveries])
+        self._archivable.difference_update(delivery_ids)
+        return len(deliveries)
+    
+    def get_all_deliveries(self, include_archived: bool = True) -> List[Delivery]:
+        """Get all deliveries, including archived ones unless told otherwise"""
         # Reload data to ensure we have the latest
-        self._load_data()
-        return list(self.deliveries.values())
+        self._refresh_data()
+        deliveries = list(self.deliveries.values())
+        if self.archive is not None and include_archived:
+            deliveries.extend(delivery for delivery in self.archive.records()
+                              if delivery.id not in self.deliveries)
+        return deliveries
+    
+    def export_deliveries(self, since: Optional[datetime] = None) -> Iterator[dict]:
+        """Iterate over every delivery as a dict, archived ones included, for streaming exports
+        
+        Deliveries are read from storage as they are consumed, without
+        building Delivery objects where the backend does not hold them in
+        memory.
+        
+        Args:
+            since: Only deliveries created or last updated at or after this time
+        """
+        self._refresh_data()
+        after = since.timestamp() if since else None
+        records = self.repository.export(self.deliveries)
+        if self.archive is not None:
+            records = itertools.chain(records, (record for record in self.archive.export()
+                                                if record['id'] not in self.deliveries))
+        for record in records:
+            if after is None or (iso_timestamp(record.get('updated_at') or record.get('created_at'))
+                                 or 0) >= after:
+                yield record
+    
+    def get_deliveries_by_status(self, status: str) -> List[Delivery]:
+        """Get the deliveries in a status, archived ones included"""
+        self._refresh_data()
+        deliveries = [self._find_delivery(delivery_id)
+                      for delivery_id in self._status_index.get('status', status)]
+        return [delivery for delivery in deliveries if delivery]
+    
+    def get_deliveries_page(self, limit: int, cursor: Optional[str] = None,
+                            status: Optional[str] = None) -> Tuple[List[Delivery], Optional[str]]:
+        """Get a page of the deliveries, oldest first, optionally only those in one status
+        
+        Returns:
+            (deliveries on the page, cursor of the next page or None)
+        
+        Raises:
+            ValueError: If the cursor is invalid
+        """
+        self._refresh_data()
+        def fetch(after, count):
+            if status:
+                return self._status_index.entries('status', status, after=after, limit=count)
+            return self._time_index.entries(after=after, limit=count)
+        
+        delivery_ids, next_cursor = collect_page(fetch, limit, cursor)
+        deliveries = [self._find_delivery(delivery_id) for delivery_id in delivery_ids]
+        return [delivery for delivery in deliveries if delivery], next_cursor
+    
+    def get_status_counts(self) -> dict:
+        """Get the number of deliveries in each status"""
+        self._refresh_data()
+        return self._status_index.counts('status')
     
     def get_delivery_by_id(self, delivery_id: str) -> Optional[Delivery]:
-        """Get a delivery by its ID"""
+        """Get a delivery by its ID, falling back to the archive"""
         # Reload data to ensure we have the latest
-        self._load_data()
-        return self.deliveries.get(delivery_id)
+        self._refresh_data()
+        return self._find_delivery(delivery_id)
     
     def get_delivery_by_order_id(self, order_id: str) -> Optional[Delivery]:
-        """Get delivery by order ID"""
+        """Get delivery by order ID, falling back to the archive"""
         # Reload data to ensure we have the latest
-        self._load_data()
-        for delivery in self.deliveries.values():
-            if delivery.order_id == order_id:
-                return delivery
+        self._refresh_data()
+        return self._find_delivery_by_order_id(order_id)
+    
+    def get_deliveries_by_order_ids(self, order_ids: List[str]) -> Dict[str, Optional[Delivery]]:
+        """Get the delivery of each order, None for orders without one, reloading the data once"""
+        self._refresh_data()
+        return {order_id: self._find_delivery_by_order_id(order_id) for order_id in order_ids}
+    
+    def _find_delivery_by_order_id(self, order_id: str) -> Optional[Delivery]:
+        """Look up the delivery of an order in the index, then in the archive"""
+        delivery_id = self._order_index.get(order_id)
+        if delivery_id is not None:
+            return self.deliveries.get(delivery_id)
+        if self.archive is not None:
+            return self.archive.find('order_id', order_id)
         return None
     
     def create_delivery(self, order_id: str, shipping_address: str, 
                        carrier: Optional[str] = None) -> Delivery:
-        """Create a new delivery record"""
+        """Create a new delivery record
+        
+        Raises:
+            ValueError: If the order already has a delivery
+        """
+        return self.create_deliveries([{
+            'order_id': order_id,
+            'shipping_address': shipping_address,
+            'carrier': carrier
+        }])[0]
+    
+    def create_deliveries(self, deliveries: List[dict]) -> List[Delivery]:
+        """Create many delivery records, persisted with a single save
+        
+        Args:
+            deliveries: Keyword arguments of ``create_delivery`` for each delivery
+        
+        Raises:
+            ValueError: If one of the orders already has a delivery, in which
+                case none of the deliveries is created
+        """
+        created = [self._new_delivery(**delivery) for delivery in deliveries]
+        
+        with self._lock:
+            self._refresh_data()
+            order_ids = set()
+            for delivery in created:
+                if delivery.order_id in order_ids or self._find_delivery_by_order_id(delivery.order_id):
+                    raise ValueError(f'Delivery record already exists for order {delivery.order_id}')
+                order_ids.add(delivery.order_id)
+            for delivery in created:
+                self.deliveries[delivery.id] = delivery
+                self._order_index.add(delivery)
+                self._status_index.add(delivery)
+                self._time_index.add(delivery)
+            try:
+                if created:
+                    self._save_deliveries(created)
+            except Exception:
+                # E.g. rejected by the storage backend's own uniqueness check
+                for delivery in created:
+                    del self.deliveries[delivery.id]
+                    self._unindex(delivery)
+                raise
+        return created
+    
+    def remove_deliveries(self, delivery_ids: List[str]) -> int:
+        """Delete delivery records, persisted with a single save, to undo a failed batch
+        
+        Returns:
+            Number of deliveries removed; unknown ids are skipped
+        """
+        with self._lock:
+            removed = [self.deliveries.pop(delivery_id) for delivery_id in delivery_ids
+                       if delivery_id in self.deliveries]
+            if not removed:
+                return 0
+            for delivery in removed:
+                self._unindex(delivery)
+            self._archivable.difference_update(delivery.id for delivery in removed)
+            self.version = next(self._versions)
+            self.repository.save(self.deliveries, [delivery.id for delivery in removed])
+        return len(removed)
+    
+    def _unindex(self, delivery: Delivery):
+        """Drop a delivery from every index"""
+        self._order_index.remove(delivery)
+        self._status_index.remove(delivery)
+        self._time_index.remove(delivery)
+    
+    def _new_delivery(self, order_id: str, shipping_address: str,
+                      carrier: Optional[str] = None) -> Delivery:
+        """Build a delivery record in the preparing state"""
         delivery_id = str(uuid.uuid4())
         tracking_number = f"TRACK-{uuid.uuid4().hex[:12].upper()}"
         estimated_delivery = (datetime.now() + timedelta(days=5)).isoformat()
         
-        delivery = Delivery(
+        return Delivery(
             id=delivery_id,
             order_id=order_id,
             status='preparing',
@@ -79,20 +352,16 @@ class DeliveryService:
             estimated_delivery_date=estimated_delivery,
             created_at=datetime.now().isoformat()
         )
-        
-        self.deliveries[delivery_id] = delivery
-        self._save_data()
-        return delivery
     
     def update_delivery_status(self, delivery_id: str, status: str, 
                               notes: Optional[str] = None) -> Optional[Delivery]:
         """Update delivery status"""
-        delivery = self.deliveries.get(delivery_id)
+        delivery = self._find_delivery(delivery_id)
         if not delivery:
             return None
         
         delivery.update_status(status, notes)
-        self._save_data()
+        self._save_data(delivery)
         return delivery
     
     def update_delivery_by_order_id(self, order_id: str, status: str, 
@@ -106,11 +375,11 @@ class DeliveryService:
     
     def set_tracking(self, delivery_id: str, tracking_number: str, carrier: str) -> Optional[Delivery]:
         """Set tracking information for delivery"""
-        delivery = self.deliveries.get(delivery_id)
+        delivery = self._find_delivery(delivery_id)
         if not delivery:
             return None
         
         delivery.set_tracking(tracking_number, carrier)
-        self._save_data()
+        self._save_data(delivery)
         return delivery
 
@@ -0,0 +1,431 @@
+"""In-memory secondary indexes over service records
+
+Services keep their records in a dict keyed by id. An index maps another
+field of the records to their ids so lookups by that field do not scan
+every record. Services keep an index in step with their records by
+calling ``remove`` before a record changes and ``add`` afterwards. When
+only the id of a changed record is known, as after another instance
+changed it, ``discard`` drops whatever the index holds for that id.
+"""
+
+import bisect
+import re
+import threading
+from datetime import datetime
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+
+def normalize_isbn(isbn: str) -> str:
+    """Normalize an ISBN so that every way of writing it compares equal
+
+    Hyphens and spaces are dropped and ISBN-10s are converted to their
+    ISBN-13 form, so ``0-306-40615-2``, ``0306406152`` and
+    ``978-0-306-40615-7`` all normalize to ``9780306406157``. Anything that
+    is not a well-formed ISBN-10 is returned stripped and uppercased.
+    """
+    value = re.sub(r'[\s-]', '', isbn or '').upper()
+    if re.fullmatch(r'\d{9}[\dX]', value):
+        digits = '978' + value[:9]
+        check = (10 - sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10) % 10
+        return digits + str(check)
+    return value
+
+
+class UniqueIndex:
+    """Maps the key of each record to the id of the record holding it"""
+
+    def __init__(self, key: Callable[[Any], Optional[str]]):
+        """Initialize index with the function extracting a record's key"""
+        self.key = key
+        self._ids = {}  # key -> id
+        self._keys = {}  # id -> key it is indexed under
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def rebuild(self, records: Iterable[Any]):
+        """Index every record from scratch"""
+        ids = {}
+        keys = {}
+        for record in records:
+            key = self.key(record)
+            if key:
+                ids[key] = record.id
+                keys[record.id] = key
+        with self._lock:
+            self._ids = ids
+            self._keys = keys
+
+    def get(self, key: str) -> Optional[str]:
+        """Id of the record holding an already normalized key"""
+        return self._ids.get(key)
+
+    def add(self, record: Any):
+        """Index a record under its current key, in place of any key it had"""
+        key = self.key(record)
+        with self._lock:
+            self._discard(record.id)
+            if key:
+                self._ids[key] = record.id
+                self._keys[record.id] = key
+
+    def remove(self, record: Any):
+        """Drop a record's key, if it is indexed for this record"""
+        self.discard(record.id)
+
+    def discard(self, record_id: str):
+        """Drop the key of the record with this id, if it is indexed for it"""
+        with self._lock:
+            self._discard(record_id)
+
+    def _discard(self, record_id: str):
+        """Drop the key of the record with this id; the caller holds the lock"""
+        key = self._keys.pop(record_id, None)
+        if key is not None and self._ids.get(key) == record_id:
+            del self._ids[key]
+
+
+def normalize_email(email: str) -> str:
+    """Normalize an email address for lookups (surrounding spaces, case)"""
+    return (email or '').strip().lower()
+
+
+def normalize_category(category: str) -> str:
+    """Normalize a category for lookups (surrounding spaces, case)"""
+    return (category or '').strip().lower()
+
+
+def iso_timestamp(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds of an ISO 8601 time (naive times are local), None if it is not one"""
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _between(items: List[tuple], low: Any, high: Any, after: Optional[tuple] = None,
+             limit: Optional[int] = None, reverse: bool = False) -> List[tuple]:
+    """Entries of a sorted list of (value, id) with ``low <= value <= high``
+
+    None bounds are open. ``after`` skips the entries up to and including
+    that (value, id) entry, and ``limit`` caps the number returned, so a
+    listing can be paged through by passing the last entry of each page.
+    With ``reverse`` the entries come highest first, and ``after`` skips
+    those down to and including it.
+    """
+    start = 0 if low is None else bisect.bisect_left(items, low, key=itemgetter(0))
+    end = len(items) if high is None else bisect.bisect_right(items, high, key=itemgetter(0))
+    if reverse:
+        if after is not None:
+            end = min(end, bisect.bisect_left(items, after))
+        if limit is not None:
+            start = max(start, end - limit)
+        return items[start:end][::-1]
+    if after is not None:
+        start = max(start, bisect.bisect_right(items, after))
+    if limit is not None:
+        end = min(end, start + limit)
+    return items[start:end]
+
+
+class SortedIndex:
+    """Maps the key of each record to the ids of every record holding it
+
+    The ids of a key are kept ordered by a sort value of the records (such
+    as ``created_at``), so they can be paged through without sorting.
+    """
+
+    def __init__(self, key: Callable[[Any], Optional[str]], sort_key: Callable[[Any], Any]):
+        """Initialize index with the functions extracting a record's key and sort value"""
+        self.key = key
+        self.sort_key = sort_key
+        self._entries = {}  # key -> sorted list of (sort value, id)
+        self._keys = {}  # id -> (key, entry) it is indexed under
+        self._lock = threading.Lock()
+
+    def rebuild(self, records: Iterable[Any]):
+        """Index every record from scratch"""
+        entries = {}
+        keys = {}
+        for record in records:
+            key = self.key(record)
+            if key:
+                entry = (self.sort_key(record), record.id)
+                entries.setdefault(key, []).append(entry)
+                keys[record.id] = (key, entry)
+        for items in entries.values():
+            items.sort()
+        with self._lock:
+            self._entries = entries
+            self._keys = keys
+
+    def count(self, key: str) -> int:
+        """Number of records holding an already normalized key"""
+        return len(self._entries.get(key, ()))
+
+    def get(self, key: str, offset: int = 0, limit: Optional[int] = None,
+            reverse: bool = False) -> List[str]:
+        """Ids of the records holding an already normalized key, in sort order"""
+        with self._lock:
+            items = self._entries.get(key, [])
+            end = len(items) if limit is None else min(len(items), offset + limit)
+            if reverse:
+                # Index from the end rather than copying the list reversed
+                return [items[-1 - position][1] for position in range(offset, end)]
+            return [record_id for _, record_id in items[offset:end]]
+
+    def between(self, key: str, low: Any = None, high: Any = None) -> List[str]:
+        """Ids of the records holding a key whose sort value is within [low, high]"""
+        with self._lock:
+            return [record_id for _, record_id in _between(self._entries.get(key, []), low, high)]
+
+    def entries(self, key: str, low: Any = None, high: Any = None, after: Optional[tuple] = None,
+                limit: Optional[int] = None, reverse: bool = False) -> List[tuple]:
+        """(sort value, id) entries of a key within [low, high] following ``after``"""
+        with self._lock:
+            return _between(self._entries.get(key, []), low, high, after, limit, reverse)
+
+    def add(self, record: Any):
+        """Index a record under its current key, once, in place of any entry it had"""
+        key = self.key(record)
+        entry = (self.sort_key(record), record.id)
+        with self._lock:
+            if self._keys.get(record.id) == (key, entry):
+                return
+            self._discard(record.id)
+            if key:
+                bisect.insort(self._entries.setdefault(key, []), entry)
+                self._keys[record.id] = (key, entry)
+
+    def remove(self, record: Any):
+        """Drop a record from the index"""
+        self.discard(record.id)
+
+    def discard(self, record_id: str):
+        """Drop the entry of the record with this id"""
+        with self._lock:
+            self._discard(record_id)
+
+    def _discard(self, record_id: str):
+        """Drop the entry of the record with this id; the caller holds the lock"""
+        indexed = self._keys.pop(record_id, None)
+        if indexed is None:
+            return
+        key, entry = indexed
+        items = self._entries.get(key, [])
+        position = bisect.bisect_left(items, entry)
+        if position < len(items) and items[position] == entry:
+            del items[position]
+            if not items:
+                del self._entries[key]
+
+
+class RangeIndex:
+    """Keeps the ids of every record ordered by a sort value (such as a price)
+
+    Records whose sort value is None are not indexed.
+    """
+
+    def __init__(self, sort_key: Callable[[Any], Any]):
+        """Initialize index with the function extracting a record's sort value"""
+        self.sort_key = sort_key
+        self._entries = []  # Sorted list of (sort value, id)
+        self._values = {}  # id -> entry it is indexed under
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, record_id: str) -> bool:
+        return record_id in self._values
+
+    def rebuild(self, records: Iterable[Any]):
+        """Index every record from scratch"""
+        entries = [(self.sort_key(record), record.id) for record in records]
+        entries = sorted(entry for entry in entries if entry[0] is not None)
+        with self._lock:
+            self._entries = entries
+            self._values = {entry[1]: entry for entry in entries}
+
+    def between(self, low: Any = None, high: Any = None, reverse: bool = False) -> List[str]:
+        """Ids of the records whose sort value is within [low, high], in sort order"""
+        with self._lock:
+            ids = [record_id for _, record_id in _between(self._entries, low, high)]
+        return ids[::-1] if reverse else ids
+
+    def entries(self, low: Any = None, high: Any = None, after: Optional[tuple] = None,
+                limit: Optional[int] = None) -> List[tuple]:
+        """(sort value, id) entries within [low, high] following ``after``, in sort order"""
+        with self._lock:
+            return _between(self._entries, low, high, after, limit)
+
+    def add(self, record: Any):
+        """Index a record under its current sort value, once, in place of any entry it had"""
+        entry = (self.sort_key(record), record.id)
+        with self._lock:
+            if self._values.get(record.id) == entry:
+                return
+            self._discard(record.id)
+            if entry[0] is not None:
+                bisect.insort(self._entries, entry)
+                self._values[record.id] = entry
+
+    def remove(self, record: Any):
+        """Drop a record from the index"""
+        self.discard(record.id)
+
+    def discard(self, record_id: str):
+        """Drop the entry of the record with this id"""
+        with self._lock:
+            self._discard(record_id)
+
+    def _discard(self, record_id: str):
+        """Drop the entry of the record with this id; the caller holds the lock"""
+        entry = self._values.pop(record_id, None)
+        if entry is None:
+            return
+        position = bisect.bisect_left(self._entries, entry)
+        if position < len(self._entries) and self._entries[position] == entry:
+            del self._entries[position]
+
+
+class StatusIndex:
+    """Buckets the ids of records by the value of each of a few status fields
+
+    Records indexed with ``add`` (or handed to ``watch``) notify the index
+    when a status changes, so it moves them to their new bucket without the
+    service having to remove and re-add them. Given a sort key, each bucket
+    also keeps its ids ordered by the sort value of the records (those whose
+    sort value is None are left out), so a status can be paged through with
+    ``entries``.
+    """
+
+    def __init__(self, fields: Iterable[str], sort_key: Optional[Callable[[Any], Any]] = None):
+        """Initialize index over the given fields, optionally ordering each bucket by a sort value"""
+        self.fields = tuple(fields)
+        self.sort_key = sort_key
+        self._buckets = {field: {} for field in self.fields}  # field -> value -> {id: None}
+        self._sorted = {field: {} for field in self.fields}  # field -> value -> sorted list of (sort value, id)
+        self._entries = {}  # id -> (sort value, id) it is ordered by
+        self._lock = threading.Lock()
+
+    def rebuild(self, records: Iterable[Any]):
+        """Index every record from scratch"""
+        buckets = {field: {} for field in self.fields}
+        ordered = {field: {} for field in self.fields}
+        entries = {}
+        for record in records:
+            self.watch(record)
+            entry = self._entry(record)
+            if entry is not None:
+                entries[record.id] = entry
+            for field in self.fields:
+                value = getattr(record, field, None)
+                if value is not None:
+                    buckets[field].setdefault(value, {})[record.id] = None
+                    if entry is not None:
+                        ordered[field].setdefault(value, []).append(entry)
+        for values in ordered.values():
+            for items in values.values():
+                items.sort()
+        with self._lock:
+            self._buckets = buckets
+            self._sorted = ordered
+            self._entries = entries
+
+    def watch(self, record: Any):
+        """Follow status changes of a record (a no-op for records that cannot be watched)"""
+        watch = getattr(record, 'watch', None)
+        if watch is not None:
+            watch(self._moved)
+
+    def count(self, field: str, value: str) -> int:
+        """Number of records whose ``field`` equals ``value``"""
+        return len(self._buckets[field].get(value, ()))
+
+    def counts(self, field: str) -> Dict[str, int]:
+        """Number of records holding each value of ``field``"""
+        with self._lock:
+            return {value: len(ids) for value, ids in self._buckets[field].items() if ids}
+
+    def contains(self, field: str, value: str, record_id: str) -> bool:
+        """Whether the record's ``field`` equals ``value``"""
+        return record_id in self._buckets[field].get(value, ())
+
+    def get(self, field: str, value: str) -> List[str]:
+        """Ids of the records whose ``field`` equals ``value``, oldest entry first"""
+        with self._lock:
+            return list(self._buckets[field].get(value, ()))
+
+    def entries(self, field: str, value: str, low: Any = None, high: Any = None,
+                after: Optional[tuple] = None, limit: Optional[int] = None) -> List[tuple]:
+        """(sort value, id) entries of a status within [low, high] following ``after``"""
+        with self._lock:
+            return _between(self._sorted[field].get(value, []), low, high, after, limit)
+
+    def add(self, record: Any):
+        """Index a record under its current statuses and follow their changes"""
+        self.watch(record)
+        entry = self._entry(record)
+        with self._lock:
+            if entry is not None:
+                self._entries[record.id] = entry
+            for field in self.fields:
+                value = getattr(record, field, None)
+                if value is not None:
+                    self._put(field, value, record.id)
+
+    def remove(self, record: Any):
+        """Drop a record from the index"""
+        with self._lock:
+            for field in self.fields:
+                self._pop(field, getattr(record, field, None), record.id)
+            self._entries.pop(record.id, None)
+
+    def discard(self, record_id: str):
+        """Drop the record with this id from whichever buckets hold it"""
+        with self._lock:
+            for field, buckets in self._buckets.items():
+                for value in [value for value, ids in buckets.items() if record_id in ids]:
+                    self._pop(field, value, record_id)
+            self._entries.pop(record_id, None)
+
+    def _entry(self, record: Any) -> Optional[tuple]:
+        """(sort value, id) a record is ordered by, None if it is not ordered"""
+        if self.sort_key is None:
+            return None
+        value = self.sort_key(record)
+        return None if value is None else (value, record.id)
+
+    def _put(self, field: str, value: Any, record_id: str):
+        """Add an id to a bucket; the caller holds the lock"""
+        ids = self._buckets[field].setdefault(value, {})
+        if record_id in ids:
+            return
+        ids[record_id] = None
+        entry = self._entries.get(record_id)
+        if entry is not None:
+            bisect.insort(self._sorted[field].setdefault(value, []), entry)
+
+    def _pop(self, field: str, value: Any, record_id: str):
+        """Drop an id from a bucket, if it is there; the caller holds the lock"""
+        ids = self._buckets[field].get(value)
+        if ids is None or record_id not in ids:
+            return
+        del ids[record_id]
+        entry = self._entries.get(record_id)
+        items = self._sorted[field].get(value, [])
+        position = bisect.bisect_left(items, entry) if entry is not None else len(items)
+        if position < len(items) and items[position] == entry:
+            del items[position]
+
+    def _moved(self, record: Any, field: str, old: Any, new: Any):
+        """Observer of watched records: move the record to the bucket of its new status"""
+        if field not in self.fields:
+            return
+        with self._lock:
+            self._pop(field, old, record.id)
+            if new is not None:
+                self._put(field, new, record.id)
@@ -1,64 +1,229 @@
 """Inventory Service - Manages book stock and details"""
 
-import json
+import itertools
 import os
-from typing import List, Optional
-from pathlib import Path
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from operator import attrgetter
+from typing import Dict, List, Optional, Tuple
 from src.models.book import Book
+from src.services.indexes import RangeIndex, SortedIndex, UniqueIndex, normalize_category, normalize_isbn
+from src.services.pagination import collect_page
+from src.services.search import SearchIndex
+from src.storage.repository import create_repository
+
+# Fields the catalog can be sorted by; prefix with '-' for descending order
+SORT_FIELDS = ('price', 'title', 'author', 'created_at')
+
+
+def check_sort(sort: Optional[str]):
+    """Check a sort order given to ``find_books``
+
+    Raises:
+        ValueError: If it is not one of ``SORT_FIELDS``, optionally prefixed with '-'
+    """
+    field = (sort or '').lstrip('-')
+    if sort and field not in SORT_FIELDS:
+        raise ValueError(f'Cannot sort by {field}; use one of {", ".join(SORT_FIELDS)}')
 
 
 class InventoryService:
     """Service for managing inventory operations"""
     
-    def __init__(self, data_file: str = "data/books.json"):
-        """Initialize inventory service with data file path"""
+    def __init__(self, data_file: str = "data/books.json", backend: str = 'json',
+                 **storage_options):
+        """Initialize inventory service with data file path
+        
+        Args:
+            data_file: Path to the books JSON file
+            backend: Storage backend, one of ``json``, ``journal``, ``sqlite`` or ``jsonl``
+            **storage_options: Backend specific options, see ``create_repository``
+        """
         self.data_file = data_file
-        self._ensure_data_file()
+        # Serializes check-and-update of stock across request threads
+        self._lock = threading.RLock()
+        self._isbn_index = UniqueIndex(lambda book: normalize_isbn(book.isbn))
+        self._search_index = SearchIndex()  # Title, author, description and category terms
+        # Book ids of each category ordered by price, and of the whole catalog by price
+        self._category_index = SortedIndex(lambda book: normalize_category(book.category),
+                                           lambda book: book.price)
+        self._price_index = RangeIndex(lambda book: book.price)
+        # Book ids with stock left, by price
+        self._in_stock_index = RangeIndex(lambda book: book.price if book.stock_quantity > 0 else None)
+        # Version of the catalog as a whole, bumped on every change; starting
+        # from the clock keeps it increasing across restarts
+        self._versions = itertools.count(time.time_ns())
+        self.version = next(self._versions)
+        self.repository = create_repository(
+            backend, data_file, Book.from_dict,
+            table='books', indexed_fields=('isbn',), **storage_options
+        )
         self._load_data()
     
-    def _ensure_data_file(self):
-        """Ensure data directory and file exist"""
-        data_path = Path(self.data_file)
-        data_path.parent.mkdir(parents=True, exist_ok=True)
-        if not data_path.exists():
-            # Initialize with empty list
-            with open(self.data_file, 'w') as f:
-                json.dump([], f)
-    
     def _load_data(self):
-        """Load books from JSON file"""
-        try:
-            with open(self.data_file, 'r') as f:
-                data = json.load(f)
-                self.books = {book['id']: Book.from_dict(book) for book in data}
-        except (FileNotFoundError, json.JSONDecodeError):
-            self.books = {}
-    
-    def _save_data(self):
-        """Save books to JSON file"""
-        with open(self.data_file, 'w') as f:
-            books_list = [book.to_dict() for book in self.books.values()]
-            json.dump(books_list, f, indent=2)
+        """Load books from the repository"""
+        self.books = self.repository.load()
+        self._isbn_index.rebuild(self.books.values())
+        self._search_index.rebuild(self.books.values())
+        self._category_index.rebuild(self.books.values())
+        self._price_index.rebuild(self.books.values())
+        self._in_stock_index.rebuild(self.books.values())
+    
+    def _index_book(self, book: Book):
+        """Add a book to the secondary indexes"""
+        self._isbn_index.add(book)
+        self._search_index.add(book)
+        self._category_index.add(book)
+        self._price_index.add(book)
+        self._index_stock(book)
+    
+    def _unindex_book(self, book: Book):
+        """Drop a book from the indexes keyed by fields it is about to change"""
+        self._isbn_index.remove(book)
+        self._category_index.remove(book)
+        self._price_index.remove(book)
+    
+    def _index_stock(self, book: Book):
+        """Track whether a book has stock left"""
+        self._in_stock_index.add(book)
+    
+    def commit_future(self) -> Future:
+        """Get a future resolved once every change made so far is persisted"""
+        return self.repository.commit_future()
+    
+    def flush(self):
+        """Wait until every change made so far is persisted"""
+        self.repository.flush()
+    
+    def _save_data(self, book: Optional[Book] = None):
+        """Persist the changed book, or every book if none is given"""
+        self._save_books([book] if book is not None else None)
+    
+    def _save_books(self, books: Optional[List[Book]]):
+        """Persist the changed books with a single save, or every book if None"""
+        self.version = next(self._versions)
+        self.repository.save(self.books, [book.id for book in books] if books is not None else None)
     
     def get_all_books(self) -> List[Book]:
         """Get all books in inventory"""
         return list(self.books.values())
     
+    def find_books(self, category: Optional[str] = None, min_price: Optional[float] = None,
+                   max_price: Optional[float] = None, in_stock: bool = False,
+                   sort: Optional[str] = None) -> List[Book]:
+        """Get the books matching every given filter
+        
+        Candidates come from the most selective index available (category,
+        then price, then stock), so books outside the result set are not
+        looked at.
+        
+        Args:
+            category: Category, matched case-insensitively
+            min_price: Lowest price, inclusive
+            max_price: Highest price, inclusive
+            in_stock: Only books with stock left
+            sort: One of ``SORT_FIELDS``, prefixed with '-' for descending
+                order; by default books matched on category, price or stock
+                come cheapest first and the others in catalog order
+        
+        Returns:
+            Matching books
+        
+        Raises:
+            ValueError: If the sort order is invalid
+        """
+        check_sort(sort)
+        field = (sort or '').lstrip('-')
+        
+        by_price = True
+        if category is not None:
+            book_ids = self._category_index.between(normalize_category(category), min_price, max_price)
+        elif min_price is not None or max_price is not None:
+            book_ids = self._price_index.between(min_price, max_price)
+        elif in_stock:
+            book_ids = self._in_stock_index.between()
+        else:
+            book_ids, by_price = list(self.books), False
+        
+        books = [self.books.get(book_id) for book_id in book_ids]
+        books = [book for book in books if book and (not in_stock or book.stock_quantity > 0)]
+        if sort:
+            descending = sort.startswith('-')
+            if field == 'price' and by_price:
+                return books[::-1] if descending else books
+            # Books missing the field go last either way
+            present = [book for book in books if getattr(book, field) is not None]
+            present.sort(key=attrgetter(field), reverse=descending)
+            books = present + [book for book in books if getattr(book, field) is None]
+        return books
+    
+    def get_books_page(self, limit: int, cursor: Optional[str] = None,
+                       category: Optional[str] = None, min_price: Optional[float] = None,
+                       max_price: Optional[float] = None,
+                       in_stock: bool = False) -> Tuple[List[Book], Optional[str]]:
+        """Get a page of the books matching every given filter, cheapest first
+        
+        Pages are read from the category, in-stock or price index starting
+        right after the cursor, so a page costs the same however deep it is.
+        
+        Returns:
+            (books on the page, cursor of the next page or None)
+        
+        Raises:
+            ValueError: If the cursor is invalid
+        """
+        def fetch(after, count):
+            if category is not None:
+                return self._category_index.entries(normalize_category(category), min_price,
+                                                    max_price, after, count)
+            if in_stock:
+                return self._in_stock_index.entries(min_price, max_price, after, count)
+            return self._price_index.entries(min_price, max_price, after, count)
+        
+        book_ids, next_cursor = collect_page(
+            fetch, limit, cursor,
+            accept=(lambda book_id: book_id in self._in_stock_index) if in_stock and category is not None else None
+        )
+        books = [self.books.get(book_id) for book_id in book_ids]
+        return [book for book in books if book], next_cursor
+    
     def get_book_by_id(self, book_id: str) -> Optional[Book]:
         """Get a book by its ID"""
         return self.books.get(book_id)
     
+    def get_books_by_ids(self, book_ids: List[str]) -> Dict[str, Optional[Book]]:
+        """Get the book of each ID, None for unknown IDs"""
+        return {book_id: self.books.get(book_id) for book_id in book_ids}
+    
     def get_book_by_isbn(self, isbn: str) -> Optional[Book]:
-        """Get a book by its ISBN"""
-        for book in self.books.values():
-            if book.isbn == isbn:
-                return book
-        return None
+        """Get a book by its ISBN, written with or without hyphens, as ISBN-10 or ISBN-13"""
+        book_id = self._isbn_index.get(normalize_isbn(isbn))
+        return self.books.get(book_id) if book_id else None
+    
+    def get_books_by_isbns(self, isbns: List[str]) -> Dict[str, Optional[Book]]:
+        """Get the book of each ISBN, None for unknown ISBNs"""
+        return {isbn: self.get_book_by_isbn(isbn) for isbn in isbns}
+    
+    def search_books(self, query: str, limit: int = 20) -> List[Book]:
+        """Search title, author, description and category, best matches first
+        
+        Every word of the query must match; a word also matches the terms
+        it is a prefix of.
+        """
+        books = [self.books.get(book_id) for book_id, _ in self._search_index.search(query, limit)]
+        return [book for book in books if book]
     
     def add_book(self, book: Book) -> Book:
         """Add a new book to inventory"""
-        self.books[book.id] = book
-        self._save_data()
+        with self._lock:
+            previous = self.books.get(book.id)
+            if previous:
+                self._unindex_book(previous)
+            self.books[book.id] = book
+            self._index_book(book)
+        self._save_data(book)
         return book
     
     def update_book(self, book_id: str, **kwargs) -> Optional[Book]:
@@ -67,23 +232,28 @@ class InventoryService:
         if not book:
             return None
         
-        for key, value in kwargs.items():
-            if hasattr(book, key):
-                setattr(book, key, value)
+        with self._lock:
+            self._unindex_book(book)
+            for key, value in kwargs.items():
+                if hasattr(book, key):
+                    setattr(book, key, value)
+            self._index_book(book)
         
         book.updated_at = __import__('datetime').datetime.now().isoformat()
-        self._save_data()
+        self._save_data(book)
         return book
     
     def update_stock(self, book_id: str, quantity: int) -> tuple[bool, Optional[Book]]:
         """Update stock quantity. Returns (success, book)"""
-        book = self.books.get(book_id)
-        if not book:
-            return False, None
-        
-        success = book.update_stock(quantity)
-        if success:
-            self._save_data()
+        with self._lock:
+            book = self.books.get(book_id)
+            if not book:
+                return False, None
+            
+            success = book.update_stock(quantity)
+            if success:
+                self._index_stock(book)
+                self._save_data(book)
         return success, book
     
     def check_stock(self, book_id: str, quantity: int = 1) -> bool:
@@ -100,4 +270,104 @@ class InventoryService:
     def restore_stock(self, book_id: str, quantity: int) -> bool:
         """Restore stock (increase by quantity). Returns True if successful."""
         return self.update_stock(book_id, quantity)[0]
+    
+    def reserve_stock_batch(self, reservations: List[List[Tuple[str, int]]]) -> List[bool]:
+        """Reserve stock for many orders, persisted with a single save
+        
+        The items of an order are reserved all together or not at all.
+        Orders are served in the given sequence, so when a book runs out
+        the earlier orders get it.
+        
+        Args:
+            reservations: (book ID, quantity) pairs of each order
+        
+        Returns:
+            Whether the stock of each order was reserved
+        """
+        results = []
+        changed = {}
+        with self._lock:
+            for items in reservations:
+                needed = Counter()
+                for book_id, quantity in items:
+                    needed[book_id] += quantity
+                books = [self.books.get(book_id) for book_id in needed]
+                reserved = all(book is not None and book.is_available(needed[book.id]) for book in books)
+                if reserved:
+                    for book in books:
+                        book.update_stock(-needed[book.id])
+                        changed[book.id] = book
+                results.append(reserved)
+            for book in changed.values():
+                self._index_stock(book)
+            if changed:
+                self._save_books(list(changed.values()))
+        return results
+    
+    def adjust_stock_bulk(self, adjustments: List[dict], atomic: bool = True) -> List[Optional[str]]:
+        """Apply many stock adjustments, persisted with a single save
+        
+        Each adjustment names a ``book_id`` (or an ``isbn``, written any way
+        ``get_book_by_isbn`` accepts) and either a ``delta`` to add to the stock or the absolute ``quantity`` counted. With
+        ``expected_quantity`` it only applies if the stock still has that
+        value, so a count taken while orders came in does not overwrite
+        them. Adjustments of the same book apply one after another.
+        
+        Args:
+            adjustments: Adjustments in the order they apply
+            atomic: Apply none of them if any conflicts; otherwise apply
+                all the others
+        
+        Returns:
+            Conflict of each adjustment, None for those without one
+        """
+        conflicts = []
+        with self._lock:
+            stock = {}  # Stock of each adjusted book after the adjustments so far
+            for adjustment in adjustments:
+                if 'book_id' in adjustment:
+                    book = self.books.get(adjustment['book_id'])
+                    missing = f'No book found: {adjustment["book_id"]}'
+                else:
+                    book = self.get_book_by_isbn(adjustment['isbn'])
+                    missing = f'No book found with ISBN: {adjustment["isbn"]}'
+                if not book:
+                    conflicts.append(missing)
+                    continue
+                current = stock.get(book.id, book.stock_quantity)
+                expected = adjustment.get('expected_quantity')
+                if expected is not None and expected != current:
+                    conflicts.append(f'Expected stock {expected}, found {current}')
+                    continue
+                quantity = current + adjustment['delta'] if 'delta' in adjustment else adjustment['quantity']
+                if quantity < 0:
+                    conflicts.append(f'Stock cannot go below 0, found {current}')
+                    continue
+                stock[book.id] = quantity
+                conflicts.append(None)
+            
+            if atomic and any(conflicts):
+                return conflicts
+            changed = []
+            for book_id, quantity in stock.items():
+                book = self.books[book_id]
+                book.update_stock(quantity - book.stock_quantity)
+                self._index_stock(book)
+                changed.append(book)
+            if changed:
+                self._save_books(changed)
+        return conflicts
+    
+    def restore_stock_batch(self, items: List[Tuple[str, int]]):
+        """Give back (book ID, quantity) pairs of stock, persisted with a single save"""
+        changed = {}
+        with self._lock:
+            for book_id, quantity in items:
+                book = self.books.get(book_id)
+                if book and book.update_stock(quantity):
+                    changed[book.id] = book
+            for book in changed.values():
+                self._index_stock(book)
+            if changed:
+                self._save_books(list(changed.values()))
 
@@ -0,0 +1,74 @@
+"""Cursor pagination over index-ordered listings
+
+Listings are paged in the order of an index holding (sort value, id)
+entries. A cursor is the opaque encoding of the last entry of a page, and
+the next page starts right after it with a bisect into the index. Fetching
+a deep page therefore costs the same as fetching the first, and pages stay
+stable while records are added or removed elsewhere in the listing.
+"""
+
+import base64
+import binascii
+import json
+from typing import Callable, List, Optional, Tuple
+
+# fetch(after, count) returns up to ``count`` index entries following ``after``
+Fetch = Callable[[Optional[tuple], int], List[tuple]]
+
+
+def encode_cursor(entry: tuple) -> str:
+    """Encode an index entry as an opaque, URL-safe cursor"""
+    data = json.dumps(list(entry), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decode a cursor back into the index entry it stands for
+
+    Raises:
+        ValueError: If the cursor was not produced by ``encode_cursor``
+    """
+    try:
+        entry = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        entry = None
+    if (not isinstance(entry, list) or len(entry) != 2 or not isinstance(entry[1], str)
+            or not isinstance(entry[0], (int, float, str))):
+        raise ValueError('Invalid cursor')
+    return tuple(entry)
+
+
+def collect_page(fetch: Fetch, limit: int, cursor: Optional[str] = None,
+                 accept: Optional[Callable[[str], bool]] = None) -> Tuple[List[str], Optional[str]]:
+    """Collect one page of record ids from an index
+
+    Args:
+        fetch: Reads index entries following a given entry
+        limit: Page size
+        cursor: Cursor returned with the previous page (None for the first)
+        accept: Keeps only the ids it returns True for, for filters the
+            index does not cover
+
+    Returns:
+        (ids on the page, cursor of the next page or None on the last page)
+
+    Raises:
+        ValueError: If the cursor is invalid
+    """
+    after = decode_cursor(cursor) if cursor else None
+    page = []
+    while True:
+        # Read one entry past the page to know whether another page follows
+        count = limit + 1 - len(page) if accept is None else max(limit + 1, 100)
+        try:
+            entries = fetch(after, count)
+        except TypeError:
+            raise ValueError('Invalid cursor') from None  # Sort value of another listing
+        for entry in entries:
+            if accept is None or accept(entry[1]):
+                page.append(entry)
+                if len(page) > limit:
+                    return [record_id for _, record_id in page[:limit]], encode_cursor(page[limit - 1])
+        if len(entries) < count:
+            return [record_id for _, record_id in page], None
+        after = entries[-1]
@@ -1,61 +1,392 @@
 """Sales Service - Tracks customer orders and payments"""
 
-import json
+import itertools
 import os
-from typing import List, Optional
-from pathlib import Path
+from concurrent.futures import Future
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from datetime import datetime
+import time
 import uuid
 from src.models.order import Order, OrderItem
+from src.services.indexes import RangeIndex, SortedIndex, StatusIndex, iso_timestamp, normalize_email
+from src.services.pagination import collect_page
+from src.storage.archive import Archive
+from src.storage.durability import DEFAULT_DURABILITY
+from src.storage.repository import create_repository
+
+# Orders in these states no longer change and are moved to the archive
+ARCHIVED_STATUSES = ('delivered', 'cancelled')
 
 
 class SalesService:
     """Service for managing sales operations"""
     
-    def __init__(self, data_file: str = "data/orders.json"):
-        """Initialize sales service with data file path"""
+    def __init__(self, data_file: str = "data/orders.json", backend: str = 'json',
+                 archive_dir: Optional[str] = None, archive_batch: int = 100,
+                 **storage_options):
+        """Initialize sales service with data file path
+        
+        Args:
+            data_file: Path to the orders JSON file
+            backend: Storage backend, one of ``json``, ``journal``, ``sqlite`` or ``jsonl``
+            archive_dir: Directory of the archive for delivered and cancelled
+                orders (None keeps every order in the working set)
+            archive_batch: Archive as soon as this many orders are delivered
+                or cancelled
+            **storage_options: Backend specific options, see ``create_repository``
+        """
         self.data_file = data_file
-        self._ensure_data_file()
+        # Order ids of each customer, oldest first, covering archived orders too
+        self._customer_index = SortedIndex(lambda order: normalize_email(order.customer_email),
+                                           lambda order: order.created_at or '')
+        # Order ids by status and by payment status, covering archived orders too,
+        # each bucket also ordered by creation time for paging
+        self._status_index = StatusIndex(('status', 'payment_status'),
+                                         lambda order: iso_timestamp(order.created_at))
+        # Order ids by creation time as epoch seconds, covering archived orders too
+        self._time_index = RangeIndex(lambda order: iso_timestamp(order.created_at))
+        self.repository = create_repository(
+            backend, data_file, Order.from_dict,
+            table='orders', indexed_fields=('status', 'customer_email'), **storage_options
+        )
+        self.archive = None
+        if archive_dir:
+            self.archive = Archive(archive_dir, Order.from_dict,
+                                   key_fields=('customer_email', 'created_at', 'status',
+                                               'payment_status'),
+                                   durability=storage_options.get('durability', DEFAULT_DURABILITY))
+        self.archive_batch = archive_batch
+        self._archivable = set()  # Delivered or cancelled orders not archived yet
+        # Version of the order list as a whole, bumped on every change seen;
+        # starting from the clock keeps it increasing across restarts
+        self._versions = itertools.count(time.time_ns())
+        self.version = next(self._versions)
         self._load_data()
     
-    def _ensure_data_file(self):
-        """Ensure data directory and file exist"""
-        data_path = Path(self.data_file)
-        data_path.parent.mkdir(parents=True, exist_ok=True)
-        if not data_path.exists():
-            with open(self.data_file, 'w') as f:
-                json.dump([], f)
-    
     def _load_data(self):
-        """Load orders from JSON file"""
-        try:
-            with open(self.data_file, 'r') as f:
-                data = json.load(f)
-                self.orders = {order['id']: Order.from_dict(order) for order in data}
-        except (FileNotFoundError, json.JSONDecodeError):
-            self.orders = {}
-    
-    def _save_data(self):
-        """Save orders to JSON file"""
-        with open(self.data_file, 'w') as f:
-            orders_list = [order.to_dict() for order in self.orders.values()]
-            json.dump(orders_list, f, indent=2)
-    
-    def get_all_orders(self) -> List[Order]:
-        """Get all orders"""
+        """Load orders from the repository"""
+        self.orders = self.repository.load()
+        self._rebuild_indexes()
+    
+    def _refresh_data(self):
+        """Pick up changes written by other service instances"""
+        refresh = self.repository.refresh(self.orders)
+        if refresh.outcome == 'hits':
+            return
+        if refresh.changed is None:
+            self._rebuild_indexes()
+        else:
+            self._reindex(refresh.changed)
+        self.version = next(self._versions)
+    
+    def _reindex(self, order_ids: Iterable[str]):
+        """Update the index entries of the given orders only, wherever they now live"""
+        for order_id in order_ids:
+            order = self.orders.get(order_id)
+            if order is None and self.archive is not None:
+                order = self.archive.key_record(order_id)
+            for index in (self._customer_index, self._status_index, self._time_index):
+                index.discard(order_id)
+                if order is not None:
+                    index.add(order)
+    
+    def _rebuild_indexes(self):
+        """Index the working set and the key fields of archived orders"""
+        records = list(self.orders.values())
+        if self.archive is not None:
+            records.extend(record for record in self.archive.key_records()
+                           if record.id not in self.orders)
+        self._customer_index.rebuild(records)
+        self._status_index.rebuild(records)
+        self._time_index.rebuild(records)
+    
+    def current_version(self) -> int:
+        """Pick up outside changes, then get the version of the orders"""
+        self._refresh_data()
+        return self.version
+    
+    def get_cache_stats(self) -> dict:
+        """Get hit/miss counters of the read cache"""
+        return self.repository.stats.to_dict()
+    
+    def commit_future(self) -> Future:
+        """Get a future resolved once every change made so far is persisted"""
+        return self.repository.commit_future()
+    
+    def flush(self):
+        """Wait until every change made so far is persisted"""
+        self.repository.flush()
+    
+    def _save_data(self, order: Optional[Order] = None):
+        """Persist the changed order, or every order if none is given"""
+        self._save_orders([order] if order is not None else None)
+    
+    def _save_orders(self, orders: Optional[List[Order]]):
+        """Persist the changed orders with a single save, or every order if None"""
+        for order in orders or ():
+            if order.id not in self.orders:
+                self.orders[order.id] = order  # Changed after it was archived
+        self.version = next(self._versions)
+        self.repository.save(self.orders, [order.id for order in orders] if orders is not None else None)
+        if self.archive is not None and orders:
+            self._archivable.update(order.id for order in orders if order.status in ARCHIVED_STATUSES)
+            if len(self._archivable) >= self.archive_batch:
+                self._archive_orders(list(self._archivable))
+    
+    def _find_order(self, order_id: str) -> Optional[Order]:
+        """Get an order from the working set, falling back to the archive"""
+        order = self.orders.get(order_id)
+        if order is None and self.archive is not None:
+            order = self.archive.get(order_id)
+        if order is not None:
+            self._status_index.watch(order)
+        return order
+    
+    def archive_completed_orders(self) -> int:
+        """Move every delivered or cancelled order to the archive
+        
+        Returns:
+            Number of orders archived
+        """
+        if self.archive is None:
+            return 0
+        self._refresh_data()
+        return self._archive_orders(
+            [order.id for order in list(self.orders.values()) if order.status in ARCHIVED_STATUSES]
+        )
+    
+    def _archive_orders(self, order_ids: List[str]) -> int:
+        """Write orders to the archive, then drop them from the working set"""
+        orders = [self.orders[order_id] for order_id in order_ids
+                  if order_id in self.orders and self.orders[order_id].status in ARCHIVED_STATUSES]
+        self.archive.add([order.to_dict() for order in orders])
+        for order in orders:
+            del self.orders[order.id]
+        self.repository.save(self.orders, [order.id for order in orders])
+        self._archivable.difference_update(order_ids)
+        return len(orders)
+    
+    def get_all_orders(self, include_archived: bool = True) -> List[Order]:
+        """Get all orders, including archived ones unless told otherwise"""
         # Reload data to ensure we have the latest
-        self._load_data()
-        return list(self.orders.values())
+        self._refresh_data()
+        orders = list(self.orders.values())
+        if self.archive is not None and include_archived:
+            orders.extend(order for order in self.archive.records() if order.id not in self.orders)
+        return orders
+    
+    def export_orders(self, since: Optional[datetime] = None) -> Iterator[dict]:
+        """Iterate over every order as a dict, archived ones included, for streaming exports
+        
+        Orders are read from storage as they are consumed, without building
+        Order objects where the backend does not hold them in memory.
+        
+        Args:
+            since: Only orders created or last updated at or after this time
+        """
+        self._refresh_data()
+        after = since.timestamp() if since else None
+        records = self.repository.export(self.orders)
+        if self.archive is not None:
+            records = itertools.chain(records, (record for record in self.archive.export()
+                                                if record['id'] not in self.orders))
+        for record in records:
+            if after is None or (iso_timestamp(record.get('updated_at') or record.get('created_at'))
+                                 or 0) >= after:
+                yield record
+    
+    def find_orders(self, status: Optional[str] = None, payment_status: Optional[str] = None,
+                    created_from: Optional[datetime] = None,
+                    created_to: Optional[datetime] = None) -> List[Order]:
+        """Get the orders matching every given filter, archived ones included
+        
+        Candidates come from the time index when a creation time range is
+        given (and are then returned oldest first), otherwise from the
+        status indexes, so the cost follows the number of matching orders.
+        
+        Args:
+            status: Order status
+            payment_status: Payment status
+            created_from: Earliest creation time, inclusive
+            created_to: Latest creation time, inclusive
+        """
+        self._refresh_data()
+        filters = [(field, value) for field, value in
+                   (('status', status), ('payment_status', payment_status)) if value is not None]
+        if created_from is not None or created_to is not None:
+            order_ids = self._time_index.between(
+                created_from.timestamp() if created_from else None,
+                created_to.timestamp() if created_to else None
+            )
+        elif filters:
+            field, value = filters.pop(0)
+            order_ids = self._status_index.get(field, value)
+        else:
+            return self.get_all_orders()
+        for field, value in filters:
+            matching = set(self._status_index.get(field, value))
+            order_ids = [order_id for order_id in order_ids if order_id in matching]
+        orders = [self._find_order(order_id) for order_id in order_ids]
+        return [order for order in orders if order]
+    
+    def get_orders_page(self, limit: int, cursor: Optional[str] = None,
+                        status: Optional[str] = None, payment_status: Optional[str] = None,
+                        created_from: Optional[datetime] = None,
+                        created_to: Optional[datetime] = None) -> Tuple[List[Order], Optional[str]]:
+        """Get a page of the orders matching every given filter, oldest first
+        
+        Pages are read from the time index, or from the smallest of the
+        status buckets filtered on, starting right after the cursor, so a
+        page costs the same however deep it is.
+        
+        Args:
+            limit: Page size
+            cursor: Cursor returned with the previous page (None for the first)
+            status, payment_status, created_from, created_to: Filters, as
+                for ``find_orders``
+        
+        Returns:
+            (orders on the page, cursor of the next page or None)
+        
+        Raises:
+            ValueError: If the cursor is invalid
+        """
+        self._refresh_data()
+        filters = [(field, value) for field, value in
+                   (('status', status), ('payment_status', payment_status)) if value is not None]
+        filters.sort(key=lambda status_filter: self._status_index.count(*status_filter))
+        low = created_from.timestamp() if created_from else None
+        high = created_to.timestamp() if created_to else None
+        
+        def fetch(after, count):
+            if filters:
+                field, value = filters[0]
+                return self._status_index.entries(field, value, low, high, after, count)
+            return self._time_index.entries(low, high, after, count)
+        
+        order_ids, next_cursor = collect_page(
+            fetch, limit, cursor,
+            accept=(lambda order_id: all(self._status_index.contains(field, value, order_id)
+                                         for field, value in filters[1:])) if len(filters) > 1 else None
+        )
+        orders = [self._find_order(order_id) for order_id in order_ids]
+        return [order for order in orders if order], next_cursor
+    
+    def get_status_counts(self) -> dict:
+        """Get the number of orders in each status and each payment status"""
+        self._refresh_data()
+        return {field: self._status_index.counts(field) for field in self._status_index.fields}
+    
+    def get_orders_by_customer(self, customer_email: str, offset: int = 0,
+                               limit: Optional[int] = None,
+                               newest_first: bool = True) -> Tuple[List[Order], int]:
+        """Get a page of a customer's orders, archived ones included
+        
+        Args:
+            customer_email: Email address, matched case-insensitively
+            offset: Number of orders to skip
+            limit: Largest number of orders to return (None for all)
+            newest_first: Order by created_at descending instead of ascending
+        
+        Returns:
+            (orders on the page, total number of orders of the customer)
+        """
+        self._refresh_data()
+        email = normalize_email(customer_email)
+        order_ids = self._customer_index.get(email, offset, limit, reverse=newest_first)
+        orders = [self._find_order(order_id) for order_id in order_ids]
+        return [order for order in orders if order], self._customer_index.count(email)
+    
+    def get_customer_orders_page(self, customer_email: str, limit: int, cursor: Optional[str] = None,
+                                 newest_first: bool = True) -> Tuple[List[Order], Optional[str]]:
+        """Get a page of a customer's orders, archived ones included
+        
+        Pages are read from the customer index starting right after the
+        cursor, so a page costs the same however deep it is.
+        
+        Args:
+            customer_email: Email address, matched case-insensitively
+            limit: Page size
+            cursor: Cursor returned with the previous page (None for the first)
+            newest_first: Order by created_at descending instead of ascending
+        
+        Returns:
+            (orders on the page, cursor of the next page or None)
+        
+        Raises:
+            ValueError: If the cursor is invalid
+        """
+        self._refresh_data()
+        email = normalize_email(customer_email)
+        order_ids, next_cursor = collect_page(
+            lambda after, count: self._customer_index.entries(email, after=after, limit=count,
+                                                              reverse=newest_first),
+            limit, cursor
+        )
+        orders = [self._find_order(order_id) for order_id in order_ids]
+        return [order for order in orders if order], next_cursor
     
     def get_order_by_id(self, order_id: str) -> Optional[Order]:
-        """Get an order by its ID"""
+        """Get an order by its ID, falling back to the archive"""
         # Reload data to ensure we have the latest
-        self._load_data()
-        return self.orders.get(order_id)
+        self._refresh_data()
+        return self._find_order(order_id)
+    
+    def get_orders_by_ids(self, order_ids: List[str]) -> Dict[str, Optional[Order]]:
+        """Get the order of each ID, None for unknown IDs, reloading the data once"""
+        self._refresh_data()
+        return {order_id: self._find_order(order_id) for order_id in order_ids}
     
     def create_order(self, customer_name: str, customer_email: str, 
                     items: List[dict], shipping_address: Optional[str] = None) -> Order:
         """Create a new order"""
+        order = self._new_order(customer_name, customer_email, items, shipping_address)
+        self._save_data(order)
+        return order
+    
+    def create_orders(self, orders: List[dict], pay: bool = False) -> List[Order]:
+        """Create many orders, persisted with a single save
+        
+        Args:
+            orders: Keyword arguments of ``create_order`` for each order
+            pay: Also pay every order, as ``process_payment`` does
+        """
+        created = [self._new_order(pay=pay, **order) for order in orders]
+        try:
+            if created:
+                self._save_orders(created)
+        except Exception:
+            for order in created:
+                del self.orders[order.id]
+                self._unindex(order)
+            raise
+        return created
+    
+    def remove_orders(self, order_ids: List[str]) -> int:
+        """Delete orders, persisted with a single save, to undo a failed batch
+        
+        Returns:
+            Number of orders removed; unknown ids are skipped
+        """
+        removed = [self.orders.pop(order_id) for order_id in order_ids if order_id in self.orders]
+        if not removed:
+            return 0
+        for order in removed:
+            self._unindex(order)
+        self._archivable.difference_update(order.id for order in removed)
+        self.version = next(self._versions)
+        self.repository.save(self.orders, [order.id for order in removed])
+        return len(removed)
+    
+    def _unindex(self, order: Order):
+        """Drop an order from every index"""
+        self._customer_index.remove(order)
+        self._status_index.remove(order)
+        self._time_index.remove(order)
+    
+    def _new_order(self, customer_name: str, customer_email: str, items: List[dict],
+                   shipping_address: Optional[str] = None, pay: bool = False) -> Order:
+        """Build an order, optionally paid, and index it without saving it"""
         order_id = str(uuid.uuid4())
         order_items = []
         
@@ -82,41 +413,49 @@ class SalesService:
             created_at=datetime.now().isoformat(),
             shipping_address=shipping_address
         )
+        if pay:
+            self._pay(order)
         
         self.orders[order_id] = order
-        self._save_data()
+        self._customer_index.add(order)
+        self._status_index.add(order)
+        self._time_index.add(order)
         return order
     
     def process_payment(self, order_id: str, payment_method: str = "credit_card") -> tuple[bool, Optional[str], Optional[Order]]:
         """Process payment for an order. Returns (success, payment_id, order)"""
-        order = self.orders.get(order_id)
+        order = self._find_order(order_id)
         if not order:
             return False, None, None
         
         if order.payment_status == 'paid':
             return False, None, order  # Already paid
         
+        payment_id = self._pay(order)
+        self._save_data(order)
+        return True, payment_id, order
+    
+    def _pay(self, order: Order) -> str:
+        """Mark an order paid and processing, returning the payment ID"""
         # Simulate payment processing
         payment_id = f"PAY-{uuid.uuid4().hex[:8].upper()}"
         order.update_payment_status('paid', payment_id)
         order.update_status('processing')
-        
-        self._save_data()
-        return True, payment_id, order
+        return payment_id
     
     def update_order_status(self, order_id: str, status: str) -> Optional[Order]:
         """Update order status"""
-        order = self.orders.get(order_id)
+        order = self._find_order(order_id)
         if not order:
             return None
         
         order.update_status(status)
-        self._save_data()
+        self._save_data(order)
         return order
     
     def cancel_order(self, order_id: str) -> bool:
         """Cancel an order"""
-        order = self.orders.get(order_id)
+        order = self._find_order(order_id)
         if not order:
             return False
         
@@ -127,6 +466,6 @@ class SalesService:
         if order.payment_status == 'paid':
             order.update_payment_status('refunded')
         
-        self._save_data()
+        self._save_data(order)
         return True
 
@@ -0,0 +1,219 @@
+"""Full-text search over the book catalog
+
+An inverted index maps every term of a book's title, author, description
+and category to the books containing it, weighted by the field it appears
+in. Terms are also kept in a sorted list so that a query word matches every
+term it is a prefix of ("prog" finds "programming"). Books are re-indexed
+one at a time as they are added or updated.
+
+The books of a term are grouped by their weight, so a query reads them best
+first and stops once no unread book can make the top results. Queries of
+several words also give up after scoring ``MAX_CANDIDATES`` books, so a
+query on words shared by much of the catalog costs about the same as one on
+rare words.
+"""
+
+import bisect
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Tuple
+
+# Weight of a term occurring in each field
+FIELD_WEIGHTS = {'title': 3.0, 'author': 2.0, 'category': 1.5, 'description': 1.0}
+
+# Words too common to be worth indexing
+STOPWORDS = frozenset({'a', 'an', 'and', 'by', 'for', 'in', 'of', 'on', 'or', 'the', 'to', 'with'})
+
+# Most terms a query word expands to, and the score factor of a prefix match
+MAX_EXPANSIONS = 50
+PREFIX_FACTOR = 0.5
+
+# Most books a query of several words scores before returning the best so far
+MAX_CANDIDATES = 100
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase, accent-free terms"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return re.findall(r'[^\W_]+', text)
+
+
+class SearchIndex:
+    """Inverted index with field weighting and prefix matching"""
+
+    def __init__(self):
+        """Initialize an empty index"""
+        self._postings = {}  # term -> {weight: {book id: None}}, heaviest weight first when read
+        self._terms = []  # Every indexed term, sorted
+        self._doc_terms = {}  # book id -> terms it is indexed under
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def rebuild(self, books: Iterable[Any]):
+        """Index every book from scratch"""
+        postings = {}
+        doc_terms = {}
+        for book in books:
+            weights = self._weights(book)
+            for term, weight in weights.items():
+                postings.setdefault(term, {}).setdefault(weight, {})[book.id] = None
+            doc_terms[book.id] = tuple(weights)
+        with self._lock:
+            self._postings = postings
+            self._terms = sorted(postings)
+            self._doc_terms = doc_terms
+
+    def add(self, book: Any):
+        """Index a book, replacing what was indexed for it before"""
+        weights = self._weights(book)
+        with self._lock:
+            self._remove(book.id)
+            for term, weight in weights.items():
+                tiers = self._postings.get(term)
+                if tiers is None:
+                    tiers = self._postings[term] = {}
+                    bisect.insort(self._terms, term)
+                tiers.setdefault(weight, {})[book.id] = None
+            self._doc_terms[book.id] = tuple(weights)
+
+    def remove(self, book_id: str):
+        """Drop a book from the index"""
+        with self._lock:
+            self._remove(book_id)
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[str, float]]:
+        """Find books containing every word of the query, best matches first
+
+        Each query word matches terms it equals or is a prefix of. Scores add
+        up the field weight of each matched term times its inverse document
+        frequency; prefix matches count half. Books with equal scores come
+        in no particular order.
+
+        The books of the most selective word are read best first, and those
+        matching every other word are scored, until no unread book can beat
+        the results so far (or ``MAX_CANDIDATES`` books were scored).
+
+        Returns:
+            (book id, score) pairs, highest score first
+        """
+        words = [word for word in dict.fromkeys(tokenize(query)) if word not in STOPWORDS]
+        if not words or limit <= 0:
+            return []
+        with self._lock:
+            matches = []
+            for word in words:
+                tiers, scales = self._tiers(word)
+                if not tiers:
+                    return []
+                matches.append((sum(len(ids) for _, ids in tiers), tiers, scales))
+            # Read the most selective word's books; look the other words up in each book
+            matches.sort(key=itemgetter(0))
+            _, driver, scales = matches[0]
+            others = [(tiers, scales) for _, tiers, scales in matches[1:]]
+            others_max = sum(tiers[0][0] for tiers, _ in others)
+            results = []  # Min-heap of (score, book id), at most limit long
+            seen = set()
+            for score, ids in driver:
+                if len(results) == limit and results[0][0] >= score + others_max:
+                    break  # No unread book can make the results
+                for book_id in ids:
+                    if book_id in seen:
+                        continue  # Matched a higher scoring term of the same word
+                    seen.add(book_id)
+                    total = score
+                    for tiers, scales in others:
+                        best = self._score(book_id, tiers, scales)
+                        if not best:
+                            break
+                        total += best
+                    else:
+                        if len(results) < limit:
+                            heapq.heappush(results, (total, book_id))
+                        elif (total, book_id) > results[0]:
+                            heapq.heapreplace(results, (total, book_id))
+                    if len(results) == limit and results[0][0] >= score + others_max:
+                        break
+                    if others and len(seen) == MAX_CANDIDATES:
+                        break
+                else:
+                    continue
+                break
+        return [(book_id, score) for score, book_id in sorted(results, reverse=True)]
+
+    @staticmethod
+    def _weights(book: Any) -> Dict[str, float]:
+        """Summed field weight of every term of a book"""
+        weights = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(getattr(book, field, None)):
+                if term not in STOPWORDS:
+                    weights[term] = weights.get(term, 0.0) + weight
+        return weights
+
+    def _expand(self, word: str) -> List[Tuple[str, float]]:
+        """Terms matched by a query word with their score factor"""
+        terms = []
+        start = bisect.bisect_left(self._terms, word)
+        for term in self._terms[start:start + MAX_EXPANSIONS]:
+            if not term.startswith(word):
+                break
+            terms.append((term, 1.0 if term == word else PREFIX_FACTOR))
+        return terms
+
+    def _tiers(self, word: str) -> Tuple[List[Tuple[float, Dict[str, None]]], Dict[str, float]]:
+        """Books matching a query word, grouped by score, highest first
+
+        Returns:
+            (score, book ids) tiers, and the score of one unit of weight of
+            each term the word matches
+        """
+        total = len(self._doc_terms)
+        scales = {}
+        tiers = []
+        for term, factor in self._expand(word):
+            term_tiers = self._postings[term]
+            scale = scales[term] = math.log(1 + total / sum(map(len, term_tiers.values()))) * factor
+            tiers.extend((weight * scale, ids) for weight, ids in term_tiers.items())
+        tiers.sort(key=itemgetter(0), reverse=True)
+        return tiers, scales
+
+    def _score(self, book_id: str, tiers: List[Tuple[float, Dict[str, None]]],
+               scales: Dict[str, float]) -> float:
+        """Score of a book for one query word, 0 if it does not match"""
+        doc_terms = self._doc_terms[book_id]
+        if len(tiers) <= len(doc_terms):
+            # The first tier holding the book is its best match
+            for score, ids in tiers:
+                if book_id in ids:
+                    return score
+            return 0.0
+        best = 0.0
+        for term in doc_terms:
+            scale = scales.get(term)
+            if scale is not None:
+                for weight, ids in self._postings[term].items():
+                    if book_id in ids:
+                        best = max(best, weight * scale)
+                        break
+        return best
+
+    def _remove(self, book_id: str):
+        """Drop a book's postings; the caller holds the lock"""
+        for term in self._doc_terms.pop(book_id, ()):
+            tiers = self._postings[term]
+            for weight, ids in tiers.items():
+                if book_id in ids:
+                    del ids[book_id]
+                    if not ids:
+                        del tiers[weight]
+                    break
+            if not tiers:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
@@ -0,0 +1,14 @@
+"""Storage helpers shared by the services"""
+
+from src.storage.journal import Journal
+from src.storage.binary_snapshot import BinarySnapshot, read_snapshot, write_snapshot
+from src.storage.compaction import Compactor
+from src.storage.repository import (
+    BACKENDS, Repository, JsonRepository, JournalRepository, create_repository
+)
+
+__all__ = [
+    'Journal', 'Compactor', 'BACKENDS', 'Repository', 'JsonRepository',
+    'JournalRepository', 'create_repository', 'BinarySnapshot', 'read_snapshot',
+    'write_snapshot'
+]
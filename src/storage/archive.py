@@ -0,0 +1,193 @@
+"""Cold storage tier for records that no longer change
+
+Delivered and cancelled records are moved out of the service's working set
+into read-only segments: gzip-compressed JSON-lines files, one or more per
+month of ``created_at``. A ``manifest.json`` lists the segments together
+with the ids (and optional lookup keys) they hold, so a lookup knows which
+single segment to decompress.
+
+A record archived more than once (because it was changed again after being
+archived) is read from the newest segment holding it.
+"""
+
+import gzip
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from src.storage.change_detection import file_signature
+from src.storage.durability import DEFAULT_DURABILITY, NONE, OS_BUFFERED, write_file
+from src.storage.journal import _lock_for
+
+
+class Archive:
+    """Read-only, compressed, time-partitioned segments of archived records"""
+
+    def __init__(self, directory: str, factory: Callable[[dict], Any],
+                 key_fields: Iterable[str] = (), durability: str = DEFAULT_DURABILITY,
+                 cache_segments: int = 4):
+        """Initialize archive
+
+        Args:
+            directory: Directory holding the segments and the manifest
+            factory: Builds a model from a dict
+            key_fields: Record fields listed in the manifest, which can be
+                looked up with ``find`` and read with ``key_records``
+                without decompressing any segment
+            durability: Durability of segment and manifest writes; records
+                are only dropped from the working set once they are written,
+                so ``none`` is raised to ``os-buffered``
+            cache_segments: Number of decompressed segments kept in memory
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.manifest_file = str(self.directory / 'manifest.json')
+        self.factory = factory
+        self.key_fields = tuple(key_fields)
+        self.durability = OS_BUFFERED if durability == NONE else durability
+        self.cache_segments = cache_segments
+        self.lock = _lock_for(self.manifest_file)
+        self._cache_lock = threading.Lock()
+        self._segments = []  # Manifest entries, oldest first
+        self._locations = {}  # id -> file of the newest segment holding it
+        self._key_values = {}  # id -> key fields of its newest version
+        self._lookups = {}  # field -> value -> id, built on first use
+        self._cache = OrderedDict()  # file -> {id: record}, in LRU order
+        self._signature = None
+        self._load_manifest()
+
+    def __contains__(self, record_id: str) -> bool:
+        self._refresh()
+        return record_id in self._locations
+
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self._locations)
+
+    def add(self, records: List[dict]) -> int:
+        """Write records to new segments, one per month, and return the count"""
+        if not records:
+            return 0
+        partitions = {}
+        for record in records:
+            partitions.setdefault(self._partition(record), []).append(record)
+        with self.lock:
+            self._refresh()
+            manifest = {'segments': list(self._segments), 'next_segment': self._next_segment}
+            for partition, items in sorted(partitions.items()):
+                name = f'{partition}-{manifest["next_segment"]:06d}.jsonl.gz'
+                manifest['next_segment'] += 1
+                data = ''.join(json.dumps(record) + '\n' for record in items)
+                write_file(str(self.directory / name), gzip.compress(data.encode('utf-8')),
+                           self.durability)
+                manifest['segments'].append({
+                    'file': name,
+                    'partition': partition,
+                    'count': len(items),
+                    'ids': [record['id'] for record in items],
+                    'keys': {field: [record.get(field) for record in items]
+                             for field in self.key_fields}
+                })
+            # Segments become visible only once the manifest lists them
+            write_file(self.manifest_file, json.dumps(manifest, indent=2), self.durability)
+            self._load_manifest()
+        return len(records)
+
+    def get(self, record_id: str) -> Optional[Any]:
+        """Get an archived record by id"""
+        self._refresh()
+        name = self._locations.get(record_id)
+        if name is None:
+            return None
+        return self.factory(self._read_segment(name)[record_id])
+
+    def find(self, field: str, value: Any) -> Optional[Any]:
+        """Get the archived record whose key field ``field`` equals ``value``"""
+        self._refresh()
+        lookup = self._lookups.get(field)
+        if lookup is None:
+            lookup = {values[field]: record_id for record_id, values in self._key_values.items()
+                      if values.get(field) is not None}
+            self._lookups[field] = lookup
+        record_id = lookup.get(value)
+        return self.get(record_id) if record_id is not None else None
+
+    def key_record(self, record_id: str) -> Optional[SimpleNamespace]:
+        """Get the id and key fields of an archived record, None if it is not archived"""
+        self._refresh()
+        values = self._key_values.get(record_id)
+        return SimpleNamespace(id=record_id, **values) if values is not None else None
+
+    def key_records(self) -> Iterator[SimpleNamespace]:
+        """Iterate over the id and key fields of every archived record"""
+        self._refresh()
+        for record_id, values in list(self._key_values.items()):
+            yield SimpleNamespace(id=record_id, **values)
+
+    def records(self) -> Iterator[Any]:
+        """Iterate over every archived record, segment by segment"""
+        for record in self.export():
+            yield self.factory(record)
+
+    def export(self) -> Iterator[dict]:
+        """Iterate over every archived record as a dict, segment by segment"""
+        self._refresh()
+        for segment in list(self._segments):
+            name = segment['file']
+            for record_id, record in self._read_segment(name).items():
+                if self._locations.get(record_id) == name:
+                    yield record
+
+    def _read_segment(self, name: str) -> Dict[str, dict]:
+        """Decompress a segment, keeping the most recently used ones in memory"""
+        with self._cache_lock:
+            if name in self._cache:
+                self._cache.move_to_end(name)
+                return self._cache[name]
+        with gzip.open(self.directory / name, 'rt', encoding='utf-8') as f:
+            segment = {}
+            for line in f:
+                record = json.loads(line)
+                segment[record['id']] = record
+        with self._cache_lock:
+            self._cache[name] = segment
+            if len(self._cache) > self.cache_segments:
+                self._cache.popitem(last=False)
+        return segment
+
+    def _refresh(self):
+        """Reload the manifest if another instance archived records"""
+        if file_signature(self.manifest_file) != self._signature:
+            with self.lock:
+                self._load_manifest()
+
+    def _load_manifest(self):
+        """Read the manifest and rebuild the id and key maps"""
+        self._signature = file_signature(self.manifest_file)
+        try:
+            with open(self.manifest_file, 'r') as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            manifest = {}
+        locations = {}
+        key_values = {}
+        for segment in manifest.get('segments', []):
+            keys = segment.get('keys', {})
+            for position, record_id in enumerate(segment['ids']):
+                locations[record_id] = segment['file']
+                key_values[record_id] = {field: keys[field][position] if field in keys else None
+                                         for field in self.key_fields}
+        self._segments = manifest.get('segments', [])
+        self._next_segment = manifest.get('next_segment', len(self._segments) + 1)
+        self._locations = locations
+        self._key_values = key_values
+        self._lookups = {}
+
+    @staticmethod
+    def _partition(record: dict) -> str:
+        """Month a record belongs to, taken from its ``created_at``"""
+        created_at = record.get('created_at') or ''
+        return created_at[:7] if len(created_at) >= 7 else 'undated'
@@ -0,0 +1,169 @@
+"""Compact binary snapshot format
+
+A snapshot stores records column by column in a single marshal payload:
+
+* every string value is replaced by its index into a shared string table,
+  so repeated values such as statuses, carriers, customer emails or book
+  titles are stored and loaded once;
+* float and int columns are packed arrays loaded with a single memcpy;
+* lists of records (order items) are stored as a nested column table plus
+  an array of offsets;
+* anything else is kept as a marshalled list.
+
+Loading a snapshot skips JSON parsing entirely. Columns are only decoded
+when records are iterated, and string values are shared between records
+instead of being allocated once per occurrence.
+"""
+
+import gc
+import marshal
+import sys
+from array import array
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator, List
+
+from src.storage.durability import DEFAULT_DURABILITY, write_file
+
+MAGIC = b'BKSNAP01'
+NULL_STRING = -1
+
+
+def write_snapshot(path: str, records: Iterable[dict], durability: str = DEFAULT_DURABILITY):
+    """Write records to a binary snapshot file"""
+    strings = []
+    table = _encode_table(list(records), strings, {})
+    payload = marshal.dumps({'byteorder': sys.byteorder, 'strings': strings, 'table': table})
+    write_file(path, MAGIC + payload, durability)
+
+
+def is_snapshot(path: str) -> bool:
+    """Check whether a file is a binary snapshot"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except FileNotFoundError:
+        return False
+
+
+def _encode_table(records: List[dict], strings: List[str], string_ids: dict) -> dict:
+    """Encode records as a table of columns sharing one string table"""
+    fields = []
+    for record in records:
+        for field in record:
+            if field not in fields:
+                fields.append(field)
+    columns = {
+        field: _encode_column([record.get(field) for record in records], strings, string_ids)
+        for field in fields
+    }
+    return {'count': len(records), 'fields': fields, 'columns': columns}
+
+
+def _encode_column(values: List[Any], strings: List[str], string_ids: dict) -> tuple:
+    """Encode a column as ``(kind, payload)``"""
+    if all(value is None or type(value) is str for value in values):
+        indexes = array('i')
+        for value in values:
+            if value is None:
+                indexes.append(NULL_STRING)
+                continue
+            index = string_ids.get(value)
+            if index is None:
+                index = string_ids[value] = len(strings)
+                strings.append(value)
+            indexes.append(index)
+        return 's', indexes.tobytes()
+    if all(type(value) is float for value in values):
+        return 'd', array('d', values).tobytes()
+    if all(type(value) is int and -2 ** 63 <= value < 2 ** 63 for value in values):
+        return 'q', array('q', values).tobytes()
+    if all(type(value) is list and all(type(item) is dict for item in value) for value in values):
+        offsets = array('q', [0])
+        children = []
+        for value in values:
+            children.extend(value)
+            offsets.append(len(children))
+        return 'n', (offsets.tobytes(), _encode_table(children, strings, string_ids))
+    return 'v', values
+
+
+class BinarySnapshot:
+    """Read-only view of a binary snapshot file"""
+
+    def __init__(self, path: str):
+        """Read a snapshot file; columns are decoded on first use"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(f'{path} is not a binary snapshot')
+        header = marshal.loads(memoryview(data)[len(MAGIC):])
+        self._swap = header['byteorder'] != sys.byteorder
+        self.strings = header['strings']
+        self._table = header['table']
+        self.fields = self._table['fields']
+        self._decoded = {}
+
+    def __len__(self) -> int:
+        return self._table['count']
+
+    def column(self, field: str) -> List[Any]:
+        """Get every value of one field, without building records"""
+        if field not in self._decoded:
+            self._decoded[field] = self._decode_column(self._table['columns'][field])
+        return self._decoded[field]
+
+    def __iter__(self) -> Iterator[dict]:
+        fields = self.fields
+        for row in zip(*(self.column(field) for field in fields)):
+            yield dict(zip(fields, row))
+
+    def _decode_table(self, table: dict) -> List[dict]:
+        """Build the records of a nested table"""
+        fields = table['fields']
+        columns = [self._decode_column(table['columns'][field]) for field in fields]
+        return [dict(zip(fields, row)) for row in zip(*columns)]
+
+    def _decode_column(self, column: tuple) -> List[Any]:
+        """Decode one ``(kind, payload)`` column into a list of values"""
+        kind, payload = column
+        if kind == 'v':
+            return payload
+        if kind == 'n':
+            offsets = self._array('q', payload[0])
+            children = self._decode_table(payload[1])
+            return [children[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+        values = self._array('i' if kind == 's' else kind, payload)
+        if kind == 's':
+            strings = self.strings
+            return [None if index == NULL_STRING else strings[index] for index in values]
+        return values.tolist()
+
+    def _array(self, typecode: str, payload: bytes) -> array:
+        """Unpack a packed array written on a machine of either byte order"""
+        values = array(typecode)
+        values.frombytes(payload)
+        if self._swap:
+            values.byteswap()
+        return values
+
+
+@contextmanager
+def paused_gc():
+    """Pause the cyclic garbage collector while bulk-loading records
+
+    Loading allocates hundreds of thousands of dicts and model objects, none
+    of which are garbage, and every collection pass would traverse them all.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def read_snapshot(path: str) -> Iterator[dict]:
+    """Iterate over the records of a binary snapshot file"""
+    return iter(BinarySnapshot(path))
+
@@ -0,0 +1,46 @@
+"""Change detection for data files
+
+Reads used to re-parse the data file unconditionally. A file signature made
+of its mtime, size and inode lets a repository skip the reload when nothing
+has touched the file since it was last read.
+"""
+
+import os
+import threading
+from typing import NamedTuple, Optional
+
+
+class FileSignature(NamedTuple):
+    """Identity of a file's current contents as reported by stat()"""
+    mtime_ns: int
+    size: int
+    inode: int
+
+
+def file_signature(path: str) -> Optional[FileSignature]:
+    """Get the signature of a file, or None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return FileSignature(stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+class CacheStats:
+    """Counters describing how reads were served"""
+
+    def __init__(self):
+        """Initialize all counters to zero"""
+        self._lock = threading.Lock()
+        self.hits = 0  # Nothing changed, no reload
+        self.partial = 0  # Only the changed records were reloaded
+        self.misses = 0  # Everything was reloaded
+
+    def record(self, outcome: str):
+        """Count one read; outcome is ``hits``, ``partial`` or ``misses``"""
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def to_dict(self) -> dict:
+        """Convert counters to dictionary"""
+        return {'hits': self.hits, 'partial': self.partial, 'misses': self.misses}
@@ -0,0 +1,138 @@
+"""Snapshot and log compaction for journaled data files
+
+The data file of a journaled service doubles as its snapshot. Compaction
+rotates the journal, writes the in-memory records to a new snapshot in a
+background thread and then drops the rotated log, so startup only has to
+read the latest snapshot plus the entries appended since.
+"""
+
+import json
+import os
+import threading
+from typing import Callable, Dict, Optional
+
+from src.storage.binary_snapshot import is_snapshot, paused_gc, read_snapshot, write_snapshot
+from src.storage.change_detection import file_signature
+from src.storage.durability import NONE, OS_BUFFERED, write_file
+from src.storage.journal import Journal, apply_entries, read_entries
+
+SNAPSHOT_FORMATS = ('json', 'binary')
+
+# Running compactions by snapshot path, shared by every instance in the process
+_running = {}
+
+
+class Compactor:
+    """Folds a journal into its snapshot file once it grows past a threshold"""
+
+    def __init__(self, journal: Journal, snapshot_file: str, compact_every: Optional[int] = 1000,
+                 snapshot_format: str = 'json', seed_file: Optional[str] = None):
+        """Initialize compactor
+
+        Args:
+            journal: Journal whose entries are folded into the snapshot
+            snapshot_file: File holding the point-in-time snapshot
+            compact_every: Compact once the journal holds this many entries
+                (None disables automatic compaction)
+            snapshot_format: ``json`` or ``binary`` (see ``binary_snapshot``)
+            seed_file: JSON file loaded while no binary snapshot exists yet
+        """
+        if snapshot_format not in SNAPSHOT_FORMATS:
+            raise ValueError(f'Unknown snapshot format: {snapshot_format}. '
+                             f'Must be one of: {", ".join(SNAPSHOT_FORMATS)}')
+        self.journal = journal
+        self.snapshot_file = snapshot_file
+        self.compact_every = compact_every
+        self.snapshot_format = snapshot_format
+        self.seed_file = seed_file
+        self.compacting_file = journal.path + '.compacting'
+        self._key = os.path.abspath(snapshot_file)
+
+    def load(self, factory: Callable[[dict], object]) -> Dict[str, object]:
+        """Load the latest snapshot plus the log tail"""
+        while True:
+            generation = self._generation()
+            records = self._read_snapshot(factory)
+            apply_entries(records, read_entries(self.compacting_file), factory)
+            apply_entries(records, self.journal.replay(), factory)
+            # Start over if a compaction swapped files while we were reading
+            if self._generation() == generation:
+                return records
+
+    def maybe_compact(self, records: Dict[str, object], factory: Callable[[dict], object]):
+        """Start a compaction if the journal has grown past the threshold"""
+        if self.compact_every and self.journal.entries >= self.compact_every:
+            self.compact(records, factory)
+
+    def compact(self, records: Dict[str, object], factory: Callable[[dict], object],
+                wait: bool = False):
+        """Snapshot ``records`` in the background and truncate the journal
+
+        Args:
+            records: In-memory records of the service, keyed by id
+            factory: Builds a record from a journal entry
+            wait: Block until the snapshot has been written
+        """
+        with self.journal.lock:
+            running = _running.get(self._key)
+            if running and running.is_alive():
+                return
+            # Entries written by other instances must be in the snapshot
+            # before the log they live in is dropped.
+            entries = self.journal.read_new()
+            if entries is None:
+                records.clear()
+                records.update(self.load(factory))
+            else:
+                apply_entries(records, entries, factory)
+            self.journal.rotate(self.compacting_file)
+            items = list(records.values())
+            thread = threading.Thread(target=self._write_snapshot, args=(items,), daemon=True)
+            _running[self._key] = thread
+            thread.start()
+        if wait:
+            thread.join()
+
+    def wait(self):
+        """Wait for a running compaction to finish"""
+        thread = _running.get(self._key)
+        if thread:
+            thread.join()
+
+    def _write_snapshot(self, items: list):
+        """Write the snapshot atomically and drop the rotated log"""
+        # Records may change while they are being serialized; every such
+        # change is also in the new journal, which is replayed on top of
+        # the snapshot, so the result converges to the latest state.
+        # The rotated log is only dropped once the snapshot is safely in
+        # place, so write it atomically even if the journal does not fsync.
+        level = self.journal.durability
+        level = OS_BUFFERED if level == NONE else level
+        records = [item.to_dict() for item in items]
+        data = None if self.snapshot_format == 'binary' else json.dumps(records, indent=2)
+        with self.journal.lock:
+            if data is None:
+                write_snapshot(self.snapshot_file, records, level)
+            else:
+                write_file(self.snapshot_file, data, level)
+            if os.path.exists(self.compacting_file):
+                os.remove(self.compacting_file)
+
+    def _read_snapshot(self, factory: Callable[[dict], object]) -> Dict[str, object]:
+        """Read the snapshot file into a dict of records"""
+        with paused_gc():
+            if self.snapshot_format == 'binary' and is_snapshot(self.snapshot_file):
+                return {record['id']: factory(record) for record in read_snapshot(self.snapshot_file)}
+            json_file = self.snapshot_file if self.snapshot_format == 'json' else self.seed_file
+            try:
+                with open(json_file, 'r') as f:
+                    return {record['id']: factory(record) for record in json.load(f)}
+            except (FileNotFoundError, TypeError, json.JSONDecodeError):
+                return {}
+
+    def _generation(self) -> tuple:
+        """Identify the current set of snapshot and log files"""
+        journal = file_signature(self.journal.path)
+        # The journal's mtime changes on every append; only its identity matters
+        return (file_signature(self.snapshot_file), file_signature(self.compacting_file),
+                journal.inode if journal else None)
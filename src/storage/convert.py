@@ -0,0 +1,52 @@
+"""Convert data files between the JSON and binary snapshot formats
+
+Usage:
+    python -m src.storage.convert to-binary data/orders.json data/orders.snap
+    python -m src.storage.convert to-json data/orders.snap data/orders.json
+"""
+
+import argparse
+import json
+import sys
+from typing import List, Optional
+
+from src.storage.binary_snapshot import is_snapshot, read_snapshot, write_snapshot
+from src.storage.durability import write_file
+
+
+def to_binary(source: str, target: str) -> int:
+    """Convert a JSON data file to a binary snapshot, returning the record count"""
+    with open(source, 'r') as f:
+        records = json.load(f)
+    write_snapshot(target, records)
+    return len(records)
+
+
+def to_json(source: str, target: str) -> int:
+    """Convert a binary snapshot to a JSON data file, returning the record count"""
+    if not is_snapshot(source):
+        raise ValueError(f'{source} is not a binary snapshot')
+    records = list(read_snapshot(source))
+    write_file(target, json.dumps(records, indent=2))
+    return len(records)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('direction', choices=['to-binary', 'to-json'])
+    parser.add_argument('source')
+    parser.add_argument('target')
+    args = parser.parse_args(argv)
+
+    convert = to_binary if args.direction == 'to-binary' else to_json
+    try:
+        count = convert(args.source, args.target)
+    except (OSError, ValueError) as e:
+        print(f'Error: {e}', file=sys.stderr)
+        return 1
+    print(f'Wrote {count} records to {args.target}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""Durability levels for data file writes
+
+``none``
+    Write the data file in place without syncing. Fastest, but a crash in
+    the middle of a write leaves a truncated file.
+``os-buffered``
+    Write a temp file and atomically rename it over the data file. A crash
+    leaves either the old or the new contents; data still in the OS page
+    cache is lost on power failure.
+``fsync-per-commit``
+    Like ``os-buffered``, and fsync every record change before it is
+    considered committed.
+``fsync-per-group``
+    Like ``os-buffered``, and fsync once per save, which covers a whole
+    group when used together with group commit or batched writes.
+"""
+
+import os
+import tempfile
+from typing import Union
+
+NONE = 'none'
+OS_BUFFERED = 'os-buffered'
+FSYNC_PER_COMMIT = 'fsync-per-commit'
+FSYNC_PER_GROUP = 'fsync-per-group'
+LEVELS = (NONE, OS_BUFFERED, FSYNC_PER_COMMIT, FSYNC_PER_GROUP)
+DEFAULT_DURABILITY = OS_BUFFERED
+
+
+def validate_durability(durability: str) -> str:
+    """Check that ``durability`` is a known level and return it"""
+    if durability not in LEVELS:
+        raise ValueError(f'Unknown durability level: {durability}. Must be one of: {", ".join(LEVELS)}')
+    return durability
+
+
+def fsyncs(durability: str) -> bool:
+    """Whether the level fsyncs at all"""
+    return durability in (FSYNC_PER_COMMIT, FSYNC_PER_GROUP)
+
+
+def write_file(path: str, data: Union[str, bytes], durability: str = DEFAULT_DURABILITY):
+    """Replace the contents of ``path`` according to the durability level"""
+    mode = 'wb' if isinstance(data, bytes) else 'w'
+    if durability == NONE:
+        with open(path, mode) as f:
+            f.write(data)
+        return
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            f.write(data)
+            if fsyncs(durability):
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if fsyncs(durability):
+        fsync_directory(directory)
+
+
+def fsync_directory(directory: str):
+    """Persist a rename by syncing the directory entry (no-op on Windows)"""
+    if os.name == 'nt':
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,191 @@
+"""Group commit for service persistence
+
+Instead of writing on every mutation, changed ids are collected and flushed
+by a background thread once per interval or once enough changes pile up.
+Concurrent writers that land in the same group share one write, and each
+save returns a future that resolves when its group has been persisted.
+
+A group that fails to write is queued again and retried with exponential
+backoff, so changes nobody waits on are not lost; the futures of the failed
+group still report the error.
+"""
+
+import atexit
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from src.storage.repository import Repository, RefreshResult
+
+logger = logging.getLogger(__name__)
+
+# Repositories with unflushed changes are flushed when the interpreter exits
+_open_repositories = weakref.WeakSet()
+
+# Seconds to wait before retrying a failed group, doubled on each failure
+RETRY_DELAY = 0.1
+RETRY_MAX_DELAY = 5.0
+
+
+class GroupCommitRepository(Repository):
+    """Wraps a repository and batches its saves into group commits"""
+
+    def __init__(self, inner: Repository, interval: float = 0.05, max_batch: int = 100):
+        """Initialize group commit
+
+        Args:
+            inner: Repository that performs the actual writes
+            interval: Longest time in seconds a change waits to be flushed
+            max_batch: Flush as soon as this many records are pending
+        """
+        super().__init__(inner.factory)
+        self.inner = inner
+        self.stats = inner.stats
+        self.interval = interval
+        self.max_batch = max_batch
+        self._cond = threading.Condition()
+        self._records = None
+        self._pending = set()
+        self._pending_all = False
+        self._future = Future()
+        self._flush_requested = False
+        self._closed = False
+        self._failures = 0  # Consecutive failed writes
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        _open_repositories.add(self)
+
+    def load(self) -> Dict[str, Any]:
+        """Load every record from the underlying repository"""
+        return self.inner.load()
+
+    def refresh(self, records: Dict[str, Any]) -> RefreshResult:
+        """Refresh from the underlying repository, keeping unflushed changes"""
+        with self._cond:
+            pending = {record_id: records[record_id] for record_id in self._pending
+                       if record_id in records}
+        result = self.inner.refresh(records)
+        records.update(pending)
+        return result
+
+    def export(self, records: Dict[str, Any]) -> Iterator[dict]:
+        """Flush queued changes, then export from the underlying repository"""
+        self.flush()
+        yield from self.inner.export(records)
+
+    def save(self, records: Dict[str, Any], changed: Optional[Iterable[str]] = None) -> Future:
+        """Queue the changed ids for the next group commit"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('Repository is closed')
+            self.inner.stage(records, changed)
+            self._records = records
+            if changed is None:
+                self._pending_all = True
+            else:
+                self._pending.update(changed)
+            future = self._future
+            self._cond.notify()
+        return future
+
+    def commit_future(self) -> Future:
+        """Get a future resolved once every change queued so far is persisted
+
+        Someone is about to wait on the group, so it is flushed without
+        sitting out the interval. Writers arriving while it is being written
+        form the next group.
+        """
+        with self._cond:
+            if self._pending or self._pending_all:
+                self._flush_requested = True
+                self._cond.notify()
+                return self._future
+        return self.inner.commit_future()
+
+    def flush(self):
+        """Write pending changes now and wait for them to be persisted"""
+        with self._cond:
+            if not (self._pending or self._pending_all):
+                future = None
+            else:
+                future = self._future
+                self._flush_requested = True
+                self._cond.notify()
+        if future:
+            future.result()
+        self.inner.flush()
+
+    def close(self):
+        """Flush pending changes and stop the background thread"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self.inner.close()
+
+    def _run(self):
+        """Background loop that writes one group per iteration"""
+        while True:
+            with self._cond:
+                while not (self._pending or self._pending_all or self._closed):
+                    self._cond.wait()
+                # Give concurrent writers until the end of the interval to join
+                deadline = time.monotonic() + self.interval
+                while (len(self._pending) < self.max_batch and not self._pending_all
+                       and not self._flush_requested and not self._closed):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if not (self._pending or self._pending_all):
+                    return  # Closed with nothing left to write
+                changed = None if self._pending_all else self._pending
+                records, future = self._records, self._future
+                self._pending = set()
+                self._pending_all = False
+                self._future = Future()
+                self._flush_requested = False
+            try:
+                self.inner.save(records, changed)
+            except Exception as e:
+                self._requeue(changed, e)
+                future.set_exception(e)
+            else:
+                self._failures = 0
+                future.set_result(None)
+
+    def _requeue(self, changed: Optional[set], error: Exception):
+        """Queue the ids of a failed group again and back off before the retry
+
+        Once the repository is closed the changes are given up, as nothing
+        would write them.
+        """
+        count = 'every' if changed is None else len(changed)
+        with self._cond:
+            if self._closed:
+                logger.error('Group commit failed after close, %s changed records not written: %s',
+                             count, error)
+                return
+            if changed is None:
+                self._pending_all = True
+            else:
+                self._pending.update(changed)
+            self._failures += 1
+            delay = min(RETRY_MAX_DELAY, RETRY_DELAY * 2 ** (self._failures - 1))
+            logger.warning('Group commit of %s changed records failed, retrying in %.1fs: %s',
+                           count, delay, error)
+            deadline = time.monotonic() + delay
+            while not self._closed and (remaining := deadline - time.monotonic()) > 0:
+                self._cond.wait(remaining)
+
+
+@atexit.register
+def _flush_open_repositories():
+    """Write out changes still waiting in a group when the process exits"""
+    for repository in list(_open_repositories):
+        repository.close()
@@ -0,0 +1,182 @@
+"""Append-only journal of record changes
+
+Each line of the journal is a JSON object ``{"op": "put", "record": {...}}``.
+Replaying the journal in order over the base data file rebuilds the current
+state, so a mutation costs one appended line instead of a full file rewrite.
+"""
+
+import json
+import os
+import shutil
+import threading
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from src.storage.durability import (
+    DEFAULT_DURABILITY, FSYNC_PER_COMMIT, FSYNC_PER_GROUP, fsync_directory, fsyncs
+)
+
+# Service instances sharing a journal file within the process share its lock
+_path_locks = {}
+_path_locks_guard = threading.Lock()
+
+
+def _lock_for(path: str) -> threading.RLock:
+    """Get the lock guarding a journal file"""
+    key = os.path.abspath(path)
+    with _path_locks_guard:
+        return _path_locks.setdefault(key, threading.RLock())
+
+
+class Journal:
+    """Append-only log of record changes stored as JSON lines"""
+
+    def __init__(self, path: str, durability: str = DEFAULT_DURABILITY):
+        """Initialize journal with the path of its log file and durability level"""
+        self.path = path
+        self.durability = durability
+        self.offset = 0  # Byte position up to which the log has been read
+        self.entries = 0  # Number of entries in the log since it was last rotated
+        self.lock = _lock_for(path)
+        self._inode = None
+
+    def append(self, record: dict, op: str = 'put'):
+        """Append a single record change to the log"""
+        self.append_many([(op, record)])
+
+    def append_many(self, changes: List[Tuple[str, dict]]):
+        """Append ``(op, record)`` changes to the log as one group"""
+        lines = [(json.dumps({'op': op, 'record': record}) + '\n').encode('utf-8')
+                 for op, record in changes]
+        with self.lock:
+            with open(self.path, 'ab') as f:
+                stat = os.fstat(f.fileno())
+                if self.durability == FSYNC_PER_COMMIT:
+                    for line in lines:
+                        f.write(line)
+                        f.flush()
+                        os.fsync(f.fileno())
+                else:
+                    f.write(b''.join(lines))
+                    if self.durability == FSYNC_PER_GROUP:
+                        f.flush()
+                        os.fsync(f.fileno())
+            if stat.st_size == 0 and fsyncs(self.durability):
+                fsync_directory(os.path.dirname(os.path.abspath(self.path)))
+            self.entries += len(lines)
+            written = sum(len(line) for line in lines)
+            # Only skip past our own entries if nobody else wrote before them
+            if stat.st_ino == self._inode and stat.st_size == self.offset:
+                self.offset += written
+            elif self._inode is None and stat.st_size == 0:
+                self._inode = stat.st_ino
+                self.offset = written
+
+    def replay(self) -> List[dict]:
+        """Read the whole log from the beginning
+
+        A partial line at the end of the log (left by a crash in the middle
+        of an append) is truncated so that later appends start on a fresh line.
+        """
+        with self.lock:
+            self.offset = 0
+            self.entries = 0
+            self._inode = None
+            entries = list(self._read_from_offset())
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self.offset:
+                os.truncate(self.path, self.offset)
+            return entries
+
+    def read_new(self) -> Optional[List[dict]]:
+        """Read entries appended since the last replay or read
+
+        Returns None if the log was rotated since it was last read, in which
+        case the caller has to reload from the snapshot.
+        """
+        with self.lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                stat = None
+            if self._inode is not None and (stat is None or stat.st_ino != self._inode
+                                            or stat.st_size < self.offset):
+                return None
+            if stat is None or stat.st_size == self.offset:
+                return []
+            return list(self._read_from_offset())
+
+    def rotate(self, target: str):
+        """Move the current log to ``target`` and start a new, empty one
+
+        If ``target`` is still there from an interrupted compaction the log
+        is appended to it, so no entry is ever dropped.
+        """
+        with self.lock:
+            if os.path.exists(self.path):
+                if os.path.exists(target):
+                    _trim_partial_line(target)
+                    with open(self.path, 'rb') as src, open(target, 'ab') as dst:
+                        shutil.copyfileobj(src, dst)
+                    os.remove(self.path)
+                else:
+                    os.replace(self.path, target)
+            self.offset = 0
+            self.entries = 0
+            self._inode = None
+
+    def _read_from_offset(self) -> Iterator[dict]:
+        """Yield complete entries after ``self.offset`` and advance it"""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            self.offset = 0
+            self._inode = None
+            return
+        with f:
+            self._inode = os.fstat(f.fileno()).st_ino
+            f.seek(self.offset)
+            for line in f:
+                # A line without a newline is still being written
+                if not line.endswith(b'\n'):
+                    break
+                self.offset += len(line)
+                self.entries += 1
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+
+def read_entries(path: str) -> List[dict]:
+    """Read every complete entry of a log file without tracking offsets"""
+    if not os.path.exists(path):
+        return []
+    return list(Journal(path)._read_from_offset())
+
+
+def apply_entries(records: dict, entries: List[dict], factory: Callable) -> dict:
+    """Apply journal entries to a dict of records keyed by id"""
+    for entry in entries:
+        record = entry['record']
+        if entry['op'] == 'put':
+            records[record['id']] = factory(record)
+        elif entry['op'] == 'delete':
+            records.pop(record['id'], None)
+    return records
+
+
+def _trim_partial_line(path: str):
+    """Drop a trailing partial line left behind by a crash"""
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            step = min(4096, position)
+            f.seek(position - step)
+            chunk = f.read(step)
+            newline = chunk.rfind(b'\n')
+            if newline != -1:
+                position = position - step + newline + 1
+                break
+            position -= step
+        if position != end:
+            f.truncate(position)
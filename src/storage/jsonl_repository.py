@@ -0,0 +1,407 @@
+"""Newline-delimited JSON storage with an offset index
+
+Records are appended to a ``.jsonl`` file, one JSON object per line. An
+update appends the new version of a record and a deletion appends a
+tombstone, so a save never rewrites existing data. A sidecar ``.jsonl.idx``
+file maps every id to the byte offset and length of its latest line, which
+lets a lookup seek straight to one record instead of parsing the file.
+
+The services get a lazy mapping over the index: records are read on first
+access and kept in a small LRU cache, so memory holds the index plus the
+records in use rather than every record ever written.
+"""
+
+import json
+import os
+import tempfile
+import uuid
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.storage.durability import (
+    DEFAULT_DURABILITY, FSYNC_PER_COMMIT, NONE, OS_BUFFERED, fsync_directory, fsyncs, write_file
+)
+from src.storage.journal import _lock_for
+from src.storage.repository import EXPORT_CHUNK, UNCHANGED, Repository, RefreshResult
+
+DELETED = '_deleted'  # Key marking a tombstone line
+
+# (id, op, offset, length) of one data line
+IndexEntry = Tuple[str, str, int, int]
+
+
+class LazyRecords(MutableMapping):
+    """Mapping of id to model that reads records from the data file on demand
+
+    Records handed out stay the same objects for as long as someone holds
+    them, so a service can change a record and then save it. Records that
+    were assigned or queued for a save are pinned until they are written.
+    """
+
+    def __init__(self, repository: 'JsonlRepository', cache_size: int):
+        """Initialize mapping over the index of ``repository``"""
+        self._repository = repository
+        self._cache_size = cache_size
+        self._cache = OrderedDict()  # Recently used records, in LRU order
+        self._live = weakref.WeakValueDictionary()  # Records still referenced anywhere
+        self._pinned = {}  # Records not written yet, None for deletions
+
+    def __getitem__(self, record_id: str) -> Any:
+        if record_id in self._pinned:
+            record = self._pinned[record_id]
+            if record is None:
+                raise KeyError(record_id)
+            return record
+        record = self._live.get(record_id)
+        if record is None:
+            record = self._repository.read(record_id)
+            self._live[record_id] = record
+        self._cache[record_id] = record
+        self._cache.move_to_end(record_id)
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return record
+
+    def __setitem__(self, record_id: str, record: Any):
+        self._pinned[record_id] = record
+        self._live[record_id] = record
+
+    def __delitem__(self, record_id: str):
+        if record_id not in self:
+            raise KeyError(record_id)
+        self._pinned[record_id] = None
+        self._cache.pop(record_id, None)
+        self._live.pop(record_id, None)
+
+    def __contains__(self, record_id: object) -> bool:
+        if record_id in self._pinned:
+            return self._pinned[record_id] is not None
+        return record_id in self._repository.index
+
+    def __iter__(self) -> Iterator[str]:
+        for record_id in list(self._repository.index):
+            if record_id not in self._pinned:
+                yield record_id
+        for record_id, record in list(self._pinned.items()):
+            if record is not None:
+                yield record_id
+
+    def __len__(self) -> int:
+        index = self._repository.index
+        added = sum(1 for record_id, record in list(self._pinned.items())
+                    if record is not None and record_id not in index)
+        removed = sum(1 for record_id, record in list(self._pinned.items())
+                      if record is None and record_id in index)
+        return len(index) + added - removed
+
+    def pin(self, record_ids: Iterable[str]):
+        """Keep the current version of records in memory until they are written"""
+        for record_id in record_ids:
+            if record_id not in self._pinned:
+                self._pinned[record_id] = self.get(record_id)
+
+    def unpin(self, written: Dict[str, Any]):
+        """Release records that were written, unless they were replaced since"""
+        for record_id, record in written.items():
+            if record_id in self._pinned and self._pinned[record_id] is record:
+                del self._pinned[record_id]
+
+    def invalidate(self, record_ids: Optional[Iterable[str]] = None):
+        """Drop cached records changed by another instance (all if None)"""
+        if record_ids is None:
+            self._cache.clear()
+            self._live = weakref.WeakValueDictionary()
+            return
+        for record_id in record_ids:
+            self._cache.pop(record_id, None)
+            self._live.pop(record_id, None)
+
+
+class JsonlRepository(Repository):
+    """Appends records to a JSON-lines file indexed by byte offset"""
+
+    def __init__(self, data_file: str, factory: Callable[[dict], Any],
+                 durability: str = DEFAULT_DURABILITY, cache_size: int = 1024,
+                 compact_min: int = 1000):
+        """Initialize repository
+
+        Args:
+            data_file: JSON data file of the service; records are stored in a
+                ``.jsonl`` file next to it, which is seeded from it once
+            factory: Builds a model from a dict
+            durability: When appended lines are fsynced
+            cache_size: Number of recently used records kept in memory
+            compact_min: Rewrite the file without superseded lines once there
+                are this many of them and they outnumber the live records
+        """
+        super().__init__(factory)
+        self.seed_file = data_file
+        self.path = str(Path(data_file).with_suffix('.jsonl'))
+        self.index_path = self.path + '.idx'
+        self.durability = durability
+        self.cache_size = cache_size
+        self.compact_min = compact_min
+        self.lock = _lock_for(self.path)
+        self.index = {}  # id -> (offset, length) of the latest line
+        self._lines = 0  # Indexed lines, including superseded ones and tombstones
+        self._end = 0  # Byte position up to which the data file has been indexed
+        self._file = None
+        self._generation = None
+        self._ensure_data_file()
+
+    def _ensure_data_file(self):
+        """Create the data file, importing the records of the JSON data file"""
+        with self.lock:
+            if os.path.exists(self.path):
+                return
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            try:
+                with open(self.seed_file, 'r') as f:
+                    records = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                records = []
+            lines = [self._header(uuid.uuid4().hex)] + [json.dumps(record) for record in records]
+            write_file(self.path, '\n'.join(lines) + '\n', self._rewrite_durability())
+
+    def load(self) -> 'LazyRecords':
+        """Read the index and return a lazy mapping over the records"""
+        with self.lock:
+            self._open()
+            return LazyRecords(self, self.cache_size)
+
+    def read(self, record_id: str) -> Any:
+        """Read the latest version of one record, raising KeyError if missing"""
+        with self.lock:
+            offset, length = self.index[record_id]
+            self._file.seek(offset)
+            line = self._file.read(length)
+        return self.factory(json.loads(line))
+
+    def export(self, records: LazyRecords) -> Iterator[dict]:
+        """Read the latest line of every record, a chunk at a time, without building models"""
+        with self.lock:
+            record_ids = list(self.index)
+        for start in range(0, len(record_ids), EXPORT_CHUNK):
+            lines = []
+            with self.lock:
+                # Looked up again, as compaction moves lines between chunks
+                for record_id in record_ids[start:start + EXPORT_CHUNK]:
+                    location = self.index.get(record_id)
+                    if location is not None:
+                        self._file.seek(location[0])
+                        lines.append(self._file.read(location[1]))
+            for line in lines:
+                yield json.loads(line)
+
+    def refresh(self, records: LazyRecords) -> RefreshResult:
+        """Index lines appended by other instances and drop their records from the cache"""
+        with self.lock:
+            result = self._catch_up(records)
+        self.stats.record(result.outcome)
+        return result
+
+    def stage(self, records: LazyRecords, changed: Optional[Iterable[str]] = None):
+        """Pin records queued for a later save"""
+        records.pin(self._changed_ids(records, changed))
+
+    def save(self, records: LazyRecords, changed: Optional[Iterable[str]] = None):
+        """Append one line per changed record and index it"""
+        with self.lock:
+            self._catch_up(records)
+            written = {record_id: records.get(record_id)
+                       for record_id in self._changed_ids(records, changed)}
+            lines = []
+            for record_id, record in written.items():
+                if record is None:
+                    lines.append((record_id, 'delete', {'id': record_id, DELETED: True}))
+                else:
+                    lines.append((record_id, 'put', record.to_dict()))
+            self._append(lines)
+            records.unpin(written)
+            if self._lines - len(self.index) >= max(self.compact_min, len(self.index)):
+                self.compact()
+
+    def compact(self):
+        """Rewrite the data file with only the latest line of each record"""
+        with self.lock:
+            self._catch_up(None)
+            generation = uuid.uuid4().hex
+            level = self._rewrite_durability()
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.path) + '.',
+                                            suffix='.tmp')
+            index = {}
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    offset = f.write((self._header(generation) + '\n').encode('utf-8'))
+                    for record_id, (old_offset, length) in self.index.items():
+                        self._file.seek(old_offset)
+                        f.write(self._file.read(length) + b'\n')
+                        index[record_id] = (offset, length)
+                        offset += length + 1
+                    if fsyncs(level):
+                        f.flush()
+                        os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            if fsyncs(level):
+                fsync_directory(directory)
+            self._write_index(generation, index)
+            self._open()
+
+    def close(self):
+        """Close the data file"""
+        with self.lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def _open(self):
+        """(Re)open the data file and load its index"""
+        if self._file:
+            self._file.close()
+        self._file = open(self.path, 'rb')
+        header = json.loads(self._file.readline())
+        self._generation = header['generation']
+        self.index = {}
+        self._lines = 0
+        self._end = self._file.tell()
+        entries = self._read_index()
+        if entries is None:
+            # Missing or belonging to an older generation of the data file
+            self._write_index(self._generation, {})
+            entries = []
+        self._apply(entries)
+        repaired = self._scan_tail()
+        if repaired:
+            # Lines written by an instance that stopped before indexing them
+            self._append_index(repaired)
+
+    def _catch_up(self, records: Optional[LazyRecords]) -> RefreshResult:
+        """Index lines written by other instances; returns the ids they changed"""
+        try:
+            replaced = os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            replaced = False
+        if replaced:
+            # Another instance compacted the file
+            self._open()
+            if records is not None:
+                records.invalidate()
+            return RefreshResult('misses', None)
+        entries = self._scan_tail()
+        if not entries:
+            return UNCHANGED
+        changed = frozenset(record_id for record_id, _, _, _ in entries)
+        if records is not None:
+            records.invalidate(changed)
+        return RefreshResult('partial', changed)
+
+    def _scan_tail(self) -> List[IndexEntry]:
+        """Index the complete lines after ``self._end`` and return their entries"""
+        self._file.seek(self._end)
+        entries = []
+        offset = self._end
+        for line in self._file:
+            # A line without a newline is still being written
+            if not line.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                record = {}
+            if 'id' in record:
+                op = 'delete' if record.get(DELETED) else 'put'
+                entries.append((record['id'], op, offset, len(line) - 1))
+            offset += len(line)
+        self._apply(entries)
+        self._end = offset
+        return entries
+
+    def _apply(self, entries: List[IndexEntry]):
+        """Update the index with data lines in the order they were written"""
+        for record_id, op, offset, length in entries:
+            if op == 'delete':
+                self.index.pop(record_id, None)
+            else:
+                self.index[record_id] = (offset, length)
+            self._lines += 1
+            self._end = max(self._end, offset + length + 1)
+
+    def _append(self, lines: List[Tuple[str, str, dict]]):
+        """Append ``(id, op, data)`` lines to the data file and index them"""
+        with open(self.path, 'ab') as f:
+            offset = f.seek(0, os.SEEK_END)
+            if offset > self._end:
+                # Partial line left behind by a crash in the middle of an append
+                f.truncate(self._end)
+                offset = self._end
+            entries = []
+            for record_id, op, data in lines:
+                line = (json.dumps(data) + '\n').encode('utf-8')
+                f.write(line)
+                if self.durability == FSYNC_PER_COMMIT:
+                    f.flush()
+                    os.fsync(f.fileno())
+                entries.append((record_id, op, offset, len(line) - 1))
+                offset += len(line)
+            if fsyncs(self.durability) and self.durability != FSYNC_PER_COMMIT:
+                f.flush()
+                os.fsync(f.fileno())
+        self._apply(entries)
+        self._append_index(entries)
+
+    def _read_index(self) -> Optional[List[IndexEntry]]:
+        """Read the index file, or None if it does not match the data file"""
+        try:
+            with open(self.index_path, 'r') as f:
+                if f.readline().rstrip('\n') != self._generation:
+                    return None
+                entries = []
+                for line in f:
+                    fields = line.rstrip('\n').split('\t')
+                    # A torn last line is picked up again by scanning the data file
+                    if not line.endswith('\n') or len(fields) != 4:
+                        break
+                    record_id, op, offset, length = fields
+                    entries.append((record_id, op, int(offset), int(length)))
+                return entries
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_index(self, generation: str, index: Dict[str, Tuple[int, int]]):
+        """Replace the index file"""
+        lines = [generation] + [f'{record_id}\tput\t{offset}\t{length}'
+                                for record_id, (offset, length) in index.items()]
+        write_file(self.index_path, '\n'.join(lines) + '\n', OS_BUFFERED)
+
+    def _append_index(self, entries: List[IndexEntry]):
+        """Append entries to the index file
+
+        The index is never fsynced: if it lags behind the data file after a
+        crash, the missing entries are recovered from the data file on load.
+        """
+        with open(self.index_path, 'a') as f:
+            f.write(''.join(f'{record_id}\t{op}\t{offset}\t{length}\n'
+                            for record_id, op, offset, length in entries))
+
+    def _changed_ids(self, records: LazyRecords, changed: Optional[Iterable[str]]) -> List[str]:
+        """Ids to write for a save; every record plus deletions if ``changed`` is None"""
+        if changed is not None:
+            return list(changed)
+        return list(dict.fromkeys(list(self.index) + list(records._pinned)))
+
+    def _rewrite_durability(self) -> str:
+        """Level used when the whole data file is written at once"""
+        return OS_BUFFERED if self.durability == NONE else self.durability
+
+    @staticmethod
+    def _header(generation: str) -> str:
+        """First line of the data file, identifying its generation"""
+        return json.dumps({'generation': generation})
@@ -0,0 +1,259 @@
+"""Repository abstraction over the service data files
+
+Services keep their model objects in a dict keyed by id and delegate
+persistence to a repository. A repository loads that dict, brings it up to
+date with changes made by other instances, and persists the records whose
+ids the service reports as changed.
+"""
+
+import json
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, NamedTuple, Optional
+
+from src.storage.durability import DEFAULT_DURABILITY, validate_durability, write_file
+from src.storage.change_detection import CacheStats, file_signature
+from src.storage.compaction import Compactor
+from src.storage.journal import Journal, apply_entries
+
+BACKENDS = ('json', 'journal', 'sqlite', 'jsonl')
+
+# Records read from storage at a time by ``export``
+EXPORT_CHUNK = 1000
+
+
+class RefreshResult(NamedTuple):
+    """What a refresh picked up from other instances"""
+    outcome: str  # hits, partial or misses, as counted in the cache stats
+    changed: Optional[FrozenSet[str]]  # Ids put or deleted; None if everything was reloaded
+
+
+UNCHANGED = RefreshResult('hits', frozenset())
+
+
+class Repository:
+    """Base class for storage backends"""
+
+    def __init__(self, factory: Callable[[dict], Any]):
+        """Initialize repository with the function that builds a model from a dict"""
+        self.factory = factory
+        self.stats = CacheStats()
+
+    def load(self) -> Dict[str, Any]:
+        """Load every record, keyed by id"""
+        raise NotImplementedError
+
+    def refresh(self, records: Dict[str, Any]) -> RefreshResult:
+        """Update ``records`` in place with changes made by other instances
+
+        Returns:
+            ``hits`` if nothing changed; ``partial`` with the ids of the
+            records put or deleted, if only those were reloaded; ``misses``
+            without ids, if everything was reloaded
+        """
+        self.stats.record('misses')
+        records.clear()
+        records.update(self.load())
+        return RefreshResult('misses', None)
+
+    def save(self, records: Dict[str, Any], changed: Optional[Iterable[str]] = None):
+        """Persist the records whose ids are in ``changed`` (all records if None)
+
+        Ids that are no longer in ``records`` are deleted.
+        """
+        raise NotImplementedError
+
+    def stage(self, records: Dict[str, Any], changed: Optional[Iterable[str]] = None):
+        """Note that ``changed`` records will be saved later (see group commit)
+
+        Backends whose records are not all held in memory use this to keep
+        the changed records around until they are written.
+        """
+
+    def export(self, records: Dict[str, Any]) -> Iterator[dict]:
+        """Iterate over every record as a dict, for streaming them out
+
+        Backends holding the records in memory serialize them one at a time;
+        the others read them from storage a chunk at a time, without
+        building models, so exporting takes the same memory however large
+        the table is.
+        """
+        for record_id in list(records):
+            record = records.get(record_id)
+            if record is not None:
+                yield record.to_dict()
+
+    def commit_future(self) -> Future:
+        """Get a future resolved once every change saved so far is persisted"""
+        future = Future()
+        future.set_result(None)
+        return future
+
+    def flush(self):
+        """Wait until every change saved so far is persisted"""
+
+    def close(self):
+        """Release any resources held by the repository"""
+
+
+class JsonRepository(Repository):
+    """Stores all records as a single JSON array, rewritten on every save"""
+
+    def __init__(self, data_file: str, factory: Callable[[dict], Any],
+                 durability: str = DEFAULT_DURABILITY):
+        """Initialize repository with data file path and durability level"""
+        super().__init__(factory)
+        self.data_file = data_file
+        self.durability = durability
+        self._signature = None  # Signature of the data file when it was last read
+        self._ensure_data_file()
+
+    def _ensure_data_file(self):
+        """Ensure data directory and file exist"""
+        data_path = Path(self.data_file)
+        data_path.parent.mkdir(parents=True, exist_ok=True)
+        if not data_path.exists():
+            with open(self.data_file, 'w') as f:
+                json.dump([], f)
+
+    def load(self) -> Dict[str, Any]:
+        """Load records from the JSON file"""
+        self._signature = file_signature(self.data_file)
+        try:
+            with open(self.data_file, 'r') as f:
+                return {record['id']: self.factory(record) for record in json.load(f)}
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def refresh(self, records: Dict[str, Any]) -> RefreshResult:
+        """Reload the JSON file only if its mtime, size or inode changed"""
+        if file_signature(self.data_file) == self._signature:
+            self.stats.record('hits')
+            return UNCHANGED
+        return super().refresh(records)
+
+    def save(self, records: Dict[str, Any], changed: Optional[Iterable[str]] = None):
+        """Rewrite the JSON file with every record"""
+        up_to_date = file_signature(self.data_file) == self._signature
+        data = json.dumps([record.to_dict() for record in list(records.values())], indent=2)
+        write_file(self.data_file, data, self.durability)
+        # The file now matches our records, unless someone else had written
+        # to it since our last read and we still owe them a reload.
+        if up_to_date:
+            self._signature = file_signature(self.data_file)
+
+
+class JournalRepository(JsonRepository):
+    """Appends changes to a journal that is periodically folded into the JSON file"""
+
+    def __init__(self, data_file: str, factory: Callable[[dict], Any],
+                 durability: str = DEFAULT_DURABILITY, compact_every: Optional[int] = 1000,
+                 snapshot_format: str = 'json'):
+        """Initialize repository
+
+        Args:
+            data_file: JSON file holding the latest snapshot
+            factory: Builds a model from a dict
+            durability: When journal appends and snapshots are fsynced
+            compact_every: Fold the journal into the snapshot once it holds
+                this many entries (None disables automatic compaction)
+            snapshot_format: ``binary`` keeps snapshots in a ``.snap`` file
+                next to the data file, which is then only read until the
+                first compaction
+        """
+        super().__init__(data_file, factory, durability)
+        self.journal = Journal(str(Path(data_file).with_suffix('.journal')), durability)
+        if snapshot_format == 'binary':
+            self.compactor = Compactor(self.journal, str(Path(data_file).with_suffix('.snap')),
+                                       compact_every, snapshot_format, seed_file=data_file)
+        else:
+            self.compactor = Compactor(self.journal, data_file, compact_every, snapshot_format)
+
+    def load(self) -> Dict[str, Any]:
+        """Load the latest snapshot plus the journal tail"""
+        return self.compactor.load(self.factory)
+
+    def refresh(self, records: Dict[str, Any]) -> RefreshResult:
+        """Replay only the entries appended since the last read"""
+        entries = self.journal.read_new()
+        if entries is None:
+            return Repository.refresh(self, records)
+        if entries:
+            self.stats.record('partial')
+            apply_entries(records, entries, self.factory)
+            return RefreshResult('partial', frozenset(entry['record']['id'] for entry in entries))
+        self.stats.record('hits')
+        return UNCHANGED
+
+    def save(self, records: Dict[str, Any], changed: Optional[Iterable[str]] = None):
+        """Append one journal entry per changed record"""
+        changes = []
+        for record_id in (list(records.keys()) if changed is None else changed):
+            record = records.get(record_id)
+            if record is None:
+                changes.append(('delete', {'id': record_id}))
+            else:
+                changes.append(('put', record.to_dict()))
+        self.journal.append_many(changes)
+        self.compactor.maybe_compact(records, self.factory)
+
+    def close(self):
+        """Wait for a running compaction to finish"""
+        self.compactor.wait()
+
+
+def create_repository(backend: str, data_file: str, factory: Callable[[dict], Any],
+                      table: str, indexed_fields: Iterable[str] = (),
+                      durability: str = DEFAULT_DURABILITY, group_commit: bool = False,
+                      commit_interval: float = 0.05, commit_batch: int = 100,
+                      shards: int = 1, unique_fields: Iterable[str] = (),
+                      **options) -> Repository:
+    """Create the repository for a service
+
+    Args:
+        backend: One of ``json``, ``journal``, ``sqlite`` or ``jsonl``
+        data_file: JSON data file of the service; the SQLite backend imports
+            it into an empty table
+        factory: Builds a model from a dict
+        table: Table name used by the SQLite backend
+        indexed_fields: Record fields stored in indexed SQLite columns
+        unique_fields: Indexed fields the SQLite backend keeps unique
+        durability: One of the levels in ``src.storage.durability``
+        group_commit: Batch saves and flush them from a background thread
+        commit_interval: Longest time in seconds a change waits to be flushed
+        commit_batch: Flush as soon as this many records are pending
+        shards: Spread records over this many shard files by a hash of
+            their id (not supported by the SQLite backend)
+        **options: Backend specific options (``compact_every`` and
+            ``snapshot_format`` for the journal backend, ``database`` for the
+            SQLite backend, ``cache_size`` and ``compact_min`` for the
+            JSON-lines backend)
+    """
+    validate_durability(durability)
+    if shards > 1:
+        if backend == 'sqlite':
+            raise ValueError('Sharding is not supported by the sqlite backend')
+        from src.storage.sharding import ShardedRepository
+        repository = ShardedRepository(data_file, shards, lambda shard_file: create_repository(
+            backend, shard_file, factory, table, indexed_fields, durability, **options
+        ))
+    elif backend == 'json':
+        repository = JsonRepository(data_file, factory, durability, **options)
+    elif backend == 'journal':
+        repository = JournalRepository(data_file, factory, durability, **options)
+    elif backend == 'sqlite':
+        from src.storage.sqlite_repository import SqliteRepository
+        database = options.pop('database', None) or str(Path(data_file).parent / 'bookstore.db')
+        repository = SqliteRepository(database, table, factory, indexed_fields,
+                                      seed_file=data_file, durability=durability,
+                                      unique_fields=unique_fields, **options)
+    elif backend == 'jsonl':
+        from src.storage.jsonl_repository import JsonlRepository
+        repository = JsonlRepository(data_file, factory, durability, **options)
+    else:
+        raise ValueError(f'Unknown storage backend: {backend}. Must be one of: {", ".join(BACKENDS)}')
+
+    if group_commit:
+        from src.storage.group_commit import GroupCommitRepository
+        repository = GroupCommitRepository(repository, commit_interval, commit_batch)
+    return repository
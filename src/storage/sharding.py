@@ -0,0 +1,191 @@
+"""Hash-sharded storage
+
+Records are spread over N shards by a stable hash of their id. Every shard
+is a repository of its own with its own file, lock and dirty flag, so a
+save only rewrites the shards holding changed records and writes to
+different shards never wait for each other.
+"""
+
+import json
+import threading
+import zlib
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from src.storage.durability import write_file
+from src.storage.repository import Repository, RefreshResult
+
+
+def shard_of(record_id: str, shards: int) -> int:
+    """Shard a record id belongs to; stable across processes, unlike hash()"""
+    return zlib.crc32(record_id.encode('utf-8')) % shards
+
+
+def shard_file(data_file: str, shard: int, shards: int) -> str:
+    """Data file of one shard, e.g. ``orders.2-of-4.json`` for ``orders.json``"""
+    path = Path(data_file)
+    return str(path.with_name(f'{path.stem}.{shard}-of-{shards}{path.suffix}'))
+
+
+class ShardedRecords(MutableMapping):
+    """Mapping of id to model spread over one mapping per shard"""
+
+    def __init__(self, shards: List[MutableMapping]):
+        """Initialize mapping over the records of each shard"""
+        self.shards = shards
+
+    def shard(self, record_id: str) -> MutableMapping:
+        """Records of the shard holding ``record_id``"""
+        return self.shards[shard_of(record_id, len(self.shards))]
+
+    def __getitem__(self, record_id: str) -> Any:
+        return self.shard(record_id)[record_id]
+
+    def __setitem__(self, record_id: str, record: Any):
+        self.shard(record_id)[record_id] = record
+
+    def __delitem__(self, record_id: str):
+        del self.shard(record_id)[record_id]
+
+    def __contains__(self, record_id: object) -> bool:
+        return isinstance(record_id, str) and record_id in self.shard(record_id)
+
+    def __iter__(self) -> Iterator[str]:
+        for shard in self.shards:
+            yield from list(shard)
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards)
+
+
+class Shard:
+    """One shard: its repository, the lock serializing its writes and its dirty ids"""
+
+    def __init__(self, repository: Repository):
+        """Initialize shard around its repository"""
+        self.repository = repository
+        self.lock = threading.Lock()
+        self._guard = threading.Lock()
+        self._pending = set()  # Changed ids not written yet
+        self._pending_all = False
+
+    @property
+    def dirty(self) -> bool:
+        """Whether the shard has changes that are not written yet"""
+        return self._pending_all or bool(self._pending)
+
+    def mark_dirty(self, changed: Optional[List[str]]):
+        """Note changed ids (every record if None) to be written"""
+        with self._guard:
+            if changed is None:
+                self._pending_all = True
+            else:
+                self._pending.update(changed)
+
+    def take_dirty(self) -> Optional[List[str]]:
+        """Clear the dirty flag and return the ids to write (None for every record)"""
+        with self._guard:
+            changed = None if self._pending_all else list(self._pending)
+            self._pending = set()
+            self._pending_all = False
+            return changed
+
+
+class ShardedRepository(Repository):
+    """Spreads records over several repositories by a hash of their id"""
+
+    def __init__(self, data_file: str, shards: int, create: Callable[[str], Repository]):
+        """Initialize repository
+
+        Args:
+            data_file: Data file of the service; its records are split over
+                the shard files the first time the shards are created
+            shards: Number of shards
+            create: Creates the repository of a shard from its data file
+        """
+        if shards < 1:
+            raise ValueError('Number of shards must be at least 1')
+        self.data_file = data_file
+        self._split_data_file(shards)
+        self.shards = [Shard(create(shard_file(data_file, shard, shards)))
+                       for shard in range(shards)]
+        super().__init__(self.shards[0].repository.factory)
+        for shard in self.shards:
+            shard.repository.stats = self.stats
+
+    def load(self) -> ShardedRecords:
+        """Load the records of every shard"""
+        return ShardedRecords([shard.repository.load() for shard in self.shards])
+
+    def refresh(self, records: ShardedRecords) -> RefreshResult:
+        """Refresh every shard from its own file"""
+        results = [shard.repository.refresh(shard_records)
+                   for shard, shard_records in zip(self.shards, records.shards)]
+        outcomes = {result.outcome for result in results}
+        outcome = next((outcome for outcome in ('misses', 'partial') if outcome in outcomes), 'hits')
+        if any(result.changed is None for result in results):
+            return RefreshResult(outcome, None)
+        return RefreshResult(outcome, frozenset().union(*(result.changed for result in results)))
+
+    def export(self, records: ShardedRecords) -> Iterator[dict]:
+        """Export every shard in turn"""
+        for shard, shard_records in zip(self.shards, records.shards):
+            yield from shard.repository.export(shard_records)
+
+    def stage(self, records: ShardedRecords, changed: Optional[Iterable[str]] = None):
+        """Pass queued changes on to the shards holding them"""
+        for index, ids in self._group(changed).items():
+            self.shards[index].repository.stage(records.shards[index], ids)
+
+    def save(self, records: ShardedRecords, changed: Optional[Iterable[str]] = None):
+        """Write only the shards holding changed records"""
+        groups = self._group(changed)
+        for index, ids in groups.items():
+            self.shards[index].mark_dirty(ids)
+        for index in groups:
+            shard = self.shards[index]
+            with shard.lock:
+                if not shard.dirty:
+                    continue  # Written by a concurrent save while we waited
+                ids = shard.take_dirty()
+                try:
+                    shard.repository.save(records.shards[index], ids)
+                except BaseException:
+                    shard.mark_dirty(ids)
+                    raise
+
+    def flush(self):
+        """Wait until every shard has persisted its changes"""
+        for shard in self.shards:
+            shard.repository.flush()
+
+    def close(self):
+        """Close every shard"""
+        for shard in self.shards:
+            shard.repository.close()
+
+    def _group(self, changed: Optional[Iterable[str]]) -> Dict[int, Optional[List[str]]]:
+        """Changed ids by shard; every shard with None if ``changed`` is None"""
+        if changed is None:
+            return {index: None for index in range(len(self.shards))}
+        groups = {}
+        for record_id in changed:
+            groups.setdefault(shard_of(record_id, len(self.shards)), []).append(record_id)
+        return groups
+
+    def _split_data_file(self, shards: int):
+        """Seed missing shard files with their part of the unsharded data file"""
+        files = [shard_file(self.data_file, shard, shards) for shard in range(shards)]
+        if any(Path(file).exists() for file in files):
+            return
+        try:
+            with open(self.data_file, 'r') as f:
+                records = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        parts = [[] for _ in range(shards)]
+        for record in records:
+            parts[shard_of(record['id'], shards)].append(record)
+        for file, part in zip(files, parts):
+            write_file(file, json.dumps(part, indent=2))
@@ -0,0 +1,209 @@
+"""SQLite storage backend
+
+Each service gets its own table in a shared database file. The full record
+is stored as JSON in the ``data`` column, and the fields services filter on
+are copied into indexed columns. Saving a changed record is a single-row
+upsert, so a stock decrement or status change touches one row instead of
+rewriting a whole file.
+"""
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+from src.storage.durability import (
+    DEFAULT_DURABILITY, FSYNC_PER_COMMIT, FSYNC_PER_GROUP, NONE, OS_BUFFERED
+)
+from src.storage.repository import EXPORT_CHUNK, UNCHANGED, Repository, RefreshResult
+
+# PRAGMA synchronous setting for each durability level. In WAL mode NORMAL
+# survives an application crash but may lose the last commits on power loss.
+SYNCHRONOUS = {
+    NONE: 'OFF',
+    OS_BUFFERED: 'NORMAL',
+    FSYNC_PER_COMMIT: 'FULL',
+    FSYNC_PER_GROUP: 'FULL',
+}
+
+
+class SqliteRepository(Repository):
+    """Stores records as rows of a SQLite table in WAL mode"""
+
+    def __init__(self, database: str, table: str, factory: Callable[[dict], Any],
+                 indexed_fields: Iterable[str] = (), seed_file: Optional[str] = None,
+                 durability: str = DEFAULT_DURABILITY, unique_fields: Iterable[str] = ()):
+        """Initialize repository
+
+        Args:
+            database: Path of the SQLite database file
+            table: Name of the table holding the records
+            factory: Builds a model from a dict
+            indexed_fields: Record fields copied into indexed columns
+            seed_file: JSON file imported when the table is empty
+            durability: ``fsync-per-commit`` commits every row in its own
+                transaction, ``fsync-per-group`` commits each save as one
+            unique_fields: Indexed fields no two rows may share; a save
+                breaking this raises ValueError
+        """
+        super().__init__(factory)
+        self.database = database
+        self.table = table
+        self.indexed_fields = tuple(indexed_fields)
+        self.unique_fields = tuple(unique_fields)
+        self.durability = durability
+        self._lock = threading.Lock()
+        self._rev = 0  # Highest row revision applied to the caller's records
+        self._data_version = None
+
+        Path(database).parent.mkdir(parents=True, exist_ok=True)
+        # Waitress serves requests from several threads; access to the
+        # connection is serialized by self._lock.
+        self._conn = sqlite3.connect(database, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(f'PRAGMA synchronous={SYNCHRONOUS[durability]}')
+        self._create_table()
+        if seed_file:
+            self._seed(seed_file)
+
+    def _create_table(self):
+        """Create the table and its indexes if they do not exist yet"""
+        columns = ''.join(f'{field} TEXT, ' for field in self.indexed_fields)
+        with self._lock:
+            self._conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table} '
+                f'(id TEXT PRIMARY KEY, {columns}rev INTEGER NOT NULL, data TEXT NOT NULL)'
+            )
+            for field in self.indexed_fields + ('rev',):
+                self._conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS idx_{self.table}_{field} ON {self.table} ({field})'
+                )
+            for field in self.unique_fields:
+                self._conn.execute(
+                    f'CREATE UNIQUE INDEX IF NOT EXISTS uniq_{self.table}_{field} ON {self.table} ({field})'
+                )
+
+    def _seed(self, seed_file: str):
+        """Import records from a JSON file into an empty table"""
+        with self._lock:
+            if self._conn.execute(f'SELECT 1 FROM {self.table} LIMIT 1').fetchone():
+                return
+        try:
+            with open(seed_file, 'r') as f:
+                records = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        with self._lock:
+            self._write(((record['id'], record) for record in records), ())
+
+    def load(self) -> Dict[str, Any]:
+        """Load every row of the table"""
+        with self._lock:
+            self._data_version = self._query_data_version()
+            rows = self._conn.execute(f'SELECT rev, data FROM {self.table}').fetchall()
+        self._rev = max((rev for rev, _ in rows), default=0)
+        records = {}
+        for _, data in rows:
+            record = self.factory(json.loads(data))
+            records[record.id] = record
+        return records
+
+    def refresh(self, records: Dict[str, Any]) -> RefreshResult:
+        """Reload only the rows written since the last load or refresh"""
+        with self._lock:
+            data_version = self._query_data_version()
+            if data_version == self._data_version:
+                self.stats.record('hits')
+                return UNCHANGED
+            self._data_version = data_version
+            rows = self._conn.execute(
+                f'SELECT rev, data FROM {self.table} WHERE rev > ? ORDER BY rev', (self._rev,)
+            ).fetchall()
+            ids = {row[0] for row in self._conn.execute(f'SELECT id FROM {self.table}')}
+        changed = set()
+        for rev, data in rows:
+            record = self.factory(json.loads(data))
+            records[record.id] = record
+            changed.add(record.id)
+            self._rev = rev
+        # Rows deleted by another instance leave no rev behind, so compare keys;
+        # counts would miss a delete paired with an insert
+        for record_id in [record_id for record_id in records if record_id not in ids]:
+            del records[record_id]
+            changed.add(record_id)
+        self.stats.record('partial')
+        return RefreshResult('partial', frozenset(changed))
+
+    def export(self, records: Dict[str, Any]) -> Iterator[dict]:
+        """Read the rows in id order, a chunk at a time, without building models"""
+        last_id = ''
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f'SELECT id, data FROM {self.table} WHERE id > ? ORDER BY id LIMIT ?',
+                    (last_id, EXPORT_CHUNK)
+                ).fetchall()
+            for _, data in rows:
+                yield json.loads(data)
+            if len(rows) < EXPORT_CHUNK:
+                return
+            last_id = rows[-1][0]
+
+    def save(self, records: Dict[str, Any], changed: Optional[Iterable[str]] = None):
+        """Upsert the changed rows and delete the removed ones in one transaction"""
+        upserts = []
+        deletes = []
+        for record_id in (list(records.keys()) if changed is None else changed):
+            record = records.get(record_id)
+            if record is None:
+                deletes.append(record_id)
+            else:
+                upserts.append((record_id, record.to_dict()))
+        with self._lock:
+            if self.durability == FSYNC_PER_COMMIT:
+                for upsert in upserts:
+                    self._write([upsert], ())
+                for record_id in deletes:
+                    self._write((), [record_id])
+            else:
+                self._write(upserts, deletes)
+
+    def _write(self, upserts: Iterable[tuple], deletes: Iterable[str]):
+        """Apply upserts and deletes in a single transaction"""
+        columns = ''.join(f'{field}, ' for field in self.indexed_fields)
+        placeholders = '?, ' * len(self.indexed_fields)
+        updates = ''.join(f'{field} = excluded.{field}, ' for field in self.indexed_fields)
+        upsert_sql = (
+            f'INSERT INTO {self.table} (id, {columns}rev, data) VALUES (?, {placeholders}?, ?) '
+            f'ON CONFLICT(id) DO UPDATE SET {updates}rev = excluded.rev, data = excluded.data'
+        )
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            rev = self._conn.execute(f'SELECT COALESCE(MAX(rev), 0) FROM {self.table}').fetchone()[0]
+            caught_up = rev == self._rev
+            for record_id, data in upserts:
+                rev += 1
+                values = [data.get(field) for field in self.indexed_fields]
+                self._conn.execute(upsert_sql, (record_id, *values, rev, json.dumps(data)))
+            for record_id in deletes:
+                self._conn.execute(f'DELETE FROM {self.table} WHERE id = ?', (record_id,))
+            self._conn.execute('COMMIT')
+        except sqlite3.IntegrityError as e:
+            self._conn.execute('ROLLBACK')
+            raise ValueError(f'Duplicate value in {self.table}: {e}') from e
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+        # Our own writes are already in the caller's records
+        if caught_up:
+            self._rev = rev
+
+    def _query_data_version(self) -> int:
+        """Get the counter SQLite bumps when another connection commits"""
+        return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,669 @@
+"""Tests for the HTTP API, through the Flask test client"""
+
+import gzip
+import json
+import pytest
+from concurrent.futures import Future
+from datetime import datetime
+from src.api.app import create_app
+from src.models.book import Book
+from src.services.delivery_service import DeliveryService
+from src.services.sales_service import SalesService
+
+
+API_KEY = {'X-API-Key': 'test-api-key-123'}
+
+ORDER_ITEMS = [{'book_id': 'book-001', 'title': 'Test Book', 'quantity': 1, 'unit_price': 10.0}]
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    """Settings of the app under test"""
+    return {'TESTING': True, 'DATA_DIR': str(tmp_path)}
+
+
+@pytest.fixture
+def app(app_config):
+    """Create an app storing its data in a temporary directory"""
+    return create_app(config=app_config)
+
+
+@pytest.fixture
+def client(app):
+    """Create a test client for the app"""
+    return app.test_client()
+
+
+@pytest.fixture
+def services(app):
+    """Services shared by the app's routes"""
+    return app.extensions['services']
+
+
+class TestListETags:
+    """Test conditional requests on the order and delivery lists"""
+
+    def test_unchanged_list_not_modified(self, client, services):
+        """Test resending the ETag of an unchanged list gets a 304"""
+        services['sales'].create_order("John Doe", "john@example.com", ORDER_ITEMS)
+
+        first = client.get('/api/sales/orders', headers=API_KEY)
+        assert first.status_code == 200
+        assert first.headers['ETag']
+
+        second = client.get('/api/sales/orders',
+                            headers={**API_KEY, 'If-None-Match': first.headers['ETag']})
+        assert second.status_code == 304
+        assert second.data == b''
+
+    @pytest.mark.parametrize('path, service, queries', [
+        ('/api/sales/orders', 'sales', ('find_orders', 'get_orders_page')),
+        ('/api/inventory/books', 'inventory', ('find_books', 'get_books_page')),
+        ('/api/delivery/deliveries', 'delivery', ('get_all_deliveries', 'get_deliveries_page')),
+    ])
+    def test_not_modified_skips_query(self, client, services, monkeypatch, path, service, queries):
+        """Test a 304 is answered without running the list query"""
+        first = client.get(path, query_string={'limit': 5}, headers=API_KEY)
+        assert first.status_code == 200
+
+        def query(*args, **kwargs):
+            raise AssertionError("list queried for a 304")
+        for name in queries:
+            monkeypatch.setattr(services[service], name, query)
+        second = client.get(path, query_string={'limit': 5},
+                            headers={**API_KEY, 'If-None-Match': first.headers['ETag']})
+        assert second.status_code == 304
+
+    @pytest.mark.parametrize('cursor', ['not-a-cursor', 'WyJhIiwiYiJd'])
+    def test_bad_cursor_rejected(self, client, services, cursor):
+        """Test malformed cursors, and cursors of another listing, get a 400 without an ETag"""
+        services['sales'].create_order("John Doe", "john@example.com", ORDER_ITEMS)
+        response = client.get('/api/sales/orders', query_string={'limit': 5, 'cursor': cursor},
+                              headers=API_KEY)
+
+        assert response.status_code == 400
+        assert 'ETag' not in response.headers
+
+    def test_local_change_invalidates_etag(self, client, services):
+        """Test a change made through this app gets a fresh list"""
+        services['sales'].create_order("John Doe", "john@example.com", ORDER_ITEMS)
+        etag = client.get('/api/sales/orders', headers=API_KEY).headers['ETag']
+
+        services['sales'].create_order("Jane Doe", "jane@example.com", ORDER_ITEMS)
+        response = client.get('/api/sales/orders', headers={**API_KEY, 'If-None-Match': etag})
+
+        assert response.status_code == 200
+        assert response.get_json()['count'] == 2
+        assert response.headers['ETag'] != etag
+
+    def test_outside_change_invalidates_order_etag(self, client, services):
+        """Test an order written by another instance is not hidden behind a 304"""
+        services['sales'].create_order("John Doe", "john@example.com", ORDER_ITEMS)
+        etag = client.get('/api/sales/orders', headers=API_KEY).headers['ETag']
+
+        other = SalesService(data_file=services['sales'].repository.data_file)
+        other.create_order("Jane Doe", "jane@example.com", ORDER_ITEMS)
+        response = client.get('/api/sales/orders', headers={**API_KEY, 'If-None-Match': etag})
+
+        assert response.status_code == 200
+        assert response.get_json()['count'] == 2
+
+        again = client.get('/api/sales/orders',
+                           headers={**API_KEY, 'If-None-Match': response.headers['ETag']})
+        assert again.status_code == 304
+
+    def test_record_etag_follows_content(self, client, services):
+        """Test an order's ETag is made of its content, so another instance's change is seen"""
+        order = services['sales'].create_order("John Doe", "john@example.com", ORDER_ITEMS)
+        first = client.get(f'/api/sales/orders/{order.id}', headers=API_KEY)
+        assert 'version' not in first.get_json()
+
+        other = SalesService(data_file=services['sales'].repository.data_file)
+        other.update_order_status(order.id, 'processing')
+        response = client.get(f'/api/sales/orders/{order.id}',
+                              headers={**API_KEY, 'If-None-Match': first.headers['ETag']})
+
+        assert response.status_code == 200
+        assert response.get_json()['status'] == 'processing'
+
+    def test_outside_change_invalidates_delivery_etag(self, client, services):
+        """Test a delivery written by another instance is not hidden behind a 304"""
+        services['delivery'].create_delivery("order-001", "123 Main St")
+        first = client.get('/api/delivery/deliveries', headers=API_KEY)
+        assert first.status_code == 200
+
+        unchanged = client.get('/api/delivery/deliveries',
+                               headers={**API_KEY, 'If-None-Match': first.headers['ETag']})
+        assert unchanged.status_code == 304
+
+        other = DeliveryService(data_file=services['delivery'].repository.data_file)
+        other.create_delivery("order-002", "456 Oak Ave")
+        response = client.get('/api/delivery/deliveries',
+                              headers={**API_KEY, 'If-None-Match': first.headers['ETag']})
+
+        assert response.status_code == 200
+        assert response.get_json()['count'] == 2
+
+
+class TestCompression:
+    """Test gzip negotiation and the compressed listing cache"""
+
+    @pytest.fixture
+    def app_config(self, tmp_path):
+        """Compress any body of 200 bytes or more"""
+        return {'TESTING': True, 'DATA_DIR': str(tmp_path), 'COMPRESS_MIN_SIZE': 200}
+
+    @pytest.fixture
+    def orders(self, services):
+        """Create enough orders for the list to pass the size threshold"""
+        return [services['sales'].create_order(f"Customer {i}", f"customer{i}@example.com", ORDER_ITEMS)
+                for i in range(3)]
+
+    def get_orders(self, client, **headers):
+        """Get the order list, accepting gzip"""
+        return client.get('/api/sales/orders',
+                          headers={**API_KEY, 'Accept-Encoding': 'gzip', **headers})
+
+    def test_gzip_when_accepted(self, client, orders):
+        """Test a large body is gzipped for a client accepting gzip"""
+        response = self.get_orders(client)
+
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert json.loads(gzip.decompress(response.data))['count'] == 3
+
+    def test_identity_when_not_accepted(self, client, orders):
+        """Test a client not accepting gzip gets the plain body, still varying on encoding"""
+        for encoding in (None, 'identity', 'gzip;q=0'):
+            headers = {**API_KEY, 'Accept-Encoding': encoding} if encoding else API_KEY
+            response = client.get('/api/sales/orders', headers=headers)
+
+            assert 'Content-Encoding' not in response.headers
+            assert 'Accept-Encoding' in response.headers['Vary']
+            assert response.get_json()['count'] == 3
+
+    def test_gzip_etag_is_weak(self, client, orders):
+        """Test the ETag of a gzipped body is weak, and the plain one strong"""
+        compressed = self.get_orders(client)
+        plain = client.get('/api/sales/orders', headers=API_KEY)
+
+        assert compressed.headers['ETag'].startswith('W/')
+        assert not plain.headers['ETag'].startswith('W/')
+        assert compressed.headers['ETag'] == 'W/' + plain.headers['ETag']
+
+        # Either form of the tag matches on revalidation
+        for etag in (compressed.headers['ETag'], plain.headers['ETag']):
+            assert self.get_orders(client, **{'If-None-Match': etag}).status_code == 304
+
+    def test_small_body_not_compressed(self, client, services):
+        """Test a body under COMPRESS_MIN_SIZE is sent as is"""
+        response = self.get_orders(client)
+
+        assert len(response.data) < 200
+        assert 'Content-Encoding' not in response.headers
+        assert 'Vary' not in response.headers
+        assert response.get_json()['count'] == 0
+
+    def test_cache_hit(self, app, client, orders):
+        """Test the compressed listing is cached by ETag and served from the cache"""
+        cache = app.extensions['compressed_cache']
+        first = self.get_orders(client)
+        etag, weak = first.get_etag()
+        assert weak
+        assert cache.get(etag) == first.data
+
+        cache.put(etag, gzip.compress(b'{"orders": [], "count": 42}'))
+        second = self.get_orders(client)
+
+        assert second.headers['ETag'] == first.headers['ETag']
+        assert second.headers['Content-Encoding'] == 'gzip'
+        assert json.loads(gzip.decompress(second.data))['count'] == 42
+
+    def test_cache_hit_skips_query(self, services, client, orders, monkeypatch):
+        """Test a cached listing is served without querying the orders"""
+        first = self.get_orders(client)
+
+        def query(*args, **kwargs):
+            raise AssertionError("orders queried for a cached listing")
+        monkeypatch.setattr(services['sales'], 'find_orders', query)
+        second = self.get_orders(client)
+
+        assert second.status_code == 200
+        assert second.data == first.data
+
+    def test_uncompressed_request_skips_cache(self, app, client, orders):
+        """Test a client not accepting gzip neither reads nor fills the cache"""
+        response = client.get('/api/sales/orders', headers=API_KEY)
+
+        assert response.get_json()['count'] == 3
+        assert app.extensions['compressed_cache'].get(response.get_etag()[0]) is None
+
+    def test_local_change_invalidates_cache(self, client, services, orders):
+        """Test a write moves the listing to a new ETag, so the cached body is not served"""
+        first = self.get_orders(client)
+        services['sales'].create_order("Jane Doe", "jane@example.com", ORDER_ITEMS)
+        second = self.get_orders(client)
+
+        assert second.headers['ETag'] != first.headers['ETag']
+        assert json.loads(gzip.decompress(second.data))['count'] == 4
+
+    def test_outside_change_invalidates_cache(self, client, services, orders):
+        """Test an order written by another instance is in the very next compressed listing"""
+        first = self.get_orders(client)
+
+        other = SalesService(data_file=services['sales'].repository.data_file)
+        other.create_order("Jane Doe", "jane@example.com", ORDER_ITEMS)
+        second = self.get_orders(client)
+
+        assert second.headers['ETag'] != first.headers['ETag']
+        assert json.loads(gzip.decompress(second.data))['count'] == 4
+
+
+def add_book(services, book_id, stock, isbn=None):
+    """Add a book to the app's inventory"""
+    book = Book(id=book_id, title=f"Book {book_id}", author="Author",
+                isbn=isbn or f"978-0-000000-{book_id[-2:]}-0", price=10.0, stock_quantity=stock)
+    services['inventory'].add_book(book)
+    return book
+
+
+class TestCompleteOrderBatch:
+    """Test placing many complete orders in one request"""
+
+    def order(self, book_id='book-001', quantity=1, **fields):
+        """Body of one order of the batch"""
+        return {'customer_name': "John Doe", 'customer_email': "john@example.com",
+                'shipping_address': "123 Main St",
+                'items': [{'book_id': book_id, 'quantity': quantity}], **fields}
+
+    def post(self, client, orders):
+        """Post a batch of orders"""
+        return client.post('/api/orders/complete/batch', json={'orders': orders}, headers=API_KEY)
+
+    def test_all_completed(self, client, services):
+        """Test a batch whose orders all succeed gets a 201"""
+        add_book(services, 'book-001', 5)
+        response = self.post(client, [self.order(quantity=2), self.order(quantity=3)])
+
+        assert response.status_code == 201
+        data = response.get_json()
+        assert data['completed'] == 2
+        assert data['failed'] == 0
+        assert all(result['order']['payment_status'] == 'paid' for result in data['results'])
+        assert services['inventory'].get_book_by_id('book-001').stock_quantity == 0
+
+    def test_per_order_results(self, client, services):
+        """Test a partly failed batch gets a 207 with the status of each order"""
+        add_book(services, 'book-001', 2)
+        response = self.post(client, [
+            self.order(quantity=2),
+            self.order(quantity=1),
+            self.order(book_id='missing'),
+            self.order(quantity=True),
+            {'customer_name': "No Items"}
+        ])
+
+        assert response.status_code == 207
+        data = response.get_json()
+        assert data['completed'] == 1
+        assert data['failed'] == 4
+        results = data['results']
+        assert [result['index'] for result in results] == [0, 1, 2, 3, 4]
+        assert [result['status'] for result in results] == [201, 400, 404, 400, 400]
+        assert results[0]['delivery']['order_id'] == results[0]['order']['id']
+        assert results[1]['error'] == 'Insufficient stock'
+        assert results[3]['error'] == 'Invalid request'
+        assert results[4]['error'] == 'Missing required field'
+        assert len(services['sales'].get_all_orders()) == 1
+
+    def test_bool_quantity_rejected(self, client, services):
+        """Test true is not taken for a quantity of 1"""
+        add_book(services, 'book-001', 5)
+        response = self.post(client, [self.order(quantity=True)])
+
+        assert response.status_code == 207
+        assert response.get_json()['results'][0]['status'] == 400
+        assert services['inventory'].get_book_by_id('book-001').stock_quantity == 5
+
+    def test_delivery_failure_rolls_back(self, client, services, monkeypatch):
+        """Test orders of a batch whose deliveries cannot be saved are removed, and their stock restored"""
+        add_book(services, 'book-001', 5)
+
+        def fail(*args, **kwargs):
+            raise OSError("disk full")
+        monkeypatch.setattr(services['delivery'].repository, 'save', fail)
+        response = self.post(client, [self.order(quantity=2), self.order(quantity=1)])
+
+        assert response.status_code == 207
+        data = response.get_json()
+        assert data['completed'] == 0
+        assert [result['error'] for result in data['results']] == ['Order processing failed'] * 2
+        assert services['inventory'].get_book_by_id('book-001').stock_quantity == 5
+        assert services['sales'].get_all_orders() == []
+        assert services['delivery'].deliveries == {}
+        reloaded = SalesService(data_file=services['sales'].repository.data_file)
+        assert reloaded.get_all_orders() == []
+
+    def test_commit_failure_rolls_back(self, client, services, monkeypatch):
+        """Test orders and deliveries of a batch that cannot be committed are removed"""
+        add_book(services, 'book-001', 5)
+        failed = Future()
+        failed.set_exception(OSError("disk full"))
+        monkeypatch.setattr(services['delivery'], 'commit_future', lambda: failed)
+        response = self.post(client, [self.order(quantity=2)])
+
+        assert response.status_code == 207
+        assert response.get_json()['results'][0]['status'] == 400
+        assert services['inventory'].get_book_by_id('book-001').stock_quantity == 5
+        assert services['sales'].get_all_orders() == []
+        assert services['delivery'].get_all_deliveries() == []
+        assert SalesService(data_file=services['sales'].repository.data_file).get_all_orders() == []
+        assert DeliveryService(data_file=services['delivery'].repository.data_file).get_all_deliveries() == []
+
+
+class TestBulkStock:
+    """Test bulk stock adjustments from JSON and CSV"""
+
+    @pytest.fixture
+    def books(self, services):
+        """Add two books to adjust"""
+        return [add_book(services, 'book-001', 10, isbn='978-0-306-40615-7'),
+                add_book(services, 'book-002', 5)]
+
+    def post_json(self, client, adjustments, mode=None):
+        """Post adjustments as JSON"""
+        return client.post('/api/inventory/stock/bulk', query_string={'mode': mode} if mode else None,
+                           json={'adjustments': adjustments}, headers=API_KEY)
+
+    def post_csv(self, client, body):
+        """Post adjustments as CSV"""
+        return client.post('/api/inventory/stock/bulk', data=body, content_type='text/csv',
+                           headers=API_KEY)
+
+    def stock(self, services, book_id):
+        """Current stock of a book"""
+        return services['inventory'].get_book_by_id(book_id).stock_quantity
+
+    def test_json(self, client, services, books):
+        """Test JSON deltas and absolute counts are applied"""
+        response = self.post_json(client, [
+            {'book_id': 'book-001', 'delta': -3},
+            {'book_id': 'book-002', 'quantity': 42, 'expected_quantity': 5}
+        ])
+
+        assert response.status_code == 200
+        assert response.get_json() == {'mode': 'atomic', 'applied': 2, 'conflicts': []}
+        assert self.stock(services, 'book-001') == 7
+        assert self.stock(services, 'book-002') == 42
+
+    def test_csv(self, client, services, books):
+        """Test CSV rows are applied, empty cells counting as missing"""
+        response = self.post_csv(client, b'book_id,isbn,delta,quantity\r\n'
+                                         b'book-001,,4,\r\n'
+                                         b'book-002,,,0\r\n')
+
+        assert response.status_code == 200
+        assert response.get_json()['applied'] == 2
+        assert self.stock(services, 'book-001') == 14
+        assert self.stock(services, 'book-002') == 0
+
+    def test_isbn_resolved(self, client, services, books):
+        """Test a book is found by any way of writing its ISBN"""
+        response = self.post_csv(client, b'isbn,delta\n0-306-40615-2,1\n9780306406157,1\n')
+
+        assert response.status_code == 200
+        assert self.stock(services, 'book-001') == 12
+
+        unknown = self.post_json(client, [{'isbn': '978-1-111111-11-1', 'delta': 1}])
+        assert unknown.status_code == 409
+        assert unknown.get_json()['conflicts'] == [{
+            'row': 1, 'isbn': '978-1-111111-11-1', 'message': 'No book found with ISBN: 978-1-111111-11-1'
+        }]
+
+    @pytest.mark.parametrize('row, message', [
+        ({'book_id': 'book-001'}, 'Row 2: give either delta or quantity'),
+        ({'book_id': 'book-001', 'delta': 1, 'quantity': 1}, 'Row 2: give either delta or quantity'),
+        ({'book_id': 'book-001', 'delta': 1.5}, 'Row 2: delta must be an integer'),
+        ({'book_id': 'book-001', 'delta': True}, 'Row 2: delta must be an integer'),
+        ({'book_id': 'book-001', 'quantity': -1}, 'Row 2: quantities cannot be negative'),
+        ({'delta': 1}, 'Row 2: book_id or isbn is required'),
+        ('book-001', 'Row 2: must be an object'),
+    ])
+    def test_bad_json_row(self, client, services, books, row, message):
+        """Test an invalid row rejects the whole request, naming the row"""
+        response = self.post_json(client, [{'book_id': 'book-002', 'delta': 1}, row])
+
+        assert response.status_code == 400
+        assert response.get_json()['message'] == message
+        assert self.stock(services, 'book-002') == 5
+
+    def test_bad_csv_row(self, client, services, books):
+        """Test a CSV cell that is not an integer is rejected"""
+        response = self.post_csv(client, b'book_id,delta\nbook-001,1\nbook-002,many\n')
+
+        assert response.status_code == 400
+        assert response.get_json()['message'] == 'Row 2: delta must be an integer'
+        assert self.stock(services, 'book-001') == 10
+
+    def test_csv_not_utf8(self, client, services, books):
+        """Test a CSV body that is not UTF-8 gets a 400"""
+        response = self.post_csv(client, 'book_id,delta\nbook-001,1\nlivre-é,1\n'.encode('latin-1'))
+
+        assert response.status_code == 400
+        assert response.get_json()['message'] == 'CSV must be UTF-8 encoded'
+
+    def test_no_adjustments(self, client, books):
+        """Test a JSON body without an adjustments array gets a 400"""
+        response = client.post('/api/inventory/stock/bulk', json={'rows': []}, headers=API_KEY)
+        assert response.status_code == 400
+
+    def test_atomic_conflict_applies_nothing(self, client, services, books):
+        """Test insufficient stock rejects every adjustment with a 409"""
+        adjustments = [
+            {'book_id': 'book-001', 'delta': -2},
+            {'book_id': 'book-002', 'delta': -6},
+            {'book_id': 'book-002', 'quantity': 1, 'expected_quantity': 3}
+        ]
+        response = self.post_json(client, adjustments)
+
+        assert response.status_code == 409
+        data = response.get_json()
+        assert data['applied'] == 0
+        assert [(conflict['row'], conflict['book_id']) for conflict in data['conflicts']] == [
+            (2, 'book-002'), (3, 'book-002')
+        ]
+        assert 'below 0' in data['conflicts'][0]['message']
+        assert self.stock(services, 'book-001') == 10
+        assert self.stock(services, 'book-002') == 5
+
+        best_effort = self.post_json(client, adjustments, mode='best_effort')
+        assert best_effort.status_code == 200
+        assert best_effort.get_json()['applied'] == 1
+        assert self.stock(services, 'book-001') == 8
+
+
+class TestProjection:
+    """Test ?fields= and ?expand= on read endpoints"""
+
+    @pytest.fixture
+    def order(self, services):
+        """Create an order of one book, with its delivery"""
+        add_book(services, 'book-001', 10)
+        order = services['sales'].create_order("John Doe", "john@example.com", ORDER_ITEMS, "123 Main St")
+        services['delivery'].create_delivery(order.id, "123 Main St")
+        return order
+
+    def get_status(self, client, order_id, **args):
+        """Get the complete status of an order"""
+        return client.get(f'/api/orders/{order_id}/status', query_string=args, headers=API_KEY)
+
+    def test_status_expands_everything_by_default(self, client, order):
+        """Test the full status embeds the delivery and book details"""
+        data = self.get_status(client, order.id).get_json()
+
+        assert set(data) == {'order_id', 'order_status', 'payment_status', 'payment_id', 'customer',
+                             'items', 'total_amount', 'created_at', 'updated_at', 'delivery'}
+        assert data['items'][0]['book_details']['id'] == 'book-001'
+        assert data['delivery']['order_id'] == order.id
+        assert data['delivery']['tracking_number']
+
+    def test_status_fields(self, client, order):
+        """Test only the requested top-level fields are returned"""
+        response = self.get_status(client, order.id, fields='order_status, order_id')
+
+        assert response.status_code == 200
+        assert response.get_json() == {'order_status': 'pending', 'order_id': order.id}
+
+    def test_status_expand(self, client, order):
+        """Test unexpanded objects are left out or reduced to a reference"""
+        collapsed = self.get_status(client, order.id, expand='').get_json()
+        assert 'book_details' not in collapsed['items'][0]
+        assert collapsed['delivery'] == {'id': collapsed['delivery']['id']}
+
+        delivery_only = self.get_status(client, order.id, expand='delivery').get_json()
+        assert 'book_details' not in delivery_only['items'][0]
+        assert delivery_only['delivery']['status'] == 'preparing'
+
+    def test_projections_have_their_own_etags(self, client, order):
+        """Test the ETag of one projection does not answer a request for another"""
+        full = self.get_status(client, order.id)
+        partial = client.get(f'/api/orders/{order.id}/status?fields=order_id',
+                             headers={**API_KEY, 'If-None-Match': full.headers['ETag']})
+
+        assert partial.status_code == 200
+        assert partial.headers['ETag'] != full.headers['ETag']
+
+    @pytest.mark.parametrize('args, message', [
+        ({'fields': 'order_id,secret'}, 'Unknown fields: secret'),
+        ({'expand': 'customer'}, 'Cannot expand: customer'),
+    ])
+    def test_status_unknown_names(self, client, order, args, message):
+        """Test unknown fields or nested objects get a 400 listing the available ones"""
+        response = self.get_status(client, order.id, **args)
+
+        assert response.status_code == 400
+        assert response.get_json()['message'].startswith(message + '; available: ')
+
+    def test_status_of_unknown_order(self, client):
+        """Test the status of an unknown order is a 404"""
+        assert self.get_status(client, 'missing', fields='order_id').status_code == 404
+
+    @pytest.mark.parametrize('path', ['/api/sales/orders', '/api/inventory/books',
+                                      '/api/delivery/deliveries'])
+    def test_list_fields(self, client, order, path):
+        """Test list endpoints project every record, and reject unknown fields"""
+        records = next(value for key, value in client.get(path, query_string={'fields': 'id'},
+                                                           headers=API_KEY).get_json().items()
+                       if key != 'count')
+        assert records and all(record == {'id': record['id']} for record in records)
+
+        response = client.get(path, query_string={'fields': 'id,nope'}, headers=API_KEY)
+        assert response.status_code == 400
+        assert response.get_json()['message'].startswith('Unknown fields: nope')
+
+
+class TestExport:
+    """Test NDJSON exports of orders and deliveries"""
+
+    @pytest.fixture
+    def app_config(self, tmp_path):
+        """Archive completed records to a temporary directory"""
+        return {'TESTING': True, 'DATA_DIR': str(tmp_path / "data"), 'ARCHIVE_DIR': str(tmp_path / "archive")}
+
+    def export(self, client, path, **args):
+        """Get an export and parse its lines"""
+        response = client.get(path, query_string=args, headers=API_KEY)
+        assert response.is_streamed
+        body = response.get_data(as_text=True)
+        return response, [json.loads(line) for line in body.splitlines()]
+
+    def test_framing(self, client, services, monkeypatch):
+        """Test one record per line, written a chunk of lines at a time"""
+        monkeypatch.setattr('src.api.export.LINES_PER_CHUNK', 2)
+        orders = [services['sales'].create_order(f"Customer {i}", f"c{i}@example.com", ORDER_ITEMS)
+                  for i in range(5)]
+        response = client.get('/api/sales/orders/export', headers=API_KEY)
+
+        chunks = list(response.response)
+        assert [chunk.count(b'\n') for chunk in chunks] == [2, 2, 1]
+        lines = b''.join(chunks).decode('utf-8').split('\n')
+        assert lines[-1] == ''
+        assert {json.loads(line)['id'] for line in lines[:-1]} == {order.id for order in orders}
+
+    def test_content_type(self, client):
+        """Test the export is an NDJSON attachment, empty when there are no records"""
+        response = client.get('/api/sales/orders/export', headers=API_KEY)
+
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        assert response.headers['Content-Disposition'] == 'attachment; filename=orders.ndjson'
+        assert response.data == b''
+
+    def test_since(self, client, services):
+        """Test since keeps only records created or updated from that time on"""
+        old = services['sales'].create_order("Old", "old@example.com", ORDER_ITEMS)
+        since = datetime.now()
+        new = services['sales'].create_order("New", "new@example.com", ORDER_ITEMS)
+
+        _, records = self.export(client, '/api/sales/orders/export', since=since.isoformat())
+        assert [record['id'] for record in records] == [new.id]
+
+        services['sales'].update_order_status(old.id, 'processing')
+        _, records = self.export(client, '/api/sales/orders/export', since=since.isoformat())
+        assert {record['id'] for record in records} == {old.id, new.id}
+
+        _, records = self.export(client, '/api/sales/orders/export', since='2000-01-01')
+        assert len(records) == 2
+
+    def test_invalid_since(self, client):
+        """Test a since that is not a date or time gets a 400"""
+        response = client.get('/api/delivery/deliveries/export?since=yesterday', headers=API_KEY)
+        assert response.status_code == 400
+
+    def test_archived_records_included(self, client, services):
+        """Test archived orders and deliveries are exported once, with the working set"""
+        sales, delivery = services['sales'], services['delivery']
+        orders = [sales.create_order(f"Customer {i}", f"c{i}@example.com", ORDER_ITEMS) for i in range(3)]
+        deliveries = [delivery.create_delivery(order.id, "123 Main St") for order in orders]
+        sales.cancel_order(orders[0].id)
+        delivery.update_delivery_status(deliveries[0].id, 'delivered')
+        assert sales.archive_completed_orders() == 1
+        assert delivery.archive_completed_deliveries() == 1
+
+        _, records = self.export(client, '/api/sales/orders/export')
+        assert sorted(record['id'] for record in records) == sorted(order.id for order in orders)
+        assert next(record for record in records if record['id'] == orders[0].id)['status'] == 'cancelled'
+
+        response, records = self.export(client, '/api/delivery/deliveries/export')
+        assert response.headers['Content-Disposition'] == 'attachment; filename=deliveries.ndjson'
+        assert sorted(record['id'] for record in records) == sorted(d.id for d in deliveries)
+
+
+class TestCustomerOrders:
+    """Test cursor paging of a customer's order history"""
+
+    def test_paged_with_cursor(self, client, services):
+        """Test the next_cursor of each page leads to the following one, newest first by default"""
+        orders = [services['sales'].create_order("Jane Roe", "jane@example.com", ORDER_ITEMS)
+                  for _ in range(3)]
+        path = '/api/sales/customers/Jane@Example.com/orders'
+
+        first = client.get(path, query_string={'limit': 2}, headers=API_KEY).get_json()
+        assert [order['id'] for order in first['orders']] == [orders[2].id, orders[1].id]
+        second = client.get(path, query_string={'limit': 2, 'cursor': first['next_cursor']},
+                            headers=API_KEY).get_json()
+        assert [order['id'] for order in second['orders']] == [orders[0].id]
+        assert second['next_cursor'] is None
+        oldest = client.get(path, query_string={'order': 'asc'}, headers=API_KEY).get_json()
+        assert oldest['limit'] == 20
+        assert [order['id'] for order in oldest['orders']] == [order.id for order in orders]
+
+    @pytest.mark.parametrize('args', [{'limit': 0}, {'cursor': 'not-a-cursor'}, {'order': 'up'}])
+    def test_invalid_args(self, client, args):
+        """Test bad limits, cursors and sort orders get a 400"""
+        response = client.get('/api/sales/customers/jane@example.com/orders', query_string=args,
+                              headers=API_KEY)
+
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'Invalid request'
@@ -130,3 +130,134 @@ class TestDeliveryService:
         assert updated.status == "delivered"
         assert updated.actual_delivery_date is not None
 
+    
+    def test_journal_persistence(self, temp_data_file):
+        """Test that journaled delivery changes survive a restart"""
+        service1 = DeliveryService(data_file=temp_data_file, backend='journal')
+        delivery = service1.create_delivery(
+            order_id="order-008",
+            shipping_address="222 Spruce Ct"
+        )
+        service1.update_delivery_status(delivery.id, "in_transit")
+        
+        service2 = DeliveryService(data_file=temp_data_file, backend='journal')
+        retrieved = service2.get_delivery_by_order_id("order-008")
+        assert retrieved is not None
+        assert retrieved.status == "in_transit"
+    
+    def test_archived_delivery_found_by_order_id(self, tmp_path):
+        """Test that archived deliveries are still found by ID and order ID"""
+        service = DeliveryService(data_file=str(tmp_path / "deliveries.json"),
+                                  archive_dir=str(tmp_path / "archive"))
+        delivery = service.create_delivery(order_id="order-001", shipping_address="123 Test St")
+        service.update_delivery_status(delivery.id, 'delivered')
+        
+        assert service.archive_completed_deliveries() == 1
+        assert service.deliveries == {}
+        restarted = DeliveryService(data_file=str(tmp_path / "deliveries.json"),
+                                    archive_dir=str(tmp_path / "archive"))
+        assert restarted.get_delivery_by_id(delivery.id).status == 'delivered'
+        assert restarted.get_delivery_by_order_id("order-001").id == delivery.id
+    
+    def test_deliveries_by_status(self, delivery_service):
+        """Test that the status index follows status changes and counts each status"""
+        first = delivery_service.create_delivery(order_id="order-001", shipping_address="1 Test St")
+        second = delivery_service.create_delivery(order_id="order-002", shipping_address="2 Test St")
+        delivery_service.update_delivery_by_order_id("order-002", 'in_transit')
+        
+        assert [d.id for d in delivery_service.get_deliveries_by_status('preparing')] == [first.id]
+        assert [d.id for d in delivery_service.get_deliveries_by_status('in_transit')] == [second.id]
+        assert delivery_service.get_deliveries_by_status('failed') == []
+        assert delivery_service.get_status_counts() == {'preparing': 1, 'in_transit': 1}
+    
+    def test_deliveries_paged_with_cursor(self, delivery_service):
+        """Test that delivery pages come oldest first and end with a null cursor"""
+        deliveries = [delivery_service.create_delivery(order_id=f"order-{i}", shipping_address="1 Test St")
+                      for i in range(3)]
+        
+        page, cursor = delivery_service.get_deliveries_page(2)
+        assert [d.id for d in page] == [deliveries[0].id, deliveries[1].id]
+        page, cursor = delivery_service.get_deliveries_page(2, cursor)
+        assert [d.id for d in page] == [deliveries[2].id]
+        assert cursor is None
+        
+        delivery_service.update_delivery_by_order_id("order-0", 'in_transit')
+        delivery_service.update_delivery_by_order_id("order-2", 'in_transit')
+        page, cursor = delivery_service.get_deliveries_page(1, status='in_transit')
+        assert [d.id for d in page] == [deliveries[0].id]
+        page, cursor = delivery_service.get_deliveries_page(1, cursor, status='in_transit')
+        assert [d.id for d in page] == [deliveries[2].id]
+        assert cursor is None
+    
+    def test_one_delivery_per_order(self, delivery_service):
+        """Test that a second delivery for the same order is rejected"""
+        delivery_service.create_delivery(order_id="order-001", shipping_address="123 Test St")
+        
+        with pytest.raises(ValueError):
+            delivery_service.create_delivery(order_id="order-001", shipping_address="456 Other St")
+        assert len(delivery_service.get_all_deliveries()) == 1
+    
+    def test_order_index_sees_other_instances(self, temp_data_file):
+        """Test that the order index is rebuilt when another instance adds deliveries"""
+        service1 = DeliveryService(data_file=temp_data_file, backend='journal')
+        service2 = DeliveryService(data_file=temp_data_file, backend='journal')
+        delivery = service1.create_delivery(order_id="order-009", shipping_address="9 Elm St")
+        
+        assert service2.get_delivery_by_order_id("order-009").id == delivery.id
+        with pytest.raises(ValueError):
+            service2.create_delivery(order_id="order-009", shipping_address="9 Elm St")
+    
+    @pytest.mark.parametrize('backend', ['journal', 'sqlite', 'jsonl'])
+    def test_refresh_reindexes_only_changed_deliveries(self, tmp_path, backend, monkeypatch):
+        """Test that deliveries changed or removed elsewhere are re-indexed without a full rebuild"""
+        kwargs = {'data_file': str(tmp_path / "deliveries.json"), 'backend': backend,
+                  'archive_dir': str(tmp_path / "archive")}
+        writer = DeliveryService(**kwargs)
+        shipped, delivered, removed = [
+            writer.create_delivery(order_id=f"order-{i}", shipping_address="1 Main St") for i in range(3)
+        ]
+        reader = DeliveryService(**kwargs)
+        
+        def rebuild():
+            raise AssertionError("indexes rebuilt from scratch")
+        monkeypatch.setattr(reader, '_rebuild_indexes', rebuild)
+        writer.update_delivery_status(shipped.id, 'shipped')
+        writer.update_delivery_status(delivered.id, 'delivered')
+        writer.archive_completed_deliveries()
+        writer.remove_deliveries([removed.id])
+        
+        assert reader.get_status_counts() == {'shipped': 1, 'delivered': 1}
+        assert reader.get_delivery_by_order_id("order-1").id == delivered.id
+        assert reader.get_delivery_by_order_id("order-2") is None
+        reader.create_delivery(order_id="order-2", shipping_address="1 Main St")
+    
+    def test_sqlite_enforces_one_delivery_per_order(self, tmp_path):
+        """Test that the SQLite table rejects a second delivery for an order"""
+        data_file = str(tmp_path / "deliveries.json")
+        service = DeliveryService(data_file=data_file, backend='sqlite')
+        delivery = service.create_delivery(order_id="order-010", shipping_address="10 Oak St")
+        duplicate = Delivery.from_dict(dict(delivery.to_dict(), id="other-id"))
+        
+        service.deliveries[duplicate.id] = duplicate
+        with pytest.raises(ValueError):
+            service.repository.save(service.deliveries, [duplicate.id])
+    
+    def test_get_deliveries_by_order_ids(self, delivery_service):
+        """Test that deliveries are looked up for many orders at once"""
+        delivery_service.create_deliveries([
+            {'order_id': "order-001", 'shipping_address': "1 Main St"},
+            {'order_id': "order-002", 'shipping_address': "2 Main St", 'carrier': "Express"}
+        ])
+        
+        found = delivery_service.get_deliveries_by_order_ids(["order-002", "order-003"])
+        assert found["order-002"].carrier == "Express"
+        assert found["order-003"] is None
+    
+    def test_remove_deliveries(self, delivery_service, temp_data_file):
+        """Test that a removed delivery frees its order for a new one"""
+        delivery = delivery_service.create_delivery(order_id="order-001", shipping_address="1 Main St")
+        
+        assert delivery_service.remove_deliveries([delivery.id]) == 1
+        assert delivery_service.get_delivery_by_order_id("order-001") is None
+        assert DeliveryService(data_file=temp_data_file).get_all_deliveries() == []
+        delivery_service.create_delivery(order_id="order-001", shipping_address="1 Main St")
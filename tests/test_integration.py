@@ -163,3 +163,38 @@ class TestIntegration:
         # Stock is unchanged because this test does not reserve stock
         assert book_status.stock_quantity == 10
 
+    
+    def test_batch_order_flow(self, services, sample_books, temp_files):
+        """Test that a batch reserves stock in order and persists each system once"""
+        inventory = services['inventory']
+        sales = services['sales']
+        delivery = services['delivery']
+        
+        reserved = inventory.reserve_stock_batch([
+            [("book-002", 3), ("book-001", 1)],
+            [("book-002", 2), ("book-002", 1)],  # 3 more of book-002, only 2 left
+            [("book-002", 2)],
+            [("missing-book", 1)]
+        ])
+        assert reserved == [True, False, True, False]
+        assert inventory.get_book_by_id("book-002").stock_quantity == 0
+        assert inventory.get_book_by_id("book-001").stock_quantity == 9
+        
+        items = [{'book_id': 'book-002', 'title': 'Test Book 2', 'quantity': 1, 'unit_price': 24.99}]
+        orders = sales.create_orders([
+            {'customer_name': f"Customer {i}", 'customer_email': f"c{i}@example.com",
+             'items': items, 'shipping_address': "123 Test St"}
+            for i in range(2)
+        ], pay=True)
+        assert [order.payment_status for order in orders] == ["paid", "paid"]
+        deliveries = delivery.create_deliveries([
+            {'order_id': order.id, 'shipping_address': "123 Test St"} for order in orders
+        ])
+        
+        assert {order.id for order in sales.find_orders(status="processing")} == {order.id for order in orders}
+        reloaded = DeliveryService(data_file=temp_files['deliveries'])
+        assert reloaded.get_delivery_by_order_id(orders[1].id).id == deliveries[1].id
+        with pytest.raises(ValueError):
+            delivery.create_deliveries([{'order_id': "order-new", 'shipping_address': "1 St"},
+                                        {'order_id': orders[0].id, 'shipping_address': "1 St"}])
+        assert delivery.get_delivery_by_order_id("order-new") is None
@@ -123,3 +123,167 @@ class TestInventoryService:
         assert book is not None
         assert book.id == sample_book.id
 
+    
+    def test_journal_persistence(self, temp_data_file, sample_book):
+        """Test that journaled stock changes survive a restart"""
+        service1 = InventoryService(data_file=temp_data_file, backend='journal')
+        service1.add_book(sample_book)
+        service1.reserve_stock(sample_book.id, 30)
+        
+        service2 = InventoryService(data_file=temp_data_file, backend='journal')
+        book = service2.get_book_by_id(sample_book.id)
+        assert book is not None
+        assert book.stock_quantity == 70
+    
+    def test_get_book_by_isbn_normalized(self, inventory_service):
+        """Test that ISBN lookups ignore hyphens and match ISBN-10 to ISBN-13"""
+        book = Book(id="isbn-book", title="Title", author="Author", isbn="0-306-40615-2",
+                    price=10.0, stock_quantity=1)
+        inventory_service.add_book(book)
+        
+        for isbn in ("0306406152", "978-0-306-40615-7", "9780306406157", "0 306 40615 2"):
+            assert inventory_service.get_book_by_isbn(isbn) is book
+        assert inventory_service.get_book_by_isbn("978-1-111111-11-1") is None
+    
+    def test_isbn_index_follows_updates(self, temp_data_file, sample_book):
+        """Test that the ISBN index is kept up to date by update_book and on load"""
+        service = InventoryService(data_file=temp_data_file)
+        service.add_book(sample_book)
+        service.update_book(sample_book.id, isbn="978-0-306-40615-7")
+        
+        assert service.get_book_by_isbn("978-0-123456-78-9") is None
+        assert service.get_book_by_isbn("0306406152").id == sample_book.id
+        restarted = InventoryService(data_file=temp_data_file)
+        assert restarted.get_book_by_isbn("9780306406157").id == sample_book.id
+        assert restarted.get_books_by_isbns(["9780306406157", "123"]) == {
+            "9780306406157": restarted.get_book_by_id(sample_book.id), "123": None
+        }
+    
+    def test_search_books_ranked_with_prefixes(self, inventory_service):
+        """Test that search matches every word, prefixes included, and ranks title hits first"""
+        inventory_service.add_book(Book(id="b1", title="Python Programming", author="Ann Lee",
+                                        isbn="1", price=10.0, stock_quantity=1))
+        inventory_service.add_book(Book(id="b2", title="Cooking", author="Bob Ray", isbn="2",
+                                        price=10.0, stock_quantity=1,
+                                        description="Recipes written by a Python programmer"))
+        inventory_service.add_book(Book(id="b3", title="Gardening", author="Cy Doe", isbn="3",
+                                        price=10.0, stock_quantity=1, category="Hobbies"))
+        
+        assert [book.id for book in inventory_service.search_books("python")] == ["b1", "b2"]
+        assert [book.id for book in inventory_service.search_books("PYTH progr")] == ["b1", "b2"]
+        assert [book.id for book in inventory_service.search_books("hobb")] == ["b3"]
+        assert inventory_service.search_books("python gardening") == []
+        assert inventory_service.search_books("the") == []
+    
+    def test_search_index_follows_updates(self, temp_data_file, sample_book):
+        """Test that update_book re-indexes a book and the index is rebuilt on load"""
+        service = InventoryService(data_file=temp_data_file)
+        service.add_book(sample_book)
+        service.update_book(sample_book.id, title="Distributed Systems", description="Consensus")
+        
+        assert service.search_books("book") == []
+        assert [book.id for book in service.search_books("distrib")] == [sample_book.id]
+        restarted = InventoryService(data_file=temp_data_file)
+        assert [book.id for book in restarted.search_books("systems")] == [sample_book.id]
+    
+    def test_search_stops_early_on_common_words(self, inventory_service, monkeypatch):
+        """Test that the best matches of common words are found without scoring every book"""
+        monkeypatch.setattr("src.services.search.MAX_CANDIDATES", 10)
+        for i in range(50):
+            inventory_service.add_book(Book(id=f"d{i:02d}", title=f"Volume {i}", author="Someone",
+                                            isbn=str(i), price=10.0, stock_quantity=1,
+                                            description="A history of science"))
+        inventory_service.add_book(Book(id="top", title="Science History", author="Someone",
+                                        isbn="top", price=10.0, stock_quantity=1))
+        
+        assert [book.id for book in inventory_service.search_books("history", limit=1)] == ["top"]
+        assert [book.id for book in inventory_service.search_books("science hist", limit=1)] == ["top"]
+        assert len(inventory_service.search_books("science history", limit=50)) == 10
+    
+    def test_find_books_filters_and_sorts(self, inventory_service):
+        """Test category, price range and stock filters and sort orders"""
+        for book_id, category, price, stock in [("c1", "Fiction", 12.0, 3), ("c2", "fiction ", 8.0, 0),
+                                                ("c3", "History", 20.0, 1), ("c4", "Fiction", 30.0, 5)]:
+            inventory_service.add_book(Book(id=book_id, title=f"Title {book_id}", author="A",
+                                            isbn=book_id, price=price, stock_quantity=stock,
+                                            category=category))
+        
+        def ids(**filters):
+            return [book.id for book in inventory_service.find_books(**filters)]
+        
+        assert ids() == ["c1", "c2", "c3", "c4"]
+        assert ids(category="FICTION") == ["c2", "c1", "c4"]
+        assert ids(category="fiction", max_price=12.0, in_stock=True) == ["c1"]
+        assert ids(min_price=10, max_price=25) == ["c1", "c3"]
+        assert ids(in_stock=True, sort="-price") == ["c4", "c3", "c1"]
+        assert ids(sort="-title") == ["c4", "c3", "c2", "c1"]
+        with pytest.raises(ValueError):
+            inventory_service.find_books(sort="isbn")
+        
+        inventory_service.update_book("c4", price=5.0, category="History")
+        inventory_service.reserve_stock("c3", 1)
+        assert ids(category="history") == ["c4", "c3"]
+        assert ids(category="history", in_stock=True) == ["c4"]
+        assert ids(max_price=10.0) == ["c4", "c2"]
+    
+    def test_books_paged_by_price(self, inventory_service):
+        """Test that book pages follow the price index and survive books added between pages"""
+        for i, price in enumerate([5.0, 15.0, 10.0, 10.0, 20.0]):
+            inventory_service.add_book(Book(id=f"p{i}", title="T", author="A", isbn=f"p{i}",
+                                            price=price, stock_quantity=0 if i == 4 else 1))
+        
+        page, cursor = inventory_service.get_books_page(2)
+        assert [book.id for book in page] == ["p0", "p2"]
+        inventory_service.add_book(Book(id="p5", title="T", author="A", isbn="p5", price=1.0,
+                                        stock_quantity=1))
+        page, cursor = inventory_service.get_books_page(2, cursor, in_stock=True)
+        assert [book.id for book in page] == ["p3", "p1"]
+        assert cursor is None
+        inventory_service.update_stock("p0", -1)
+        page, _ = inventory_service.get_books_page(10, in_stock=True)
+        assert [book.id for book in page] == ["p5", "p2", "p3", "p1"]
+    
+    def test_to_dict_projection(self, sample_book):
+        """Test that to_dict returns only the requested fields, in the requested order"""
+        assert sample_book.to_dict(["id", "price", "stock_quantity"]) == {
+            "id": "test-book-001", "price": 19.99, "stock_quantity": 100
+        }
+        assert sample_book.to_dict() == Book.from_dict(sample_book.to_dict()).to_dict()
+    
+    def test_catalog_version_increases_on_save(self, temp_data_file, sample_book):
+        """Test that saving a book bumps the catalog version, which is not stored with the book"""
+        service = InventoryService(data_file=temp_data_file)
+        catalog_version = service.version
+        service.add_book(sample_book)
+        assert service.version > catalog_version
+        
+        catalog_version = service.version
+        service.update_stock(sample_book.id, -1)
+        assert service.version > catalog_version
+        
+        with open(temp_data_file) as f:
+            assert "version" not in json.dumps(json.load(f))
+    
+    def test_adjust_stock_bulk(self, temp_data_file, sample_book):
+        """Test that bulk adjustments report conflicts, are all-or-nothing when atomic, and persist"""
+        service = InventoryService(data_file=temp_data_file)
+        service.add_book(sample_book)
+        adjustments = [
+            {'book_id': sample_book.id, 'delta': -40},
+            {'book_id': sample_book.id, 'quantity': 10, 'expected_quantity': 60},
+            {'book_id': sample_book.id, 'delta': -20},  # Only 10 left by then
+            {'book_id': "missing-book", 'delta': 5}
+        ]
+        
+        conflicts = service.adjust_stock_bulk(adjustments)
+        assert [conflict is None for conflict in conflicts] == [True, True, False, False]
+        assert sample_book.stock_quantity == 100
+        
+        service.adjust_stock_bulk(adjustments, atomic=False)
+        assert sample_book.stock_quantity == 10
+        reloaded = InventoryService(data_file=temp_data_file)
+        assert reloaded.get_book_by_id(sample_book.id).stock_quantity == 10
+        
+        by_isbn = [{'isbn': "9780123456789", 'delta': 1}, {'isbn': "123", 'delta': 1}]
+        assert service.adjust_stock_bulk(by_isbn, atomic=False) == [None, "No book found with ISBN: 123"]
+        assert sample_book.stock_quantity == 11
@@ -1,6 +1,7 @@
 """Unit tests for Sales Service"""
 
 import pytest
+from datetime import datetime
 from pathlib import Path
 from src.services.sales_service import SalesService
 from src.models.order import Order
@@ -153,3 +154,379 @@ class TestSalesService:
         cancelled_order = sales_service.get_order_by_id(order.id)
         assert cancelled_order.payment_status == "refunded"
 
+
+
+@pytest.fixture
+def journaled_service(temp_data_file):
+    """Create a sales service that journals its changes"""
+    return SalesService(data_file=temp_data_file, backend='journal')
+
+
+class TestSalesJournal:
+    """Test cases for SalesService journal mode"""
+    
+    def test_mutations_append_to_journal(self, journaled_service, temp_data_file, sample_order_items):
+        """Test that each mutation appends one journal line and leaves the data file alone"""
+        order = journaled_service.create_order(
+            customer_name="Test User",
+            customer_email="test@example.com",
+            items=sample_order_items
+        )
+        journaled_service.process_payment(order.id)
+        journaled_service.update_order_status(order.id, "shipped")
+        
+        journal_lines = Path(journaled_service.repository.journal.path).read_text().splitlines()
+        assert len(journal_lines) == 3
+        assert Path(temp_data_file).read_text() == "[]"
+    
+    def test_journal_replayed_on_startup(self, journaled_service, temp_data_file, sample_order_items):
+        """Test that a new instance rebuilds orders by replaying the journal"""
+        order = journaled_service.create_order(
+            customer_name="Test User",
+            customer_email="test@example.com",
+            items=sample_order_items
+        )
+        journaled_service.process_payment(order.id)
+        journaled_service.cancel_order(order.id)
+        
+        restarted = SalesService(data_file=temp_data_file, backend='journal')
+        replayed = restarted.get_order_by_id(order.id)
+        assert replayed.status == "cancelled"
+        assert replayed.payment_status == "refunded"
+    
+    def test_reads_pick_up_other_instance_writes(self, journaled_service, temp_data_file, sample_order_items):
+        """Test that reads apply journal entries written by another instance"""
+        other = SalesService(data_file=temp_data_file, backend='journal')
+        order = other.create_order(
+            customer_name="Test User",
+            customer_email="test@example.com",
+            items=sample_order_items
+        )
+        
+        assert journaled_service.get_order_by_id(order.id) is not None
+    
+    def test_torn_journal_tail_ignored(self, journaled_service, temp_data_file, sample_order_items):
+        """Test that a partially written last entry is dropped on replay"""
+        order = journaled_service.create_order(
+            customer_name="Test User",
+            customer_email="test@example.com",
+            items=sample_order_items
+        )
+        with open(journaled_service.repository.journal.path, 'a') as f:
+            f.write('{"op": "put", "record": {"id": "torn"')
+        
+        restarted = SalesService(data_file=temp_data_file, backend='journal')
+        assert [o.id for o in restarted.get_all_orders()] == [order.id]
+        
+        restarted.update_order_status(order.id, "shipped")
+        again = SalesService(data_file=temp_data_file, backend='journal')
+        assert again.get_order_by_id(order.id).status == "shipped"
+
+
+class TestSalesReadCache:
+    """Test cases for skipping reloads of an unchanged data file"""
+    
+    def test_unchanged_file_not_reloaded(self, sales_service, sample_order_items):
+        """Test that reads after our own write are served without reloading"""
+        order = sales_service.create_order(
+            customer_name="Test User",
+            customer_email="test@example.com",
+            items=sample_order_items
+        )
+        cached = sales_service.orders[order.id]
+        
+        assert sales_service.get_order_by_id(order.id) is cached
+        sales_service.get_all_orders()
+        assert sales_service.get_cache_stats() == {'hits': 2, 'partial': 0, 'misses': 0}
+    
+    def test_external_write_triggers_reload(self, sales_service, temp_data_file, sample_order_items):
+        """Test that a write from another instance is picked up on the next read"""
+        other = SalesService(data_file=temp_data_file)
+        order = other.create_order(
+            customer_name="Test User",
+            customer_email="test@example.com",
+            items=sample_order_items
+        )
+        
+        assert sales_service.get_order_by_id(order.id) is not None
+        assert sales_service.get_cache_stats()['misses'] == 1
+    
+    def test_journal_reads_only_new_entries(self, temp_data_file, sample_order_items):
+        """Test that journal reads apply just the entries appended by others"""
+        reader = SalesService(data_file=temp_data_file, backend='journal')
+        writer = SalesService(data_file=temp_data_file, backend='journal')
+        reader.get_all_orders()
+        order = writer.create_order(
+            customer_name="Test User",
+            customer_email="test@example.com",
+            items=sample_order_items
+        )
+        
+        assert reader.get_order_by_id(order.id) is not None
+        assert reader.get_cache_stats() == {'hits': 1, 'partial': 1, 'misses': 0}
+
+
+class TestSalesArchive:
+    """Test cases for archiving delivered and cancelled orders"""
+    
+    def test_archive_moves_completed_orders(self, tmp_path, sample_order_items):
+        """Test that only delivered and cancelled orders leave the working set"""
+        service = SalesService(data_file=str(tmp_path / "orders.json"),
+                               archive_dir=str(tmp_path / "archive"))
+        orders = [service.create_order("Customer", "c@example.com", sample_order_items) for _ in range(3)]
+        service.update_order_status(orders[0].id, 'delivered')
+        service.cancel_order(orders[1].id)
+        
+        assert service.archive_completed_orders() == 2
+        assert set(service.orders) == {orders[2].id}
+        assert len(service.get_all_orders()) == 3
+        assert len(service.get_all_orders(include_archived=False)) == 1
+        assert service.get_order_by_id(orders[0].id).status == 'delivered'
+        assert list((tmp_path / "archive").glob("*.jsonl.gz"))
+    
+    def test_archived_orders_readable_after_restart(self, tmp_path, sample_order_items):
+        """Test that reads fall through to the archive of a new instance"""
+        kwargs = {'data_file': str(tmp_path / "orders.json"), 'archive_dir': str(tmp_path / "archive")}
+        service = SalesService(**kwargs)
+        order = service.create_order("Customer", "c@example.com", sample_order_items)
+        service.cancel_order(order.id)
+        service.archive_completed_orders()
+        
+        restarted = SalesService(**kwargs)
+        assert restarted.orders == {}
+        assert restarted.get_order_by_id(order.id).status == 'cancelled'
+    
+    def test_archive_batch_triggers_archiving(self, tmp_path, sample_order_items):
+        """Test that orders are archived once enough of them are completed"""
+        service = SalesService(data_file=str(tmp_path / "orders.json"),
+                               archive_dir=str(tmp_path / "archive"), archive_batch=2)
+        orders = [service.create_order("Customer", "c@example.com", sample_order_items) for _ in range(2)]
+        service.update_order_status(orders[0].id, 'delivered')
+        assert len(service.orders) == 2
+        
+        service.update_order_status(orders[1].id, 'delivered')
+        assert len(service.orders) == 0
+        assert len(service.archive) == 2
+    
+    def test_changing_archived_order_restores_it(self, tmp_path, sample_order_items):
+        """Test that an archived order that changes again moves back to the working set"""
+        service = SalesService(data_file=str(tmp_path / "orders.json"),
+                               archive_dir=str(tmp_path / "archive"))
+        order = service.create_order("Customer", "c@example.com", sample_order_items)
+        service.update_order_status(order.id, 'delivered')
+        service.archive_completed_orders()
+        
+        updated = service.update_order_status(order.id, 'processing')
+        assert updated.status == 'processing'
+        assert service.get_order_by_id(order.id).status == 'processing'
+        assert [o.status for o in service.get_all_orders()] == ['processing']
+
+
+class TestCustomerOrders:
+    """Test cases for the customer order-history index"""
+    
+    def test_orders_by_customer_paged_newest_first(self, sales_service, sample_order_items):
+        """Test that a customer's orders are matched case-insensitively and paged by creation time"""
+        orders = [sales_service.create_order("Alice", "Alice@Example.com ", sample_order_items)
+                  for _ in range(5)]
+        sales_service.create_order("Bob", "bob@example.com", sample_order_items)
+        
+        page, total = sales_service.get_orders_by_customer("alice@example.com", offset=1, limit=2)
+        assert total == 5
+        assert [o.id for o in page] == [orders[3].id, orders[2].id]
+        oldest, _ = sales_service.get_orders_by_customer("ALICE@example.com", limit=1, newest_first=False)
+        assert oldest[0].id == orders[0].id
+        assert sales_service.get_orders_by_customer("nobody@example.com") == ([], 0)
+    
+    def test_customer_orders_paged_with_cursor(self, sales_service, sample_order_items):
+        """Test that cursors walk through a customer's orders newest first, or oldest first"""
+        orders = [sales_service.create_order("Alice", "alice@example.com", sample_order_items)
+                  for _ in range(5)]
+        sales_service.create_order("Bob", "bob@example.com", sample_order_items)
+        
+        def walk(newest_first):
+            pages, cursor = [], None
+            while True:
+                page, cursor = sales_service.get_customer_orders_page("ALICE@example.com", 2, cursor,
+                                                                      newest_first=newest_first)
+                pages.append([o.id for o in page])
+                if cursor is None:
+                    return pages
+        
+        ids = [o.id for o in orders]
+        assert walk(True) == [ids[4:2:-1], ids[2:0:-1], ids[:1]]
+        assert walk(False) == [ids[:2], ids[2:4], ids[4:]]
+        assert sales_service.get_customer_orders_page("nobody@example.com", 2) == ([], None)
+    
+    def test_index_rebuilt_from_other_instances_and_archive(self, tmp_path, sample_order_items):
+        """Test that orders written elsewhere and archived orders stay in the history"""
+        kwargs = {'data_file': str(tmp_path / "orders.json"), 'backend': 'journal',
+                  'archive_dir': str(tmp_path / "archive")}
+        writer = SalesService(**kwargs)
+        reader = SalesService(**kwargs)
+        first = writer.create_order("Alice", "alice@example.com", sample_order_items)
+        writer.cancel_order(first.id)
+        writer.archive_completed_orders()
+        second = writer.create_order("Alice", "alice@example.com", sample_order_items)
+        
+        orders, total = reader.get_orders_by_customer("alice@example.com")
+        assert total == 2
+        assert [o.id for o in orders] == [second.id, first.id]
+        assert [o.id for o in SalesService(**kwargs).get_orders_by_customer("alice@example.com")[0]] == [
+            second.id, first.id
+        ]
+
+    
+    @pytest.mark.parametrize('backend', ['journal', 'sqlite', 'jsonl'])
+    def test_refresh_reindexes_only_changed_orders(self, tmp_path, sample_order_items, backend, monkeypatch):
+        """Test that changes from another instance update the indexes without a full rebuild"""
+        kwargs = {'data_file': str(tmp_path / "orders.json"), 'backend': backend,
+                  'archive_dir': str(tmp_path / "archive")}
+        writer = SalesService(**kwargs)
+        paid, cancelled, removed = [writer.create_order("Alice", "alice@example.com", sample_order_items)
+                                    for _ in range(3)]
+        reader = SalesService(**kwargs)
+        
+        def rebuild():
+            raise AssertionError("indexes rebuilt from scratch")
+        monkeypatch.setattr(reader, '_rebuild_indexes', rebuild)
+        writer.process_payment(paid.id)
+        writer.cancel_order(cancelled.id)
+        writer.archive_completed_orders()
+        writer.remove_orders([removed.id])
+        added = writer.create_order("Bob", "bob@example.com", sample_order_items)
+        
+        assert reader.get_status_counts() == {
+            'status': {'processing': 1, 'cancelled': 1, 'pending': 1},
+            'payment_status': {'paid': 1, 'pending': 2}
+        }
+        orders, total = reader.get_orders_by_customer("alice@example.com")
+        assert total == 2
+        assert {o.id for o in orders} == {paid.id, cancelled.id}
+        assert [o.id for o in reader.get_orders_by_customer("bob@example.com")[0]] == [added.id]
+        assert {o.id for o in reader.find_orders(created_from=datetime(2000, 1, 1))} == {
+            paid.id, cancelled.id, added.id
+        }
+
+
+class TestOrderStatusIndex:
+    """Test cases for the order status and payment status indexes"""
+    
+    def test_orders_move_between_status_buckets(self, sales_service, sample_order_items):
+        """Test that status changes made through the model move orders between buckets"""
+        orders = [sales_service.create_order("Customer", "c@example.com", sample_order_items)
+                  for _ in range(3)]
+        sales_service.process_payment(orders[0].id)
+        sales_service.cancel_order(orders[1].id)
+        
+        assert [o.id for o in sales_service.find_orders(status='pending')] == [orders[2].id]
+        assert [o.id for o in sales_service.find_orders(payment_status='paid')] == [orders[0].id]
+        assert sales_service.find_orders(status='processing', payment_status='pending') == []
+        assert sales_service.get_status_counts() == {
+            'status': {'processing': 1, 'cancelled': 1, 'pending': 1},
+            'payment_status': {'paid': 1, 'pending': 2}
+        }
+        assert len(sales_service.find_orders()) == 3
+    
+    def test_status_index_covers_archive_and_restarts(self, tmp_path, sample_order_items):
+        """Test that archived orders keep their status and changes to them are followed"""
+        kwargs = {'data_file': str(tmp_path / "orders.json"), 'archive_dir': str(tmp_path / "archive")}
+        service = SalesService(**kwargs)
+        order = service.create_order("Customer", "c@example.com", sample_order_items)
+        service.update_order_status(order.id, 'delivered')
+        service.archive_completed_orders()
+        
+        restarted = SalesService(**kwargs)
+        assert [o.id for o in restarted.find_orders(status='delivered')] == [order.id]
+        restarted.update_order_status(order.id, 'processing')
+        assert restarted.get_status_counts()['status'] == {'processing': 1}
+    
+    def test_orders_by_creation_time(self, sales_service, sample_order_items):
+        """Test that orders are found by creation time range, oldest first, and combine with status"""
+        orders = [sales_service.create_order("Customer", "c@example.com", sample_order_items)
+                  for _ in range(4)]
+        for order, day in zip(orders, ("2024-03-01T10:00:00", "2024-03-02T09:30:00",
+                                       "2024-03-02T18:00:00", "2024-03-05T08:00:00")):
+            order.created_at = day
+        sales_service._rebuild_indexes()
+        sales_service.cancel_order(orders[2].id)
+        
+        found = sales_service.find_orders(created_from=datetime(2024, 3, 2),
+                                          created_to=datetime(2024, 3, 4))
+        assert [o.id for o in found] == [orders[1].id, orders[2].id]
+        assert [o.id for o in sales_service.find_orders(created_to=datetime(2024, 3, 2, 9, 30))] == [
+            orders[0].id, orders[1].id
+        ]
+        assert [o.id for o in sales_service.find_orders(status='cancelled',
+                                                        created_from=datetime(2024, 3, 2))] == [orders[2].id]
+    
+    def test_orders_paged_with_cursor(self, sales_service, sample_order_items):
+        """Test that cursors walk through the orders oldest first, skipping filtered ones"""
+        orders = [sales_service.create_order("Customer", "c@example.com", sample_order_items)
+                  for _ in range(7)]
+        for i, order in enumerate(orders):
+            order.created_at = f"2024-03-0{i + 1}T12:00:00"
+        sales_service._rebuild_indexes()
+        sales_service.cancel_order(orders[1].id)
+        
+        pages, cursor = [], None
+        while True:
+            page, cursor = sales_service.get_orders_page(2, cursor, status='pending')
+            pages.append([o.id for o in page])
+            if cursor is None:
+                break
+        assert pages == [[orders[0].id, orders[2].id], [orders[3].id, orders[4].id],
+                         [orders[5].id, orders[6].id]]
+        with pytest.raises(ValueError):
+            sales_service.get_orders_page(2, "not-a-cursor")
+    
+    def test_status_pages_read_from_status_index(self, sales_service, sample_order_items, monkeypatch):
+        """Test that pages filtered by status follow the status buckets, not the whole time index"""
+        orders = [sales_service.create_order("Customer", "c@example.com", sample_order_items)
+                  for _ in range(5)]
+        for i, order in enumerate(orders):
+            order.created_at = f"2024-03-0{i + 1}T12:00:00"
+        sales_service._rebuild_indexes()
+        sales_service.cancel_order(orders[3].id)
+        sales_service.process_payment(orders[1].id)
+        
+        def scan(*args):
+            raise AssertionError("time index scanned")
+        monkeypatch.setattr(sales_service._time_index, 'entries', scan)
+        page, cursor = sales_service.get_orders_page(10, status='cancelled')
+        assert [o.id for o in page] == [orders[3].id]
+        page, cursor = sales_service.get_orders_page(2, status='pending', payment_status='pending',
+                                                     created_from=datetime(2024, 3, 2))
+        assert [o.id for o in page] == [orders[2].id, orders[4].id]
+        assert cursor is None
+    
+    def test_list_version_increases_on_save(self, sales_service, sample_order_items):
+        """Test that every change to an order bumps the order list version, which orders do not carry"""
+        order = sales_service.create_order("Customer", "c@example.com", sample_order_items)
+        
+        list_version = sales_service.version
+        sales_service.update_order_status(order.id, 'processing')
+        assert sales_service.version > list_version
+        assert "version" not in order.to_dict()
+    
+    def test_get_orders_by_ids(self, sales_service, sample_order_items):
+        """Test that a multi-get returns every order by ID, None for unknown IDs"""
+        orders = [sales_service.create_order("Customer", "c@example.com", sample_order_items)
+                  for _ in range(2)]
+        
+        found = sales_service.get_orders_by_ids([orders[1].id, "missing-order", orders[0].id])
+        assert list(found) == [orders[1].id, "missing-order", orders[0].id]
+        assert found[orders[0].id] is orders[0]
+        assert found["missing-order"] is None
+    
+    def test_remove_orders(self, sales_service, temp_data_file, sample_order_items):
+        """Test that removed orders leave the indexes and storage"""
+        orders = sales_service.create_orders([
+            {'customer_name': "Customer", 'customer_email': "c@example.com", 'items': sample_order_items}
+            for _ in range(2)
+        ], pay=True)
+        
+        assert sales_service.remove_orders([orders[0].id, "missing-order"]) == 1
+        assert sales_service.get_order_by_id(orders[0].id) is None
+        assert sales_service.find_orders(payment_status='paid') == [orders[1]]
+        assert [order.id for order in SalesService(data_file=temp_data_file).get_all_orders()] == [orders[1].id]
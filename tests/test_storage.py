@@ -0,0 +1,586 @@
+"""Unit tests for the storage helpers"""
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+import pytest
+from pathlib import Path
+from types import SimpleNamespace
+from src.models.book import Book
+from src.models.order import Order
+from src.services.inventory_service import InventoryService
+from src.services.sales_service import SalesService
+from src.services.delivery_service import DeliveryService
+from src.storage import convert
+from src.storage.binary_snapshot import is_snapshot, read_snapshot, write_snapshot
+from src.storage.journal import Journal
+from src.storage.sharding import shard_of
+
+
+@pytest.fixture
+def temp_data_file(tmp_path):
+    """Create a temporary data file for testing"""
+    return str(tmp_path / "test_orders.json")
+
+
+def create_orders(service, count):
+    """Create ``count`` single-item orders"""
+    return [
+        service.create_order(
+            customer_name=f"Customer {i}",
+            customer_email=f"customer{i}@example.com",
+            items=[{'book_id': 'book-001', 'title': 'Test Book', 'quantity': 1, 'unit_price': 10.0}]
+        )
+        for i in range(count)
+    ]
+
+
+class TestCompaction:
+    """Test cases for snapshot and log compaction"""
+    
+    def test_compaction_truncates_journal(self, temp_data_file):
+        """Test that reaching the threshold snapshots the records and truncates the log"""
+        service = SalesService(data_file=temp_data_file, backend='journal', compact_every=5)
+        orders = create_orders(service, 5)
+        service.repository.compactor.wait()
+        
+        with open(temp_data_file) as f:
+            snapshot = json.load(f)
+        assert {record['id'] for record in snapshot} == {order.id for order in orders}
+        assert not os.path.exists(service.repository.journal.path)
+        assert not os.path.exists(service.repository.compactor.compacting_file)
+    
+    def test_startup_loads_snapshot_and_tail(self, temp_data_file):
+        """Test that startup combines the snapshot with entries written after it"""
+        service = SalesService(data_file=temp_data_file, backend='journal', compact_every=5)
+        orders = create_orders(service, 5)
+        service.repository.compactor.wait()
+        service.process_payment(orders[0].id)
+        
+        journal_lines = Path(service.repository.journal.path).read_text().splitlines()
+        assert len(journal_lines) == 1
+        
+        restarted = SalesService(data_file=temp_data_file, backend='journal', compact_every=5)
+        assert len(restarted.get_all_orders()) == 5
+        assert restarted.get_order_by_id(orders[0].id).payment_status == "paid"
+    
+    def test_interrupted_compaction_recovered(self, temp_data_file):
+        """Test that a rotated log left by a crash is replayed and kept until compacted"""
+        service = SalesService(data_file=temp_data_file, backend='journal', compact_every=None)
+        first, second = create_orders(service, 2)
+        # Simulate a crash after rotation but before the snapshot was written
+        service.repository.journal.rotate(service.repository.compactor.compacting_file)
+        service.process_payment(first.id)
+        
+        restarted = SalesService(data_file=temp_data_file, backend='journal', compact_every=None)
+        assert len(restarted.get_all_orders()) == 2
+        assert restarted.get_order_by_id(first.id).payment_status == "paid"
+        
+        restarted.repository.compactor.compact(restarted.orders, Order.from_dict, wait=True)
+        assert not os.path.exists(restarted.repository.compactor.compacting_file)
+        again = SalesService(data_file=temp_data_file, backend='journal', compact_every=None)
+        assert {o.id for o in again.get_all_orders()} == {first.id, second.id}
+        assert again.get_order_by_id(first.id).payment_status == "paid"
+    
+    def test_other_instance_sees_compacted_state(self, temp_data_file):
+        """Test that an instance reloads from the snapshot after another one compacted"""
+        writer = SalesService(data_file=temp_data_file, backend='journal', compact_every=3)
+        reader = SalesService(data_file=temp_data_file, backend='journal', compact_every=3)
+        create_orders(writer, 2)
+        assert len(reader.get_all_orders()) == 2
+        
+        create_orders(writer, 2)
+        writer.repository.compactor.wait()
+        assert len(reader.get_all_orders()) == 4
+
+
+class TestJournal:
+    """Test cases for the journal file"""
+    
+    def test_rotate_appends_to_leftover_log(self, tmp_path):
+        """Test that rotating onto a leftover log keeps both sets of entries"""
+        journal = Journal(str(tmp_path / "test.journal"))
+        target = str(tmp_path / "test.journal.compacting")
+        journal.append({'id': 'a'})
+        journal.rotate(target)
+        with open(target, 'a') as f:
+            f.write('{"op": "put", "rec')
+        journal.append({'id': 'b'})
+        journal.rotate(target)
+        
+        ids = [entry['record']['id'] for entry in Journal(target).replay()]
+        assert ids == ['a', 'b']
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Path of a temporary SQLite database"""
+    return str(tmp_path / "test.db")
+
+
+class TestSqliteRepository:
+    """Test cases for the SQLite storage backend"""
+    
+    def test_wal_mode_and_indexes(self, temp_data_file, database):
+        """Test that the database uses WAL mode and indexes the filter columns"""
+        SalesService(data_file=temp_data_file, backend='sqlite', database=database)
+        DeliveryService(data_file=temp_data_file, backend='sqlite', database=database)
+        
+        conn = sqlite3.connect(database)
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {'idx_orders_status', 'idx_orders_customer_email',
+                'idx_deliveries_order_id', 'idx_deliveries_status'} <= indexes
+    
+    def test_update_touches_one_row(self, temp_data_file, database):
+        """Test that changing one order only rewrites its own row"""
+        service = SalesService(data_file=temp_data_file, backend='sqlite', database=database)
+        first, second = create_orders(service, 2)
+        service.update_order_status(first.id, "shipped")
+        
+        conn = sqlite3.connect(database)
+        revs = dict(conn.execute('SELECT id, rev FROM orders'))
+        assert revs[first.id] == 3
+        assert revs[second.id] == 2
+        assert conn.execute('SELECT status FROM orders WHERE id = ?', (first.id,)).fetchone()[0] == "shipped"
+    
+    def test_persistence_and_refresh(self, temp_data_file, database):
+        """Test that records survive a restart and show up in other instances"""
+        writer = SalesService(data_file=temp_data_file, backend='sqlite', database=database)
+        reader = SalesService(data_file=temp_data_file, backend='sqlite', database=database)
+        order = create_orders(writer, 1)[0]
+        writer.process_payment(order.id)
+        
+        assert reader.get_order_by_id(order.id).payment_status == "paid"
+        restarted = SalesService(data_file=temp_data_file, backend='sqlite', database=database)
+        assert restarted.get_order_by_id(order.id).payment_status == "paid"
+    
+    def test_refresh_sees_delete_paired_with_insert(self, temp_data_file, database):
+        """Test that a deleted row is dropped even when an insert keeps the row count unchanged"""
+        writer = SalesService(data_file=temp_data_file, backend='sqlite', database=database)
+        removed, kept = create_orders(writer, 2)
+        reader = SalesService(data_file=temp_data_file, backend='sqlite', database=database)
+        writer.remove_orders([removed.id])
+        
+        class Connection:
+            """Reader connection, with another insert landing right after the new rows are read"""
+            def __init__(self, conn):
+                self.conn = conn
+                self.added = []
+            
+            def execute(self, sql, *args):
+                cursor = self.conn.execute(sql, *args)
+                if not sql.startswith('SELECT rev') or self.added:
+                    return cursor
+                rows = cursor.fetchall()
+                self.added = create_orders(writer, 1)
+                return SimpleNamespace(fetchall=lambda: rows)
+        
+        connection = Connection(reader.repository._conn)
+        reader.repository._conn = connection
+        assert {order.id for order in reader.get_all_orders()} == {kept.id}
+        assert reader.get_order_by_id(removed.id) is None
+        # The insert is picked up by the next refresh
+        added = connection.added[0]
+        assert {order.id for order in reader.get_all_orders()} == {kept.id, added.id}
+        assert {order.id for order in reader.find_orders(status='pending')} == {kept.id, added.id}
+    
+    def test_seeded_from_json_file(self, tmp_path, database):
+        """Test that an empty table is filled from the JSON data file"""
+        books_file = tmp_path / "books.json"
+        books_file.write_text(json.dumps([{
+            'id': 'book-001', 'title': 'Seed', 'author': 'Author', 'isbn': '123',
+            'price': 9.99, 'stock_quantity': 3
+        }]))
+        service = InventoryService(data_file=str(books_file), backend='sqlite', database=database)
+        assert service.get_book_by_id('book-001').title == 'Seed'
+        
+        service.reserve_stock('book-001', 1)
+        restarted = InventoryService(data_file=str(books_file), backend='sqlite', database=database)
+        assert restarted.get_book_by_id('book-001').stock_quantity == 2
+    
+    def test_unknown_backend(self, temp_data_file):
+        """Test that an unknown backend name is rejected"""
+        with pytest.raises(ValueError):
+            SalesService(data_file=temp_data_file, backend='csv')
+
+
+class TestGroupCommit:
+    """Test cases for batching saves into group commits"""
+    
+    def test_saves_coalesced_into_one_write(self, tmp_path):
+        """Test that concurrent stock updates are written in a single flush"""
+        books_file = tmp_path / "books.json"
+        service = InventoryService(data_file=str(books_file), group_commit=True, commit_interval=0.5)
+        writes = []
+        inner_save = service.repository.inner.save
+        service.repository.inner.save = lambda records, changed: writes.append(changed) or inner_save(records, changed)
+        service.add_book(Book(id='book-001', title='T', author='A', isbn='1', price=1.0, stock_quantity=50))
+        for _ in range(10):
+            service.reserve_stock('book-001', 1)
+        service.flush()
+        
+        assert writes == [{'book-001'}]
+        assert json.loads(books_file.read_text())[0]['stock_quantity'] == 40
+    
+    def test_commit_future_resolves_after_flush(self, temp_data_file):
+        """Test that the durability future completes once the group is written"""
+        service = SalesService(data_file=temp_data_file, group_commit=True, commit_interval=0.01)
+        order = create_orders(service, 1)[0]
+        future = service.commit_future()
+        future.result(timeout=5)
+        
+        restarted = SalesService(data_file=temp_data_file)
+        assert restarted.get_order_by_id(order.id) is not None
+        assert service.commit_future().done()
+    
+    def test_batch_size_triggers_flush(self, temp_data_file):
+        """Test that reaching the batch size flushes without waiting for the interval"""
+        service = SalesService(data_file=temp_data_file, group_commit=True,
+                               commit_interval=60, commit_batch=3)
+        create_orders(service, 3)
+        service.commit_future().result(timeout=5)
+        
+        assert len(SalesService(data_file=temp_data_file).get_all_orders()) == 3
+    
+    def test_refresh_keeps_unflushed_changes(self, temp_data_file):
+        """Test that reads do not drop changes still waiting to be flushed"""
+        service = SalesService(data_file=temp_data_file, group_commit=True, commit_interval=60)
+        other = SalesService(data_file=temp_data_file)
+        mine = create_orders(service, 1)[0]
+        theirs = create_orders(other, 1)[0]
+        
+        assert service.get_order_by_id(mine.id) is not None
+        assert service.get_order_by_id(theirs.id) is not None
+        service.flush()
+        assert len(SalesService(data_file=temp_data_file).get_all_orders()) == 2
+    
+    def test_failed_group_retried(self, temp_data_file, monkeypatch, caplog):
+        """Test that a group whose write fails is queued again, not dropped"""
+        monkeypatch.setattr('src.storage.group_commit.RETRY_DELAY', 0.01)
+        service = SalesService(data_file=temp_data_file, group_commit=True, commit_interval=0.01)
+        inner_save = service.repository.inner.save
+        failures = []
+        
+        def save(records, changed):
+            if not failures:
+                failures.append(changed)
+                raise OSError("disk full")
+            inner_save(records, changed)
+        service.repository.inner.save = save
+        order = create_orders(service, 1)[0]
+        future = service.commit_future()
+        
+        with pytest.raises(OSError):
+            future.result(timeout=5)
+        service.flush()
+        assert failures == [{order.id}]
+        assert SalesService(data_file=temp_data_file).get_order_by_id(order.id) is not None
+        assert 'retrying' in caplog.text
+    
+    def test_concurrent_reservations_do_not_oversell(self, tmp_path):
+        """Test that concurrent reservations never take stock below zero"""
+        service = InventoryService(data_file=str(tmp_path / "books.json"), group_commit=True)
+        service.add_book(Book(id='book-001', title='T', author='A', isbn='1', price=1.0, stock_quantity=100))
+        results = []
+        
+        def reserve():
+            for _ in range(30):
+                results.append(service.reserve_stock('book-001', 1))
+        
+        threads = [threading.Thread(target=reserve) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        service.flush()
+        
+        assert results.count(True) == 100
+        assert service.get_book_by_id('book-001').stock_quantity == 0
+
+
+class TestDurability:
+    """Test cases for the durability levels"""
+    
+    @pytest.mark.parametrize('level', ['none', 'os-buffered', 'fsync-per-commit', 'fsync-per-group'])
+    def test_levels_persist(self, temp_data_file, level):
+        """Test that every durability level writes data that survives a restart"""
+        for backend in ('json', 'journal'):
+            service = SalesService(data_file=temp_data_file, backend=backend, durability=level)
+            order = create_orders(service, 1)[0]
+            service.repository.close()
+            
+            restarted = SalesService(data_file=temp_data_file, backend=backend)
+            assert restarted.get_order_by_id(order.id) is not None
+    
+    def test_atomic_rename_leaves_no_temp_files(self, tmp_path):
+        """Test that os-buffered writes replace the file without leaving temp files"""
+        data_file = tmp_path / "orders.json"
+        service = SalesService(data_file=str(data_file), durability='os-buffered')
+        inode = os.stat(data_file).st_ino
+        create_orders(service, 1)
+        
+        assert os.stat(data_file).st_ino != inode
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["orders.json"]
+    
+    def test_fsync_per_commit_syncs_each_record(self, temp_data_file, monkeypatch):
+        """Test that fsync-per-commit fsyncs every journal entry and fsync-per-group once per save"""
+        calls = []
+        real_fsync = os.fsync
+        monkeypatch.setattr(os, 'fsync', lambda fd: calls.append(fd) or real_fsync(fd))
+        
+        for level, expected in (('fsync-per-commit', 3), ('fsync-per-group', 1)):
+            service = SalesService(data_file=temp_data_file, backend='journal',
+                                   durability=level, compact_every=None)
+            create_orders(service, 3)
+            calls.clear()
+            service._save_data()
+            assert len(calls) == expected
+    
+    def test_unknown_level(self, temp_data_file):
+        """Test that an unknown durability level is rejected"""
+        with pytest.raises(ValueError):
+            SalesService(data_file=temp_data_file, durability='sometimes')
+
+
+class TestBinarySnapshot:
+    """Test cases for the binary snapshot format"""
+    
+    def test_round_trip(self, tmp_path):
+        """Test that records survive a round trip, including nested items and None values"""
+        path = str(tmp_path / "orders.snap")
+        records = [
+            {'id': 'o1', 'status': 'pending', 'total': 10.5, 'count': 2, 'note': None,
+             'items': [{'book_id': 'b1', 'quantity': 2}], 'extra': {'a': 1}},
+            {'id': 'o2', 'status': 'pending', 'total': 3.0, 'count': 1, 'note': 'gift',
+             'items': [], 'extra': None},
+            {'id': 'o3', 'status': 'shipped', 'total': 0.0, 'count': 0, 'note': None,
+             'items': [{'book_id': 'b2', 'quantity': 1}, {'book_id': 'b1', 'quantity': 3}]}
+        ]
+        write_snapshot(path, records)
+        
+        assert is_snapshot(path)
+        loaded = list(read_snapshot(path))
+        assert loaded[:2] == records[:2]
+        assert loaded[2] == dict(records[2], extra=None)
+    
+    def test_service_boots_from_binary_snapshot(self, tmp_path):
+        """Test that compaction writes a binary snapshot that later instances load"""
+        data_file = tmp_path / "orders.json"
+        service = SalesService(data_file=str(data_file), backend='journal',
+                               compact_every=None, snapshot_format='binary')
+        orders = create_orders(service, 5)
+        service.repository.compactor.compact(service.orders, Order.from_dict, wait=True)
+        
+        snapshot = tmp_path / "orders.snap"
+        assert is_snapshot(str(snapshot))
+        assert json.loads(data_file.read_text()) == []
+        restarted = SalesService(data_file=str(data_file), backend='journal',
+                                 snapshot_format='binary')
+        assert restarted.get_order_by_id(orders[0].id).to_dict() == orders[0].to_dict()
+        assert len(restarted.get_all_orders()) == 5
+    
+    def test_seeded_from_json_until_first_compaction(self, tmp_path):
+        """Test that the JSON data file is loaded while no binary snapshot exists"""
+        data_file = str(tmp_path / "orders.json")
+        orders = create_orders(SalesService(data_file=data_file), 3)
+        
+        service = SalesService(data_file=data_file, backend='journal', snapshot_format='binary')
+        assert {order.id for order in service.get_all_orders()} == {order.id for order in orders}
+    
+    def test_convert_cli(self, tmp_path):
+        """Test converting a data file to a binary snapshot and back"""
+        data_file = tmp_path / "orders.json"
+        create_orders(SalesService(data_file=str(data_file)), 3)
+        snapshot = tmp_path / "orders.snap"
+        restored = tmp_path / "restored.json"
+        
+        assert convert.main(['to-binary', str(data_file), str(snapshot)]) == 0
+        assert convert.main(['to-json', str(snapshot), str(restored)]) == 0
+        assert json.loads(restored.read_text()) == json.loads(data_file.read_text())
+        assert convert.main(['to-json', str(data_file), str(restored)]) == 1
+    
+    def test_unknown_format(self, temp_data_file):
+        """Test that an unknown snapshot format is rejected"""
+        with pytest.raises(ValueError):
+            SalesService(data_file=temp_data_file, backend='journal', snapshot_format='xml')
+
+
+class TestJsonlRepository:
+    """Test cases for the JSON-lines backend with an offset index"""
+    
+    def test_persistence_and_lookup(self, tmp_path):
+        """Test that orders are appended, indexed and read back one at a time"""
+        data_file = str(tmp_path / "orders.json")
+        service = SalesService(data_file=data_file, backend='jsonl')
+        orders = create_orders(service, 3)
+        service.update_order_status(orders[1].id, 'processing')
+        
+        restarted = SalesService(data_file=data_file, backend='jsonl')
+        assert len(restarted.orders) == 3
+        assert restarted.get_order_by_id(orders[1].id).status == 'processing'
+        assert restarted.get_order_by_id("missing") is None
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["orders.jsonl", "orders.jsonl.idx"]
+    
+    def test_cache_is_bounded(self, tmp_path):
+        """Test that only the most recently used records stay in memory"""
+        service = SalesService(data_file=str(tmp_path / "orders.json"), backend='jsonl', cache_size=2)
+        create_orders(service, 5)
+        
+        restarted = SalesService(data_file=str(tmp_path / "orders.json"), backend='jsonl', cache_size=2)
+        assert len(restarted.get_all_orders()) == 5
+        assert len(restarted.orders._cache) == 2
+    
+    def test_index_rebuilt_from_data_file(self, tmp_path):
+        """Test that a missing or lagging index is recovered from the data file"""
+        data_file = str(tmp_path / "orders.json")
+        service = SalesService(data_file=data_file, backend='jsonl')
+        orders = create_orders(service, 3)
+        index_file = tmp_path / "orders.jsonl.idx"
+        lines = index_file.read_text().splitlines()
+        index_file.write_text('\n'.join(lines[:2]) + '\n')
+        
+        restarted = SalesService(data_file=data_file, backend='jsonl')
+        assert {order.id for order in restarted.get_all_orders()} == {order.id for order in orders}
+        index_file.unlink()
+        assert len(SalesService(data_file=data_file, backend='jsonl').orders) == 3
+    
+    def test_torn_tail_is_ignored(self, tmp_path):
+        """Test that a partial line left by a crash is dropped before the next append"""
+        data_file = str(tmp_path / "orders.json")
+        create_orders(SalesService(data_file=data_file, backend='jsonl'), 2)
+        with open(tmp_path / "orders.jsonl", 'a') as f:
+            f.write('{"id": "torn", "status"')
+        
+        restarted = SalesService(data_file=data_file, backend='jsonl')
+        assert len(restarted.orders) == 2
+        create_orders(restarted, 1)
+        assert len(SalesService(data_file=data_file, backend='jsonl').orders) == 3
+    
+    def test_compaction_drops_superseded_lines(self, tmp_path):
+        """Test that the file is rewritten once superseded lines outnumber live ones"""
+        data_file = str(tmp_path / "orders.json")
+        service = SalesService(data_file=data_file, backend='jsonl', compact_min=5)
+        orders = create_orders(service, 5)
+        for order in orders:
+            service.update_order_status(order.id, 'processing')
+        
+        assert service.repository._lines == 5
+        with open(tmp_path / "orders.jsonl") as f:
+            assert len(f.readlines()) == 6
+        restarted = SalesService(data_file=data_file, backend='jsonl')
+        assert {order.status for order in restarted.get_all_orders()} == {'processing'}
+    
+    def test_other_instance_changes_are_picked_up(self, tmp_path):
+        """Test that refresh indexes appended lines and drops stale cached records"""
+        data_file = str(tmp_path / "orders.json")
+        writer = SalesService(data_file=data_file, backend='jsonl', compact_min=1)
+        reader = SalesService(data_file=data_file, backend='jsonl')
+        order = create_orders(writer, 1)[0]
+        assert reader.get_order_by_id(order.id).status == 'pending'
+        
+        writer.update_order_status(order.id, 'processing')
+        writer.update_order_status(order.id, 'shipped')  # Compacts the file
+        assert reader.get_order_by_id(order.id).status == 'shipped'
+    
+    def test_group_commit_keeps_evicted_changes(self, tmp_path):
+        """Test that changes queued for a group commit survive cache eviction"""
+        data_file = str(tmp_path / "orders.json")
+        orders = create_orders(SalesService(data_file=data_file, backend='jsonl'), 5)
+        
+        service = SalesService(data_file=data_file, backend='jsonl', cache_size=1,
+                               group_commit=True, commit_interval=1)
+        for order in orders:
+            service.update_order_status(order.id, 'processing')
+        service.flush()
+        
+        restarted = SalesService(data_file=data_file, backend='jsonl')
+        assert {order.status for order in restarted.get_all_orders()} == {'processing'}
+
+
+class TestSharding:
+    """Test cases for hash-sharded storage"""
+    
+    def test_save_rewrites_only_one_shard(self, tmp_path):
+        """Test that a change rewrites the shard holding it and no other"""
+        data_file = str(tmp_path / "orders.json")
+        service = SalesService(data_file=data_file, shards=4)
+        orders = create_orders(service, 20)
+        shard_files = {shard: tmp_path / f"orders.{shard}-of-4.json" for shard in range(4)}
+        before = {shard: os.stat(path).st_ino for shard, path in shard_files.items()}
+        
+        service.update_order_status(orders[0].id, 'processing')
+        changed = {shard for shard, path in shard_files.items() if os.stat(path).st_ino != before[shard]}
+        assert changed == {shard_of(orders[0].id, 4)}
+        assert sum(len(json.loads(path.read_text())) for path in shard_files.values()) == 20
+    
+    def test_persistence_across_instances(self, tmp_path):
+        """Test that sharded orders are loaded and refreshed by other instances"""
+        data_file = str(tmp_path / "orders.json")
+        writer = SalesService(data_file=data_file, backend='journal', shards=3)
+        reader = SalesService(data_file=data_file, backend='journal', shards=3)
+        orders = create_orders(writer, 10)
+        
+        assert len(reader.get_all_orders()) == 10
+        writer.update_order_status(orders[5].id, 'shipped')
+        assert reader.get_order_by_id(orders[5].id).status == 'shipped'
+    
+    def test_existing_data_file_is_split(self, tmp_path):
+        """Test that an unsharded data file seeds the shards"""
+        data_file = str(tmp_path / "orders.json")
+        orders = create_orders(SalesService(data_file=data_file), 10)
+        
+        service = SalesService(data_file=data_file, shards=2)
+        assert {order.id for order in service.get_all_orders()} == {order.id for order in orders}
+        assert all(order.id in service.orders.shards[shard_of(order.id, 2)] for order in orders)
+    
+    def test_concurrent_writes_to_different_shards(self, tmp_path):
+        """Test that concurrent writers do not lose each other's orders"""
+        data_file = str(tmp_path / "orders.json")
+        service = SalesService(data_file=data_file, shards=4)
+        threads = [threading.Thread(target=create_orders, args=(service, 10)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert len(SalesService(data_file=data_file, shards=4).get_all_orders()) == 40
+        assert not any(shard.dirty for shard in service.repository.shards)
+    
+    def test_sqlite_not_supported(self, temp_data_file):
+        """Test that sharding is rejected for the SQLite backend"""
+        with pytest.raises(ValueError):
+            SalesService(data_file=temp_data_file, backend='sqlite', shards=2)
+
+
+class TestExport:
+    """Test cases for exporting records straight from storage"""
+
+    @pytest.mark.parametrize('backend', ['json', 'sqlite', 'jsonl'])
+    def test_export_matches_latest_records(self, tmp_path, backend, monkeypatch):
+        """Test that every backend exports the latest version of each record, in chunks"""
+        monkeypatch.setattr('src.storage.repository.EXPORT_CHUNK', 3)
+        monkeypatch.setattr('src.storage.sqlite_repository.EXPORT_CHUNK', 3)
+        monkeypatch.setattr('src.storage.jsonl_repository.EXPORT_CHUNK', 3)
+        service = SalesService(data_file=str(tmp_path / "orders.json"), backend=backend)
+        orders = create_orders(service, 7)
+        service.update_order_status(orders[2].id, 'shipped')
+
+        exported = {record['id']: record for record in service.repository.export(service.orders)}
+        assert exported == {order.id: order.to_dict() for order in orders}
+        assert all(isinstance(record, dict) for record in exported.values())
+
+    def test_export_with_archive_and_since(self, tmp_path):
+        """Test that exports include archived orders once and filter by last change"""
+        service = SalesService(data_file=str(tmp_path / "orders.json"),
+                               archive_dir=str(tmp_path / "archive"))
+        orders = create_orders(service, 3)
+        orders[0].created_at = "2024-01-01T00:00:00"
+        service.cancel_order(orders[1].id)
+        service.archive_completed_orders()
+
+        assert sorted(record['id'] for record in service.export_orders()) == sorted(o.id for o in orders)
+        since = datetime.fromisoformat(orders[2].created_at)
+        assert {record['id'] for record in service.export_orders(since)} == {orders[1].id, orders[2].id}